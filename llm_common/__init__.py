@@ -0,0 +1,13 @@
+"""
+my-rag-service와 trip-talk가 함께 쓰는 LLM 호출 인프라
+
+- rate_limiter: OpenAI(RPM/TPM)·Tavily(RPM) 공용 토큰 버킷과 LimitedChatOpenAI
+- model_registry: 노드별 모델 티어/캐스케이드 (티어 구성은 각 앱의 model_registry.py)
+- hedging: 짧은 분류성 호출의 요청 헤징
+- cassette: LLM/검색 호출 기록·재생
+- profiling: 요청별 샘플링 CPU 프로파일 + tracemalloc 할당 스냅샷
+- lazy_init: 스레드 안전한 지연 초기화(Lazy)
+- tokens: tiktoken 토큰 수 계산 (인코더는 첫 호출 때 로드)
+
+각 앱은 common_path를 먼저 import해 저장소 루트를 sys.path에 추가한 뒤 `from llm_common.xxx import ...`로 사용합니다.
+"""
@@ -0,0 +1,239 @@
+"""
+LLM/검색 호출 기록(record)·재생(replay) 카세트
+
+run 하나에서 일어난 모든 LLM 호출(LimitedChatOpenAI)과 검색 호출(taped)의 요청/응답/소요 시간/usage를
+gzip JSONL 파일 하나(카세트)에 기록하고, 재생 모드에서는 네트워크 없이 기록된 응답을 원래 지연 시간(또는 0)으로 돌려줍니다.
+카세트를 켜고 끄는 곳(use_cassette)과 확인/재생 CLI는 각 앱에 있습니다. (my-rag-service: main.py, cassette.py)
+
+재생 매칭: 같은 요청(모델/메시지/바인딩된 도구의 해시)의 기록을 기록 순서대로 먼저 쓰고, 없으면(프롬프트가 바뀐 경우)
+같은 종류·같은 노드의 다음 기록을 씁니다 (strict / CASSETTE_STRICT=1이면 실패). 남는 것도 없으면 CassetteMiss.
+"""
+import os
+import json
+import gzip
+import time
+import asyncio
+import threading
+import contextvars
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+CASSETTE_VERSION = 1
+CASSETTE_RECORD = os.getenv("CASSETTE_RECORD", "0") == "1"
+CASSETTE_REPLAY = os.getenv("CASSETTE_REPLAY") # 재생할 카세트 경로 (설정하면 모든 run을 재생)
+CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", "1.0")) # 1.0: 원래 지연 시간, 0: 지연 없음
+CASSETTE_STRICT = os.getenv("CASSETTE_STRICT", "0") == "1"
+
+_cassette: contextvars.ContextVar[Optional["Cassette"]] = contextvars.ContextVar("cassette", default=None)
+
+
+class CassetteMiss(Exception):
+    """재생 중 기록에 없는 호출 (재생 모드에서는 실제 API를 호출하지 않음)"""
+
+
+class ReplayedError(Exception):
+    """기록 당시 실패했던 호출을 재생할 때 발생시키는 예외"""
+
+
+def _json_default(value):
+    if hasattr(value, "model_dump") and not isinstance(value, type): # 구조화 출력의 parsed(pydantic) 등
+        return value.model_dump(mode="json")
+    return repr(value) # 바인딩된 스키마 클래스 등
+
+
+def node_path(metadata: Optional[Dict[str, Any]]) -> str:
+    """LangGraph 메타데이터에서 'code_subgraph/execute' 형태의 노드 경로 (그래프 밖이면 '-')"""
+    metadata = metadata or {}
+    namespace = metadata.get("langgraph_checkpoint_ns")
+    if namespace:
+        return "/".join(part.split(":")[0] for part in namespace.split("|"))
+    return metadata.get("langgraph_node") or "-"
+
+
+def _current_node() -> str:
+    from langchain_core.runnables.config import ensure_config
+    return node_path(ensure_config().get("metadata"))
+
+
+class Cassette:
+    """
+    mode='record': call()/acall()이 실제 함수를 실행하고 결과를 기록
+    mode='replay': 실제 함수를 실행하지 않고 기록된 응답을 (지연 시간 * latency_scale) 뒤에 반환
+    """
+
+    def __init__(self, mode: str, entries: Optional[List[Dict[str, Any]]] = None, meta: Optional[Dict[str, Any]] = None,
+                 latency_scale: float = CASSETTE_LATENCY_SCALE, strict: bool = CASSETTE_STRICT):
+        self.mode = mode
+        self.meta = dict(meta or {})
+        self.entries: List[Dict[str, Any]] = list(entries or [])
+        self.latency_scale = latency_scale
+        self.strict = strict
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._by_key: Dict[str, deque] = defaultdict(deque)
+        self._by_slot: Dict[tuple, deque] = defaultdict(deque)
+        self._used = set()
+        self.served = Counter() # 'exact' / 'fallback' / 'missed'
+        for index, entry in enumerate(self.entries):
+            self._by_key[entry["key"]].append(index)
+            self._by_slot[(entry["kind"], entry["node"])].append(index)
+
+    # --- 저장/불러오기 ---
+    def save(self, path: str) -> str:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        header = {"version": CASSETTE_VERSION, "recorded_at": datetime.now(timezone.utc).isoformat(), **self.meta}
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(header, ensure_ascii=False, default=_json_default) + "\n")
+            for entry in sorted(self.entries, key=lambda e: e["start"]):
+                f.write(json.dumps(entry, ensure_ascii=False, default=_json_default) + "\n")
+        return path
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "Cassette":
+        meta, entries = _read(path)
+        return cls("replay", entries=entries, meta=meta, **kwargs)
+
+    # --- 기록 ---
+    def _record(self, kind, name, node, key, request, started, response=None, usage=None, error=None):
+        entry = {
+            "kind": kind, "name": name, "node": node, "key": key,
+            "start": round(started - self._started, 4), # run 시작 기준 (재생 순서/모양 확인용)
+            "seconds": round(time.perf_counter() - started, 4),
+            "request": request, "response": response, "usage": usage, "error": error,
+        }
+        with self._lock:
+            self.entries.append(entry)
+
+    # --- 재생 ---
+    def _take(self, kind: str, node: str, key: str) -> Dict[str, Any]:
+        with self._lock:
+            for queue, how in ((self._by_key.get(key), "exact"), (None if self.strict else self._by_slot.get((kind, node)), "fallback")):
+                while queue:
+                    index = queue.popleft()
+                    if index not in self._used:
+                        self._used.add(index)
+                        self.served[how] += 1
+                        return self.entries[index]
+            self.served["missed"] += 1
+        raise CassetteMiss(f"No recorded {kind} call for node '{node}' (key {key[:12]})")
+
+    def _replay(self, entry, decode):
+        if entry.get("error"):
+            raise ReplayedError(entry["error"])
+        return decode(entry["response"]) if decode else entry["response"]
+
+    def call(self, kind: str, name: str, key: str, request: Any, fn: Callable[[], Any], node: Optional[str] = None,
+             encode: Optional[Callable] = None, decode: Optional[Callable] = None, usage: Optional[Callable] = None):
+        node = node or _current_node()
+        if self.mode == "replay":
+            entry = self._take(kind, node, key)
+            if self.latency_scale > 0:
+                time.sleep(entry["seconds"] * self.latency_scale)
+            return self._replay(entry, decode)
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            self._record(kind, name, node, key, request, started, error=f"{type(e).__name__}: {e}")
+            raise
+        self._record(kind, name, node, key, request, started, encode(result) if encode else result,
+                     usage(result) if usage else None)
+        return result
+
+    async def acall(self, kind: str, name: str, key: str, request: Any, fn: Callable[[], Any], node: Optional[str] = None,
+                    encode: Optional[Callable] = None, decode: Optional[Callable] = None, usage: Optional[Callable] = None):
+        node = node or _current_node()
+        if self.mode == "replay":
+            entry = self._take(kind, node, key)
+            if self.latency_scale > 0:
+                await asyncio.sleep(entry["seconds"] * self.latency_scale)
+            return self._replay(entry, decode)
+        started = time.perf_counter()
+        try:
+            result = await fn()
+        except Exception as e:
+            self._record(kind, name, node, key, request, started, error=f"{type(e).__name__}: {e}")
+            raise
+        self._record(kind, name, node, key, request, started, encode(result) if encode else result,
+                     usage(result) if usage else None)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            if self.mode == "record":
+                return {"mode": "record", "calls": dict(Counter(e["kind"] for e in self.entries))}
+            unused = Counter(self.entries[i]["kind"] for i in range(len(self.entries)) if i not in self._used)
+            return {
+                "mode": "replay",
+                "recorded": dict(Counter(e["kind"] for e in self.entries)),
+                "exact": self.served["exact"],       # 요청이 그대로인 호출
+                "fallback": self.served["fallback"], # 요청(프롬프트)이 바뀌었지만 같은 노드의 기록으로 대체
+                "missed": self.served["missed"],     # 기록에 없는 새 호출
+                "unused": dict(unused),              # 기록됐지만 이번에는 하지 않은 호출
+            }
+
+
+@lru_cache(maxsize=8)
+def _read(path: str):
+    """(header, entries) - 서버 재생 모드에서 run마다 다시 파싱하지 않도록 캐시"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or lines[0].get("version") != CASSETTE_VERSION:
+        raise ValueError(f"Not a cassette file (version {CASSETTE_VERSION}): {path}")
+    return lines[0], lines[1:]
+
+
+def current_cassette() -> Optional[Cassette]:
+    return _cassette.get()
+
+
+@contextmanager
+def use_cassette(cassette: Optional[Cassette]):
+    """이 블록(및 여기서 시작한 태스크/스레드) 안의 LLM·검색 호출을 cassette로 기록/재생합니다."""
+    token = _cassette.set(cassette)
+    try:
+        yield cassette
+    finally:
+        _cassette.reset(token)
+
+
+def taped(kind: str, name: str, request: Any, fn: Callable[[], Any]):
+    """JSON으로 그대로 저장되는 검색 호출용: 카세트가 없으면 fn()을 그대로 호출"""
+    cassette = _cassette.get()
+    if cassette is None:
+        return fn()
+    key = f"{kind}:{name}:{json.dumps(request, ensure_ascii=False, sort_keys=True, default=_json_default)}"
+    return cassette.call(kind, name, key, request, fn)
+
+
+# --- LLM 호출 직렬화 (LimitedChatOpenAI에서 사용) ---
+def encode_chat_request(messages, stop, kwargs) -> Dict[str, Any]:
+    from langchain_core.messages import message_to_dict
+    return {"messages": [message_to_dict(m) for m in messages], "stop": stop, "kwargs": kwargs}
+
+
+def encode_chat_result(result) -> Dict[str, Any]:
+    from langchain_core.messages import message_to_dict
+    return {
+        "generations": [
+            {"message": message_to_dict(g.message), "generation_info": g.generation_info} for g in result.generations
+        ],
+        "llm_output": result.llm_output,
+    }
+
+
+def decode_chat_result(data: Dict[str, Any]):
+    from langchain_core.messages import messages_from_dict
+    from langchain_core.outputs import ChatGeneration, ChatResult
+    generations = [
+        ChatGeneration(message=messages_from_dict([g["message"]])[0], generation_info=g.get("generation_info"))
+        for g in data["generations"]
+    ]
+    return ChatResult(generations=generations, llm_output=data.get("llm_output"))
+
+
+def chat_usage(result) -> Optional[Dict[str, Any]]:
+    return (result.llm_output or {}).get("token_usage")
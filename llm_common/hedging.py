@@ -0,0 +1,153 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Dict
+
+# --- 요청 헤징(Hedging) 설정 ---
+# 짧고 멱등적인 분류성 호출만 대상: 관측된 p90 안에 응답이 없으면 같은 요청을 한 번 더 보내고 먼저 온 응답을 사용합니다.
+# 중복 요청도 LimitedChatOpenAI를 거치므로 공용 RPM/TPM 한도를 그대로 따릅니다.
+LLM_HEDGING = os.getenv("LLM_HEDGING", "0") == "1"
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.9"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))        # 이만큼 관측되기 전에는 초기 지연값 사용
+HEDGE_INITIAL_DELAY = float(os.getenv("HEDGE_INITIAL_DELAY", "3.0"))
+HEDGE_WINDOW = 500
+
+_pool = ThreadPoolExecutor(max_workers=int(os.getenv("HEDGE_WORKERS", "16")))
+
+
+def _quantile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+class HedgeStats:
+    """
+    호출 이름별 지표.
+    - effective: 실제로 사용한 응답까지의 시간 (헤징 적용 후)
+    - primary: 첫 요청만 기다렸다면 걸렸을 시간 (첫 요청이 취소되면 취소 시점까지의 시간 = 하한)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.effective = defaultdict(lambda: deque(maxlen=HEDGE_WINDOW))
+        self.primary = defaultdict(lambda: deque(maxlen=HEDGE_WINDOW))
+        self.calls = defaultdict(int)
+        self.fired = defaultdict(int)
+        self.hedge_wins = defaultdict(int)
+
+    def delay(self, name: str) -> float:
+        with self._lock:
+            samples = list(self.effective[name])
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_INITIAL_DELAY
+        return _quantile(samples, HEDGE_QUANTILE)
+
+    def record(self, name: str, effective: float, fired: bool = False, hedge_won: bool = False):
+        with self._lock:
+            self.calls[name] += 1
+            self.effective[name].append(effective)
+            self.fired[name] += fired
+            self.hedge_wins[name] += hedge_won
+
+    def record_primary(self, name: str, seconds: float):
+        with self._lock:
+            self.primary[name].append(seconds)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            names = list(self.calls)
+            snapshot = {n: (self.calls[n], self.fired[n], self.hedge_wins[n], list(self.effective[n]), list(self.primary[n])) for n in names}
+        result = {}
+        for name, (calls, fired, wins, effective, primary) in snapshot.items():
+            p99_primary, p99_effective = _quantile(primary, 0.99), _quantile(effective, 0.99)
+            result[name] = {
+                "calls": calls,
+                "hedge_rate": round(fired / calls, 4) if calls else 0.0,
+                "hedge_wins": wins,
+                "p99_without_hedge": round(p99_primary, 3),
+                "p99_with_hedge": round(p99_effective, 3),
+                "p99_improvement": round(p99_primary - p99_effective, 3),
+            }
+        return result
+
+
+hedge_stats = HedgeStats()
+
+
+def hedge_report() -> Dict[str, Any]:
+    return hedge_stats.report()
+
+
+def hedged(name: str, fn, *args, **kwargs):
+    """
+    fn(*args)를 실행하고, 관측된 p90 안에 끝나지 않으면 같은 호출을 한 번 더 보내 먼저 끝난 결과를 반환합니다.
+    LLM_HEDGING=0이면 그대로 호출하고 소요 시간만 기록합니다.
+    """
+    started = time.perf_counter()
+    if not LLM_HEDGING:
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        hedge_stats.record(name, elapsed)
+        hedge_stats.record_primary(name, elapsed)
+        return result
+
+    primary = _pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    # 첫 요청이 끝나는 시점 = 헤징이 없었을 때의 소요 시간 (헤지가 이겨도 끝까지 기다려 기록)
+    primary.add_done_callback(lambda _f: hedge_stats.record_primary(name, time.perf_counter() - started))
+    done, _ = wait([primary], timeout=hedge_stats.delay(name))
+    if done:
+        hedge_stats.record(name, time.perf_counter() - started)
+        return primary.result()
+
+    backup = _pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    done, _ = wait([primary, backup], return_when=FIRST_COMPLETED)
+    # 둘 다 실패한 경우에만 예외를 전파 (먼저 끝난 쪽이 실패하면 나머지를 기다림)
+    winner = next(iter(done))
+    if winner.exception() is not None:
+        other = backup if winner is primary else primary
+        wait([other])
+        if other.exception() is None:
+            winner = other
+    loser = backup if winner is primary else primary
+    loser.cancel()  # 아직 시작 전이면 취소, 진행 중인 스레드 호출은 결과만 버림
+    hedge_stats.record(name, time.perf_counter() - started, True, winner is backup)
+    return winner.result()
+
+
+async def ahedged(name: str, fn, *args, **kwargs):
+    """hedged의 비동기 버전. fn은 코루틴 함수(예: chain.ainvoke)이며, 진 쪽 요청은 실제로 취소됩니다."""
+    started = time.perf_counter()
+    if not LLM_HEDGING:
+        result = await fn(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        hedge_stats.record(name, elapsed)
+        hedge_stats.record_primary(name, elapsed)
+        return result
+
+    primary = asyncio.ensure_future(fn(*args, **kwargs))
+    done, _ = await asyncio.wait([primary], timeout=hedge_stats.delay(name))
+    if done:
+        elapsed = time.perf_counter() - started
+        hedge_stats.record(name, elapsed)
+        hedge_stats.record_primary(name, elapsed)
+        return primary.result()
+
+    backup = asyncio.ensure_future(fn(*args, **kwargs))
+    pending = {primary, backup}
+    winner = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        winner = next(iter(done))
+        if winner.exception() is None:
+            break
+    for task in pending:
+        task.cancel()  # 진 쪽 HTTP 요청을 실제로 취소
+    elapsed = time.perf_counter() - started
+    hedge_stats.record(name, elapsed, True, winner is backup)
+    # 첫 요청이 취소되었다면 elapsed는 헤징이 없었을 때 소요 시간의 하한
+    hedge_stats.record_primary(name, elapsed)
+    return winner.result()
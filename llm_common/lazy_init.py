@@ -0,0 +1,39 @@
+import threading
+from typing import Callable, Generic, TypeVar
+
+T = TypeVar("T")
+_UNSET = object()
+
+
+class Lazy(Generic[T]):
+    """
+    factory()를 처음 필요할 때 한 번만 실행하고 결과를 보관합니다. (double-checked locking, 스레드 안전)
+    네트워크 클라이언트 생성이나 그래프 컴파일을 모듈 import 시점이 아니라 첫 사용 시점으로 미룰 때 사용합니다.
+    """
+
+    def __init__(self, factory: Callable[[], T], name: str = ""):
+        self._factory = factory
+        self.name = name or getattr(factory, "__qualname__", "lazy")
+        self._value = _UNSET
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        value = self._value
+        if value is _UNSET:
+            with self._lock:
+                value = self._value
+                if value is _UNSET:
+                    value = self._value = self._factory()
+        return value
+
+    @property
+    def initialized(self) -> bool:
+        return self._value is not _UNSET
+
+    def reset(self):
+        """다음 get()에서 다시 생성하도록 보관 중인 값을 버립니다."""
+        with self._lock:
+            self._value = _UNSET
+
+    def __repr__(self) -> str:
+        return f"Lazy({self.name}, initialized={self.initialized})"
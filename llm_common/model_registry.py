@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import threading
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from llm_common.rate_limiter import LimitedChatOpenAI, model_token_usage
+
+# --- 모델 티어 설정 ---
+# 티어별 모델(tiers)과 노드별 캐스케이드(node_tiers)는 앱마다 정하고(각 앱의 model_registry.py),
+# MODEL_TIERS / NODE_TIERS 환경 변수(JSON)로 덮어씁니다. 캐스케이드가 없는 노드는 DEFAULT_MODEL_TIER 하나만 사용합니다.
+DEFAULT_MODEL_TIER = os.getenv("DEFAULT_MODEL_TIER", "standard")
+MODEL_STATS_WINDOW = 500
+
+
+def load_json_env(name: str, default: Dict[str, Any]) -> Dict[str, Any]:
+    raw = os.getenv(name)
+    if not raw:
+        return dict(default)
+    try:
+        return {**default, **json.loads(raw)}
+    except (json.JSONDecodeError, TypeError) as e:
+        print(f"⚠️ {name} 파싱 실패, 기본값 사용: {e}")
+        return dict(default)
+
+
+class ModelRegistry:
+    """
+    노드별 모델 티어와 캐스케이드를 관리합니다.
+    - model(tier): 티어의 LimitedChatOpenAI (파라미터 조합별로 한 번만 생성)
+    - invoke(node, call, accept): 노드의 티어 순서대로 call(model)을 실행하고,
+      예외가 나거나 accept(결과)가 False면 다음 티어로 올라갑니다. (마지막 티어 결과는 그대로 사용)
+    """
+
+    def __init__(self, tiers: Dict[str, str], node_tiers: Optional[Dict[str, Any]] = None,
+                 default_tier: str = DEFAULT_MODEL_TIER, no_escalate: Tuple[type, ...] = ()):
+        self.tiers = tiers
+        self.node_tiers = node_tiers or {}
+        self.default_tier = default_tier
+        self.no_escalate = no_escalate  # 이 예외들은 다음 티어로 넘기지 않고 바로 전파 (예: 취소)
+        self._models: Dict[tuple, LimitedChatOpenAI] = {}
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(lambda: deque(maxlen=MODEL_STATS_WINDOW))
+        self._calls = defaultdict(int)
+        self._escalations = defaultdict(int)
+        self._node_calls = defaultdict(int)
+        self._node_escalations = defaultdict(int)
+
+    def model(self, tier: str, **params) -> LimitedChatOpenAI:
+        key = (tier, tuple(sorted(params.items())))
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = LimitedChatOpenAI(model=self.tiers[tier], **{"temperature": 0, **params})
+            return self._models[key]
+
+    def tiers_for(self, node: str) -> List[str]:
+        tiers = self.node_tiers.get(node, [self.default_tier])
+        if isinstance(tiers, str):
+            tiers = [tiers]
+        return [t for t in tiers if t in self.tiers] or [self.default_tier]
+
+    def for_node(self, node: str, **params) -> LimitedChatOpenAI:
+        """캐스케이드 없이 쓸 때: 노드의 첫 티어 모델"""
+        return self.model(self.tiers_for(node)[0], **params)
+
+    def _record(self, node: str, tier: str, seconds: float, escalated: bool):
+        with self._lock:
+            self._calls[tier] += 1
+            self._latencies[tier].append(seconds)
+            self._escalations[tier] += escalated
+            self._node_calls[node] += 1
+            self._node_escalations[node] += escalated
+
+    def invoke(self, node: str, call: Callable[[Any], Any], accept: Optional[Callable[[Any], bool]] = None, **params):
+        tiers = self.tiers_for(node)
+        for i, tier in enumerate(tiers):
+            last = i == len(tiers) - 1
+            started = time.perf_counter()
+            try:
+                result = call(self.model(tier, **params))
+            except self.no_escalate:
+                self._record(node, tier, time.perf_counter() - started, False)
+                raise
+            except Exception as e:
+                self._record(node, tier, time.perf_counter() - started, not last)
+                if last:
+                    raise
+                print(f"      ㄴ [{node}] {tier} 티어 호출 실패, 상위 티어로 재시도: {e}")
+                continue
+            rejected = not last and accept is not None and not accept(result)
+            self._record(node, tier, time.perf_counter() - started, rejected)
+            if not rejected:
+                return result
+            print(f"      ㄴ [{node}] {tier} 티어 출력 검증 실패, 상위 티어로 재시도")
+
+    async def ainvoke(self, node: str, call: Callable[[Any], Any], accept: Optional[Callable[[Any], bool]] = None, **params):
+        """invoke의 비동기 버전. call(model)은 코루틴을 반환해야 합니다. (예: lambda m: (prompt | m).ainvoke(...))"""
+        tiers = self.tiers_for(node)
+        for i, tier in enumerate(tiers):
+            last = i == len(tiers) - 1
+            started = time.perf_counter()
+            try:
+                result = await call(self.model(tier, **params))
+            except self.no_escalate:
+                self._record(node, tier, time.perf_counter() - started, False)
+                raise
+            except Exception as e:
+                self._record(node, tier, time.perf_counter() - started, not last)
+                if last:
+                    raise
+                print(f"      ㄴ [{node}] {tier} 티어 호출 실패, 상위 티어로 재시도: {e}")
+                continue
+            rejected = not last and accept is not None and not accept(result)
+            self._record(node, tier, time.perf_counter() - started, rejected)
+            if not rejected:
+                return result
+            print(f"      ㄴ [{node}] {tier} 티어 출력 검증 실패, 상위 티어로 재시도")
+
+    def report(self) -> Dict[str, Any]:
+        """티어별 호출 수/지연 시간/토큰/상위 티어로 넘어간 비율, 노드별 에스컬레이션 비율"""
+        with self._lock:
+            calls, escalations = dict(self._calls), dict(self._escalations)
+            latencies = {tier: sorted(values) for tier, values in self._latencies.items()}
+            node_calls, node_escalations = dict(self._node_calls), dict(self._node_escalations)
+        usage = model_token_usage()
+        result = {"tiers": {}, "nodes": {}}
+        for tier, model_name in self.tiers.items():
+            values = latencies.get(tier, [])
+            count = calls.get(tier, 0)
+            result["tiers"][tier] = {
+                "model": model_name,
+                "calls": count,
+                "mean_latency": round(sum(values) / len(values), 3) if values else 0.0,
+                "p95_latency": round(values[min(len(values) - 1, int(0.95 * len(values)))], 3) if values else 0.0,
+                "tokens": usage.get(model_name, 0),
+                "escalation_rate": round(escalations.get(tier, 0) / count, 4) if count else 0.0,
+            }
+        for node, count in node_calls.items():
+            result["nodes"][node] = {
+                "tiers": self.tiers_for(node),
+                "calls": count,
+                "escalations": node_escalations.get(node, 0),
+            }
+        return result
@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+# --- 요청별 프로파일링 설정 ---
+# 요청에서 켰을 때만 RunProfiler를 만들기 때문에 꺼져 있으면 오버헤드가 없습니다.
+# 샘플링 프로파일러는 프로세스의 모든 스레드(이벤트 루프 + 노드/검색 스레드 풀) 중 CPU를 쓰고 있던 스레드의 스택만 모으므로,
+# 같은 워커에서 동시에 실행 중인 다른 run의 샘플도 함께 잡힐 수 있습니다.
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "30"))
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "10"))
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0 # tracemalloc을 켠 RunProfiler 수 (마지막 사용자가 끝날 때 끔)
+_sampler_threads = set() # 샘플링 스레드 자신은 프로파일에서 제외
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _thread_cpu(ident: int) -> Optional[float]:
+    """스레드별 CPU 시간 (pthread CPU 시계). 지원하지 않는 플랫폼이면 None"""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError):
+        return None
+
+
+class RunProfiler:
+    """
+    run 하나를 감싸는 프로파일러: 샘플링 CPU 프로파일 + tracemalloc 할당 스냅샷.
+
+    profiler = RunProfiler().start()
+    ... 그래프 실행 ...
+    summary = profiler.dump("runs/<run_id>/profile")
+
+    dump()는 디렉터리에 세 파일을 남깁니다.
+    - profile.json: 함수별 self/total CPU 시간, 할당 상위 라인, 요약
+    - stacks.collapsed: 접힌 스택, 값은 CPU µs (flamegraph.pl, speedscope.app에서 열기)
+    - allocations.txt: 시작 시점 대비 늘어난 할당 상위 N개 (traceback 포함)
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, top_n: int = PROFILE_TOP_N,
+                 frames: int = PROFILE_TRACEMALLOC_FRAMES):
+        self.interval = interval
+        self.top_n = top_n
+        self.frames = frames
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._baseline = None
+        self._allocations = None
+        self._started_tracemalloc = False
+        self._wall = 0.0
+        self._cpu = 0.0
+        self._peak = None
+
+    def start(self) -> "RunProfiler":
+        global _tracemalloc_users
+        with _tracemalloc_lock:
+            # 다른 RunProfiler가 켠 tracemalloc이면 함께 쓰고, 그 밖의 이유(STATE_MEMORY_PROFILE 등)로 켜져 있으면 끄지 않음
+            if _tracemalloc_users or not tracemalloc.is_tracing():
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(self.frames)
+                _tracemalloc_users += 1
+                self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._baseline = tracemalloc.take_snapshot()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._thread = threading.Thread(target=self._sample_loop, name="run-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        _sampler_threads.add(me)
+        try:
+            last_cpu: Dict[int, float] = {}
+            while not self._stop.wait(self.interval):
+                for ident, frame in sys._current_frames().items():
+                    if ident in _sampler_threads:
+                        continue
+                    # 샘플 가중치 = 지난 샘플 이후 이 스레드가 쓴 CPU 시간(µs).
+                    # 대기 중(락, 소켓, 큐, select)인 스레드는 CPU가 늘지 않으므로 idle로만 셈
+                    cpu = _thread_cpu(ident)
+                    if cpu is None:
+                        weight = int(self.interval * 1e6) # CPU 시계가 없으면 벽시계 샘플
+                    else:
+                        previous = last_cpu.get(ident, cpu)
+                        last_cpu[ident] = cpu
+                        weight = int((cpu - previous) * 1e6)
+                    if weight <= 0:
+                        self.idle_samples += 1
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame))
+                        frame = frame.f_back
+                    self.stacks[";".join(reversed(stack))] += weight
+                    self.samples += 1
+        finally:
+            _sampler_threads.discard(me)
+
+    def stop(self) -> "RunProfiler":
+        global _tracemalloc_users
+        if self._thread is None:
+            return self
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._wall = time.perf_counter() - self._wall
+        self._cpu = time.process_time() - self._cpu
+        self._peak = tracemalloc.get_traced_memory()[1]
+        self._allocations = self._allocation_stats(tracemalloc.take_snapshot())
+        self._baseline = None
+        with _tracemalloc_lock:
+            if self._started_tracemalloc:
+                _tracemalloc_users -= 1
+                if _tracemalloc_users == 0:
+                    tracemalloc.stop()
+        return self
+
+    def top_functions(self) -> List[Dict[str, Any]]:
+        """함수별 self(스택 맨 위) / total(스택 어딘가) CPU 시간, self 기준 상위 N개"""
+        self_counts, total_counts = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for label in set(frames):
+                total_counts[label] += count
+        rows = []
+        sampled = max(sum(self.stacks.values()), 1)
+        for label, micros in self_counts.most_common(self.top_n):
+            rows.append({
+                "function": label,
+                "self_cpu_seconds": round(micros / 1e6, 3),
+                "total_cpu_seconds": round(total_counts[label] / 1e6, 3),
+                "self_pct": round(100 * micros / sampled, 1),
+            })
+        return rows
+
+    def _allocation_stats(self, snapshot):
+        ignore = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"), # 지연 import
+            tracemalloc.Filter(False, "<unknown>"),
+        ]
+        snapshot = snapshot.filter_traces(ignore)
+        return snapshot.compare_to(self._baseline.filter_traces(ignore), "traceback")[:self.top_n]
+
+    def top_allocations(self) -> List[Dict[str, Any]]:
+        """시작 시점 대비 늘어난 할당 상위 N개 (가장 안쪽 프레임 기준)"""
+        rows = []
+        for stat in self._allocations or []:
+            frame = stat.traceback[-1] if stat.traceback else None
+            rows.append({
+                "location": f"{frame.filename}:{frame.lineno}" if frame else "?",
+                "size_diff_bytes": stat.size_diff,
+                "size_bytes": stat.size,
+                "count_diff": stat.count_diff,
+            })
+        return rows
+
+    def report(self) -> Dict[str, Any]:
+        self.stop()
+        return {
+            "scope": "process", # 같은 워커의 다른 스레드/run도 포함
+            "interval_ms": self.interval * 1000,
+            "wall_seconds": round(self._wall, 3),
+            "cpu_seconds": round(self._cpu, 3), # 프로세스 전체 CPU 시간 (process_time)
+            "sampled_cpu_seconds": round(sum(self.stacks.values()) / 1e6, 3), # 샘플에 잡힌 스레드 CPU 시간 합
+            "samples": self.samples,
+            "idle_samples": self.idle_samples,
+            "peak_traced_bytes": self._peak,
+            "top_functions": self.top_functions(),
+            "top_allocations": self.top_allocations(),
+        }
+
+    def dump(self, directory: str) -> Dict[str, Any]:
+        """프로파일을 중지하고 directory에 저장한 뒤 run 상태에 붙일 요약을 반환합니다."""
+        report = self.report()
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "profile.json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        with open(os.path.join(directory, "stacks.collapsed"), "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(directory, "allocations.txt"), "w", encoding="utf-8") as f:
+            for stat in self._allocations or []:
+                f.write(f"{stat}\n")
+                for line in stat.traceback.format():
+                    f.write(f"    {line}\n")
+        return {
+            "directory": directory,
+            "wall_seconds": report["wall_seconds"],
+            "cpu_seconds": report["cpu_seconds"],
+            "peak_traced_bytes": report["peak_traced_bytes"],
+            "top_functions": report["top_functions"][:5],
+            "top_allocations": report["top_allocations"][:5],
+        }
@@ -0,0 +1,377 @@
+import os
+import copy
+import time
+import hashlib
+import heapq
+import asyncio
+import itertools
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.messages import BaseMessage
+from langchain_openai import ChatOpenAI
+
+from llm_common.tokens import count_tokens
+from llm_common.cassette import current_cassette, node_path, encode_chat_request, encode_chat_result, decode_chat_result, chat_usage
+
+# --- 호출 한도 설정 (조직/키의 한도보다 약간 낮게 설정) ---
+# 버킷은 프로세스마다 따로 있으므로 워커 수(WEB_CONCURRENCY)로 나눠 서버 전체 합이 한도를 넘지 않게 합니다.
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500")) / WEB_CONCURRENCY
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "200000")) / WEB_CONCURRENCY
+TAVILY_RPM = float(os.getenv("TAVILY_RPM", "100")) / WEB_CONCURRENCY
+# 버킷 용량 = 이 시간(초) 동안 채워지는 양. 작을수록 폭주 없이 일정한 속도로 흘려보냄
+RATE_LIMIT_BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", "5"))
+# 호출 전 토큰 추정 시 더해 두는 예상 출력 토큰 (호출 후 실제 usage로 정산)
+EXPECTED_OUTPUT_TOKENS = int(os.getenv("EXPECTED_OUTPUT_TOKENS", "500"))
+
+# 우선순위 클래스 (숫자가 작을수록 먼저): 대화형 요청(/run, 채팅 턴)이 배치/평가/가이드 사전 생성 작업보다 앞섭니다.
+PRIORITIES = {"interactive": 0, "batch": 1}
+_POLL_SECONDS = 0.05
+
+_current_priority: ContextVar[str] = ContextVar("llm_priority", default="interactive")
+# 대기 중 호출을 그만둬야 하면 예외를 던지는 검사 함수 (앱이 run 취소/마감과 연결). 버킷에서 꺼내기 전마다 호출하므로
+# 대기하는 사이 취소된 호출은 한도를 쓰지도, 요청을 보내지도 않습니다.
+stop_check: ContextVar[Optional[Callable[[], None]]] = ContextVar("llm_stop_check", default=None)
+
+
+@contextmanager
+def priority(name: str):
+    """이 블록 안의 LLM/검색 호출을 지정한 우선순위 클래스로 대기시킵니다. (예: with priority('batch'):)"""
+    token = _current_priority.set(name)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """amount만큼 꺼내려면 기다려야 하는 시간 (0이면 바로 가능)"""
+        deficit = min(amount, self.capacity) - self.level
+        return deficit / self.rate if deficit > 0 else 0.0
+
+
+class RateLimiter:
+    """
+    프로세스 전역 RPM/TPM 토큰 버킷 (워커 프로세스마다 하나, 한도는 워커 수로 나눈 몫).
+    대기자는 (우선순위, 도착 순서) 순으로 줄을 서며, 맨 앞 대기자만 버킷에서 꺼낼 수 있습니다.
+    동기 호출(acquire)과 비동기 호출(aacquire)이 같은 줄을 공유합니다.
+    """
+
+    def __init__(self, name: str, rpm: float, tpm: Optional[float] = None, burst_seconds: float = RATE_LIMIT_BURST_SECONDS):
+        self.name = name
+        self.requests = TokenBucket(rpm, burst_seconds)
+        self.tokens = TokenBucket(tpm, burst_seconds) if tpm else None
+        self._lock = threading.Lock()
+        self._queue: List[tuple] = []
+        self._seq = itertools.count()
+        self._waits: Dict[str, deque] = defaultdict(lambda: deque(maxlen=1000))
+        self._counts: Dict[str, int] = defaultdict(int)
+
+    def _enqueue(self, priority_name: Optional[str]):
+        priority_name = priority_name or _current_priority.get()
+        ticket = (PRIORITIES.get(priority_name, len(PRIORITIES)), next(self._seq), priority_name)
+        with self._lock:
+            heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _try_take(self, ticket, tokens: int) -> float:
+        with self._lock:
+            if self._queue[0] != ticket:
+                return _POLL_SECONDS
+            now = time.monotonic()
+            self.requests.refill(now)
+            wait = self.requests.wait_time(1)
+            if self.tokens is not None:
+                self.tokens.refill(now)
+                wait = max(wait, self.tokens.wait_time(tokens))
+            if wait > 0:
+                return wait
+            self.requests.level -= 1
+            if self.tokens is not None:
+                self.tokens.level -= min(tokens, self.tokens.capacity)
+            heapq.heappop(self._queue)
+            return 0.0
+
+    def _abandon(self, ticket):
+        with self._lock:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+
+    def _record(self, ticket, waited: float):
+        with self._lock:
+            self._waits[ticket[2]].append(waited)
+            self._counts[ticket[2]] += 1
+
+    def acquire(self, tokens: int = 0, priority_name: Optional[str] = None) -> float:
+        """호출 1회(+토큰)를 확보할 때까지 대기하고 대기 시간(초)을 반환합니다. (stop_check가 예외를 던지면 줄에서 빠짐)"""
+        ticket = self._enqueue(priority_name)
+        check = stop_check.get()
+        started = time.monotonic()
+        try:
+            while True:
+                if check is not None:
+                    check()
+                if (wait := self._try_take(ticket, tokens)) <= 0:
+                    break
+                time.sleep(min(wait, _POLL_SECONDS if check is not None else 1.0))
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        waited = time.monotonic() - started
+        self._record(ticket, waited)
+        return waited
+
+    async def aacquire(self, tokens: int = 0, priority_name: Optional[str] = None) -> float:
+        ticket = self._enqueue(priority_name)
+        check = stop_check.get()
+        started = time.monotonic()
+        try:
+            while True:
+                if check is not None:
+                    check()
+                if (wait := self._try_take(ticket, tokens)) <= 0:
+                    break
+                await asyncio.sleep(min(wait, _POLL_SECONDS if check is not None else 1.0))
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        waited = time.monotonic() - started
+        self._record(ticket, waited)
+        return waited
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """호출 후 실제 사용 토큰으로 정산합니다. (추정보다 적게 쓰면 돌려받고, 많이 쓰면 이후 호출이 그만큼 기다림)"""
+        if self.tokens is None or actual is None:
+            return
+        with self._lock:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated - actual)
+
+    def stats(self) -> Dict[str, Any]:
+        """우선순위 클래스별 대기 시간 지표"""
+        with self._lock:
+            waits = {name: sorted(values) for name, values in self._waits.items()}
+            counts = dict(self._counts)
+            depth = len(self._queue)
+        result = {"queue_depth": depth, "classes": {}}
+        for name, values in waits.items():
+            result["classes"][name] = {
+                "count": counts[name],
+                "mean_wait": round(sum(values) / len(values), 4),
+                "p95_wait": round(values[min(len(values) - 1, int(0.95 * len(values)))], 4),
+                "max_wait": round(values[-1], 4),
+            }
+        return result
+
+
+openai_limiter = RateLimiter("openai", rpm=OPENAI_RPM, tpm=OPENAI_TPM)
+search_limiter = RateLimiter("tavily", rpm=TAVILY_RPM)
+
+# 모델별 사용 토큰 합계 (실제 usage가 없으면 추정치) - 모델 티어별 리포트에 사용
+_model_tokens: Dict[str, int] = defaultdict(int)
+_model_tokens_lock = threading.Lock()
+
+
+def model_token_usage() -> Dict[str, int]:
+    with _model_tokens_lock:
+        return dict(_model_tokens)
+
+
+# --- 동일 프롬프트 병합 (배치 작업용) ---
+_prompt_group: ContextVar[Optional["PromptGroup"]] = ContextVar("prompt_group", default=None)
+
+
+class PromptGroup:
+    """
+    같은 그룹 안에서 (모델, 파라미터, 메시지)가 같은 LLM 호출은 한 번만 보내고 결과를 공유합니다.
+    먼저 도착한 호출이 실제 요청을 보내고, 같은 프롬프트의 다른 호출은 그 결과(진행 중이면 완료까지 대기)를 받습니다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures: Dict[str, Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def _claim(self, key: str):
+        with self._lock:
+            self.calls += 1
+            future = self._futures.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._futures[key] = Future()
+            return future, True
+
+    def _fail(self, key: str, future: Future, error: BaseException):
+        # 실패한 호출은 공유 결과로 남기지 않음 (이후 같은 프롬프트는 다시 요청)
+        with self._lock:
+            self._futures.pop(key, None)
+        future.set_exception(error)
+
+    def run(self, key: str, fn):
+        future, owner = self._claim(key)
+        if not owner:
+            return copy.deepcopy(future.result())
+        try:
+            result = fn()
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        future.set_result(result)
+        return result
+
+    async def arun(self, key: str, coro_fn):
+        future, owner = self._claim(key)
+        if not owner:
+            return copy.deepcopy(await asyncio.wrap_future(future))
+        try:
+            result = await coro_fn()
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        future.set_result(result)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced, "unique": self.calls - self.coalesced}
+
+
+@contextmanager
+def coalesce_prompts():
+    """이 블록(및 여기서 시작한 태스크/스레드) 안의 동일한 LLM 호출을 하나로 합칩니다. (예: 배치 실행)"""
+    group = PromptGroup()
+    token = _prompt_group.set(group)
+    try:
+        yield group
+    finally:
+        _prompt_group.reset(token)
+
+
+def _estimate_tokens(messages: List[BaseMessage], expected_output: int) -> int:
+    return count_tokens("\n".join(str(m.content) for m in messages)) + expected_output
+
+
+def _total_tokens(usage: Optional[Dict[str, Any]]) -> Optional[int]:
+    if not usage:
+        return None
+    return usage.get("total_tokens")
+
+
+class LimitedChatOpenAI(ChatOpenAI):
+    """
+    호출 전 공용 리미터(openai_limiter)에서 RPM/TPM을 확보하고, 호출 후 실제 usage로 정산하는 ChatOpenAI.
+    with_structured_output / bind로 감싸도 그대로 적용됩니다.
+    카세트(cassette.py)가 켜져 있으면 호출을 기록하거나, 재생 모드에서는 리미터/네트워크 없이 기록된 응답을 반환합니다.
+    """
+
+    priority: Optional[str] = None  # None이면 현재 컨텍스트의 우선순위(priority())를 따름
+    expected_output_tokens: int = EXPECTED_OUTPUT_TOKENS
+
+    def _settle(self, estimated: int, actual: Optional[int]):
+        openai_limiter.settle(estimated, actual)
+        with _model_tokens_lock:
+            _model_tokens[self.model_name] += actual if actual is not None else estimated
+
+    def _prompt_key(self, messages, stop, kwargs) -> str:
+        payload = [
+            self.model_name,
+            self.temperature,
+            stop,
+            [(m.type, m.content) for m in messages],
+            sorted((k, repr(v)) for k, v in kwargs.items()),  # bind된 도구/response_format 포함
+        ]
+        return hashlib.sha256(repr(payload).encode("utf-8")).hexdigest()
+
+    def _taped(self, messages, stop, run_manager, kwargs):
+        return dict(
+            key=self._prompt_key(messages, stop, kwargs),
+            request=encode_chat_request(messages, stop, kwargs),
+            node=node_path(run_manager.metadata if run_manager else None),
+            encode=encode_chat_result, decode=decode_chat_result, usage=chat_usage,
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        cassette = current_cassette()
+        if cassette is not None:
+            return cassette.call("llm", self.model_name, fn=lambda: self._live_generate(messages, stop, run_manager, **kwargs),
+                                 **self._taped(messages, stop, run_manager, kwargs))
+        return self._live_generate(messages, stop, run_manager, **kwargs)
+
+    def _live_generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.streaming:
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)  # _stream에서 확보
+        group = _prompt_group.get()
+        if group is not None:
+            return group.run(
+                self._prompt_key(messages, stop, kwargs),
+                lambda: self._limited_generate(messages, stop, run_manager, **kwargs),
+            )
+        return self._limited_generate(messages, stop, run_manager, **kwargs)
+
+    def _limited_generate(self, messages, stop=None, run_manager=None, **kwargs):
+        estimated = _estimate_tokens(messages, self.expected_output_tokens)
+        openai_limiter.acquire(estimated, self.priority)
+        result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self._settle(estimated, _total_tokens((result.llm_output or {}).get("token_usage")))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        cassette = current_cassette()
+        if cassette is not None:
+            return await cassette.acall("llm", self.model_name, fn=lambda: self._live_agenerate(messages, stop, run_manager, **kwargs),
+                                        **self._taped(messages, stop, run_manager, kwargs))
+        return await self._live_agenerate(messages, stop, run_manager, **kwargs)
+
+    async def _live_agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.streaming:
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        group = _prompt_group.get()
+        if group is not None:
+            return await group.arun(
+                self._prompt_key(messages, stop, kwargs),
+                lambda: self._limited_agenerate(messages, stop, run_manager, **kwargs),
+            )
+        return await self._limited_agenerate(messages, stop, run_manager, **kwargs)
+
+    async def _limited_agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        estimated = _estimate_tokens(messages, self.expected_output_tokens)
+        await openai_limiter.aacquire(estimated, self.priority)
+        result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self._settle(estimated, _total_tokens((result.llm_output or {}).get("token_usage")))
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        estimated = _estimate_tokens(messages, self.expected_output_tokens)
+        openai_limiter.acquire(estimated, self.priority)
+        actual = None
+        for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            actual = _total_tokens(getattr(chunk.message, "usage_metadata", None)) or actual
+            yield chunk
+        self._settle(estimated, actual)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        estimated = _estimate_tokens(messages, self.expected_output_tokens)
+        await openai_limiter.aacquire(estimated, self.priority)
+        actual = None
+        async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            actual = _total_tokens(getattr(chunk.message, "usage_metadata", None)) or actual
+            yield chunk
+        self._settle(estimated, actual)
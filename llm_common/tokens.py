@@ -0,0 +1,39 @@
+import os
+import threading
+
+# --- 토큰 수 계산 ---
+# tiktoken 인코더(BPE 파일 다운로드가 필요할 수 있음)는 import 시점이 아니라 첫 count_tokens 호출 때 한 번만 로드합니다.
+TOKEN_MODEL = os.getenv("CONTEXT_MODEL", "gpt-4o-mini")
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    """tiktoken 인코더를 한 번만 로드합니다. (로드 실패 시 None -> 근사치 사용)"""
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                try:
+                    import tiktoken
+                    try:
+                        _encoder = tiktoken.encoding_for_model(TOKEN_MODEL)
+                    except KeyError:
+                        _encoder = tiktoken.get_encoding("o200k_base")
+                except Exception as e:
+                    # 오프라인 환경 등에서 BPE 파일을 받을 수 없는 경우
+                    print(f"⚠️ tiktoken unavailable, using byte-length estimate: {e}")
+                    _encoder = False
+    return _encoder or None
+
+
+def count_tokens(text: str) -> int:
+    """텍스트의 토큰 수를 셉니다."""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is None:
+        # 보수적 근사치: 영어는 약간 과대, 한국어는 대략 1글자=1토큰
+        return len(text.encode("utf-8")) // 3 + 1
+    return len(encoder.encode(text, disallowed_special=()))
@@ -0,0 +1,111 @@
+"""
+모듈 import 시간 벤치마크 (python -X importtime 기반)
+
+워커 부팅/테스트 수집 시간이 늘어나지 않았는지 추적합니다. 모듈마다 새 프로세스로 여러 번 import해 중앙값을 사용합니다.
+
+    python bench_importtime.py                                   # pipeline, main 측정
+    python bench_importtime.py --save importtime_baseline.json   # 기준값 저장
+    python bench_importtime.py --baseline importtime_baseline.json --max-regression 0.2   # 20% 넘게 느려지면 exit 1
+    python bench_importtime.py --forbid langchain_community      # import 시점에 로드되면 안 되는 모듈 검사
+    python bench_importtime.py --cwd ../trip-talk app chains.guide_chain
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, Tuple
+
+DEFAULT_MODULES = ["pipeline", "main"]
+
+
+def parse_importtime(stderr: str) -> Dict[str, Tuple[int, int]]:
+    """'import time: self [us] | cumulative | name' 줄을 {모듈: (self_us, cumulative_us)}로 변환합니다."""
+    result = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # 헤더 줄
+        result[parts[2].strip()] = (self_us, cumulative_us)
+    return result
+
+
+def measure(module: str, cwd: str, runs: int, top: int) -> Dict:
+    totals: List[int] = []
+    self_times: Dict[str, List[int]] = {}
+    imported = set()
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=cwd, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            tail = proc.stderr.strip().splitlines()[-1:] or [""]
+            raise RuntimeError(f"import {module} failed: {tail[0]}")
+        timings = parse_importtime(proc.stderr)
+        totals.append(timings[module][1])
+        imported.update(timings)
+        for name, (self_us, _) in timings.items():
+            self_times.setdefault(name, []).append(self_us)
+
+    heaviest = sorted(self_times.items(), key=lambda kv: statistics.median(kv[1]), reverse=True)[:top]
+    return {
+        "total_ms": round(statistics.median(totals) / 1000, 1),
+        "runs": runs,
+        "top_self_ms": [[name, round(statistics.median(values) / 1000, 1)] for name, values in heaviest],
+        "imported": sorted(imported),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="python -X importtime 기반 import 시간 벤치마크")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--cwd", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="self 시간이 큰 모듈 몇 개를 보여줄지")
+    parser.add_argument("--save", help="측정 결과를 기준값 JSON으로 저장")
+    parser.add_argument("--baseline", help="비교할 기준값 JSON")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument("--forbid", action="append", default=[], help="import 시점에 로드되면 실패 처리할 모듈 (접두사)")
+    args = parser.parse_args()
+
+    report = {module: measure(module, args.cwd, args.runs, args.top) for module in args.modules}
+    failed = False
+    for module, result in report.items():
+        print(f"⏱️ import {module}: {result['total_ms']} ms (median of {result['runs']})")
+        for name, ms in result["top_self_ms"]:
+            print(f"      {ms:>8.1f} ms  {name}")
+        loaded = [m for m in result["imported"] if any(m == f or m.startswith(f + ".") for f in args.forbid)]
+        if loaded:
+            print(f"❌ {module} imports deferred modules at import time: {loaded}")
+            failed = True
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for module, result in report.items():
+            if module not in baseline:
+                continue
+            before = baseline[module]["total_ms"]
+            change = result["total_ms"] / before - 1 if before else 0.0
+            mark = "❌" if change > args.max_regression else "✅"
+            print(f"{mark} {module}: {before} ms -> {result['total_ms']} ms ({change:+.0%})")
+            failed = failed or change > args.max_regression
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({m: {k: v for k, v in r.items() if k != "imported"} for m, r in report.items()}, f, indent=2)
+        print(f"💾 Saved baseline to {args.save}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
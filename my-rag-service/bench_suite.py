@@ -0,0 +1,312 @@
+"""
+오프라인 성능 벤치마크 스위트 (실제 OpenAI/Tavily 대신 fake_api_server 사용)
+
+로컬 가짜 서버(지연 시간 분포 + 스크립트된 응답, bench_config.json)를 띄우고 대상별로 새 워커 프로세스에서 실행해
+노드별 지연 시간, end-to-end p50/p95/p99, 동시 실행 N에서의 처리량, peak RSS를 측정합니다.
+결과는 bench_results/<커밋>.json으로 저장되어 커밋 간 비교에 사용합니다.
+
+    python bench_suite.py                                    # rag, trip_graph, guide / 동시성 1, 4
+    python bench_suite.py --targets rag --concurrency 1 8 --runs 16
+    python bench_suite.py --compare bench_results/abc1234.json --max-regression 0.2   # p95가 20% 넘게 느려지면 exit 1
+
+대상
+- rag        : my-rag-service 메인 그래프 (pipeline.app)
+- trip_graph : trip-talk 대화 그래프 (router -> clerk/tutor)
+- guide      : trip-talk generate_guide (검색어 최적화 -> 하이브리드 검색 -> 가이드 생성)
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import resource
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from fake_api_server import FakeAPIServer, load_config
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+TRIP_TALK_DIR = os.path.join(os.path.dirname(SERVICE_DIR), "trip-talk")
+TARGET_DIRS = {"rag": SERVICE_DIR, "trip_graph": TRIP_TALK_DIR, "guide": TRIP_TALK_DIR}
+DEFAULT_RESULTS_DIR = os.path.join(SERVICE_DIR, "bench_results")
+
+# 워커에 주는 환경 변수: 외부 서비스/영속 저장소를 끄고 리미터가 병목이 되지 않게 함
+WORKER_ENV = {
+    "OPENAI_API_KEY": "sk-bench",
+    "TAVILY_API_KEY": "tvly-bench",
+    "LANGCHAIN_TRACING_V2": "false",
+    "LANGSMITH_TRACING": "false",
+    "RUN_STORE_BACKEND": "memory",
+    "CHECKPOINT_BACKEND": "memory",
+    "RESULT_CACHE": "0",
+    "OPENAI_RPM": "100000",
+    "OPENAI_TPM": "1000000000",
+    "TAVILY_RPM": "100000",
+    "LOCAL_INDEX_DIR": os.path.join(tempfile.gettempdir(), "bench-no-local-index"),
+    "SUPABASE_URL": "",
+    "SUPABASE_KEY": "",
+}
+
+
+def percentile(values: List[float], q: float) -> float:
+    """선형 보간 백분위수 (q: 0~100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(seconds: List[float]) -> Dict[str, float]:
+    ms = [s * 1000 for s in seconds]
+    return {
+        "count": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 1) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 1),
+        "p95_ms": round(percentile(ms, 95), 1),
+        "p99_ms": round(percentile(ms, 99), 1),
+    }
+
+
+# ==========================================
+# 워커 (대상 프로젝트 디렉터리를 sys.path 맨 앞에 두고 실행)
+# ==========================================
+def _build_runner(target: str, workload: Dict[str, Any]):
+    """run(i, tracer): i번째 실행을 수행하는 코루틴 함수를 반환합니다. (tracer: 노드 실행 시간을 모으는 콜백)"""
+    if target == "rag":
+        from langchain_core.messages import HumanMessage
+        from pipeline import app
+        from retry_budget import new_budget
+
+        graph = app.get()
+        queries = workload["queries"]
+
+        async def run(i: int, tracer):
+            run_id = f"bench-{uuid.uuid4().hex[:8]}"
+            inputs = {
+                "messages": [HumanMessage(content=queries[i % len(queries)])],
+                "run_id": run_id, "agent_results": None, "plan": None, "budget": new_budget(),
+            }
+            config = {"configurable": {"thread_id": run_id}, "callbacks": [tracer]}
+            await graph.ainvoke(inputs, config)
+        return run
+
+    if target == "trip_graph":
+        from langchain_core.messages import HumanMessage
+        from graph import build_graph
+
+        graph = build_graph()
+        messages = workload["messages"]
+
+        async def run(i: int, tracer):
+            inputs = {
+                "messages": [HumanMessage(content=messages[i % len(messages)])],
+                "context_data": {}, "location": workload["location"], "situation": workload["situation"],
+            }
+            await graph.ainvoke(inputs, {"callbacks": [tracer]})
+        return run
+
+    if target == "guide":
+        from chains.guide_chain import generate_guide
+
+        requests = workload["requests"]
+
+        async def run(i: int, tracer):
+            location, situation = requests[i % len(requests)]
+            await generate_guide(location, situation)
+        return run
+
+    raise ValueError(f"Unknown target: {target}")
+
+
+async def _run_worker(target: str, concurrency: int, runs: int, warmup: int, workload: Dict[str, Any]) -> Dict[str, Any]:
+    # 노드 경로('부모노드/노드')별 실행 시간은 my-rag-service의 RunTracer로 수집 (trip-talk 그래프에도 그대로 사용)
+    from tracing import RunTracer
+
+    run = _build_runner(target, workload)
+    for i in range(warmup):  # import/컴파일/커넥션 준비 비용은 측정에서 제외
+        await run(i, RunTracer(registry=None))
+    tracer = RunTracer(registry=None)
+
+    latencies: List[float] = []
+    errors: List[str] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await run(i, tracer)
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(runs)))
+    wall = time.perf_counter() - started
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak_kb / (1024 * 1024) if sys.platform == "darwin" else peak_kb / 1024  # macOS는 bytes 단위
+    return {
+        "concurrency": concurrency,
+        "runs": runs,
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 3) if wall else 0.0,
+        "e2e": summarize(latencies),
+        "nodes": {node: summarize(values) for node, values in sorted(tracer.node_durations().items())},
+        "peak_rss_mb": round(peak_mb, 1),
+    }
+
+
+def worker_main(args):
+    sys.path.insert(0, TARGET_DIRS[args.target])
+    from langchain_community.utilities import tavily_search
+    tavily_search.TAVILY_API_URL = args.tavily_url  # Tavily 래퍼는 호출 시점에 이 모듈 상수를 읽음
+
+    with open(args.config, encoding="utf-8") as f:
+        workload = json.load(f)["workloads"][args.target]
+    result = asyncio.run(_run_worker(args.target, args.concurrency, args.runs, args.warmup, workload))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+
+
+# ==========================================
+# 오케스트레이터
+# ==========================================
+def git_commit() -> str:
+    proc = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR, capture_output=True, text=True)
+    commit = proc.stdout.strip() or "unknown"
+    dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=SERVICE_DIR,
+                           capture_output=True, text=True).stdout.strip()
+    return f"{commit}-dirty" if dirty else commit
+
+
+def run_target(target: str, concurrency: int, args, server_url: str) -> Dict[str, Any]:
+    env = dict(os.environ, **WORKER_ENV)
+    env["OPENAI_BASE_URL"] = env["OPENAI_API_BASE"] = f"{server_url}/v1"
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:  # runs/, sqlite 파일 등은 임시 디렉터리에
+        output = os.path.join(workdir, "result.json")
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", target,
+             "--concurrency", str(concurrency), "--runs", str(args.runs), "--warmup", str(args.warmup),
+             "--config", os.path.abspath(args.config), "--tavily-url", server_url, "--output", output],
+            cwd=workdir, env=env, capture_output=True, text=True, timeout=args.timeout,
+        )
+        if proc.returncode != 0 or not os.path.exists(output):
+            tail = "\n".join(proc.stderr.strip().splitlines()[-5:])
+            return {"concurrency": concurrency, "failed": True, "stderr_tail": tail}
+        with open(output, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def print_result(target: str, result: Dict[str, Any]):
+    if result.get("failed"):
+        print(f"❌ {target} c={result['concurrency']}: worker failed\n{result['stderr_tail']}")
+        return
+    e2e = result["e2e"]
+    print(f"📊 {target} c={result['concurrency']}: p50 {e2e['p50_ms']} ms | p95 {e2e['p95_ms']} ms | "
+          f"p99 {e2e['p99_ms']} ms | {result['throughput_rps']} runs/s | peak RSS {result['peak_rss_mb']} MB | "
+          f"errors {result['errors']}/{result['runs']}")
+    for sample in result.get("error_samples", []):
+        print(f"      ⚠️ {sample}")
+    for node, stats in result["nodes"].items():
+        print(f"      {stats['p50_ms']:>9.1f} / {stats['p95_ms']:>9.1f} ms (p50/p95, n={stats['count']})  {node}")
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> bool:
+    """기준 결과 대비 변화를 출력하고, p95가 max_regression 넘게 느려진 항목이 있으면 True"""
+    regressed = False
+    print(f"\n🔍 Compare {baseline.get('commit')} -> {report.get('commit')}")
+    for target, levels in report["results"].items():
+        for level, result in levels.items():
+            before = baseline.get("results", {}).get(target, {}).get(level)
+            if not before or before.get("failed") or result.get("failed"):
+                continue
+            rows = [
+                ("p50", before["e2e"]["p50_ms"], result["e2e"]["p50_ms"], False),
+                ("p95", before["e2e"]["p95_ms"], result["e2e"]["p95_ms"], True),
+                ("p99", before["e2e"]["p99_ms"], result["e2e"]["p99_ms"], False),
+                ("throughput", before["throughput_rps"], result["throughput_rps"], False),
+                ("peak_rss_mb", before["peak_rss_mb"], result["peak_rss_mb"], False),
+            ]
+            for name, old, new, gated in rows:
+                change = new / old - 1 if old else 0.0
+                bad = gated and change > max_regression
+                regressed = regressed or bad
+                mark = "❌" if bad else "  "
+                print(f"{mark} {target} {level} {name}: {old} -> {new} ({change:+.0%})")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="가짜 OpenAI/Tavily 서버를 이용한 오프라인 성능 벤치마크")
+    parser.add_argument("--targets", nargs="+", default=list(TARGET_DIRS), choices=list(TARGET_DIRS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--runs", type=int, default=8, help="동시성 단계별 측정 실행 횟수")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--config", default=os.path.join(SERVICE_DIR, "bench_config.json"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=1800, help="워커 하나의 최대 실행 시간(초)")
+    parser.add_argument("--output", help="결과 JSON 경로 (기본: bench_results/<커밋>.json)")
+    parser.add_argument("--compare", help="비교할 이전 결과 JSON")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    # 내부용: 워커 모드
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--tavily-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        args.target = args.worker
+        args.concurrency = args.concurrency[0]
+        worker_main(args)
+        return
+
+    config = load_config(args.config)
+    server = FakeAPIServer(config, seed=args.seed).start()
+    print(f"🧪 Fake API server: {server.url}")
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        for target in args.targets:
+            for concurrency in args.concurrency:
+                print(f"⏱️ Running {target} (concurrency={concurrency}, runs={args.runs})...")
+                result = run_target(target, concurrency, args, server.url)
+                results.setdefault(target, {})[f"c{concurrency}"] = result
+                print_result(target, result)
+        server_stats = server.stats()
+    finally:
+        server.stop()
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "warmup": args.warmup,
+        "latency": config.get("latency", {}),
+        "results": results,
+        "fake_server": server_stats,
+    }
+    output = args.output or os.path.join(DEFAULT_RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Saved benchmark results to {output}")
+
+    failed = any(r.get("failed") for levels in results.values() for r in levels.values())
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            failed = compare(report, json.load(f), args.max_regression) or failed
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Set
+
+# --- 블롭 저장소 설정 ---
+# 큰 산출물(연구 자료, 코드, 다이어그램, 최종 문서)을 한 번만 저장하고 state에는 참조 ID만 남깁니다.
+BLOB_DIR = os.getenv("BLOB_DIR", "blobs")
+BLOB_CACHE_SIZE = int(os.getenv("BLOB_CACHE_SIZE", "64"))
+BLOB_REF_PREFIX = "blob:"
+# 어떤 체크포인트도 참조하지 않는 블롭(보존 정책으로 지워진 체크포인트의 산출물, Chrome trace)은 마지막 저장 후 이 시간이 지나면 삭제
+BLOB_TTL_SECONDS = int(os.getenv("BLOB_TTL_SECONDS", str(24 * 3600)))
+
+
+class BlobStore:
+    """
+    내용 주소(sha256) 기반의 디스크 블롭 저장소.
+    같은 내용은 한 번만 저장되며, 최근 조회한 블롭은 메모리 LRU 캐시에 보관합니다.
+    체크포인트에는 'blob:<sha256>' 참조만 남으므로 서버 재시작 후에도 참조를 풀 수 있습니다.
+    """
+
+    def __init__(self, directory: str = BLOB_DIR, cache_size: int = BLOB_CACHE_SIZE):
+        self.directory = directory
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _remember(self, digest: str, text: str):
+        with self._lock:
+            self._cache[digest] = text
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def put(self, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        path = self._path(digest)
+        try:
+            os.utime(path) # 같은 내용을 다시 저장하면 TTL을 새로 시작 (GC가 방금 다시 쓰인 블롭을 지우지 않도록)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        self._remember(digest, text)
+        return BLOB_REF_PREFIX + digest
+
+    def get(self, ref: str) -> str:
+        digest = ref[len(BLOB_REF_PREFIX):]
+        with self._lock:
+            if digest in self._cache:
+                self._cache.move_to_end(digest)
+                return self._cache[digest]
+        with open(self._path(digest), encoding="utf-8") as f:
+            text = f.read()
+        self._remember(digest, text)
+        return text
+
+    def sweep(self, live: Set[str], ttl_seconds: int = None) -> int:
+        """live(sha256 집합)에 없고 마지막 저장 후 ttl_seconds가 지난 블롭을 삭제하고 삭제한 수를 반환합니다."""
+        ttl_seconds = BLOB_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        cutoff = time.time() - ttl_seconds
+        deleted = 0
+        if not os.path.isdir(self.directory):
+            return 0
+        for prefix in os.listdir(self.directory):
+            folder = os.path.join(self.directory, prefix)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if name.endswith(".tmp") or name in live:
+                    continue
+                path = os.path.join(folder, name)
+                try:
+                    if os.path.getmtime(path) >= cutoff:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                with self._lock:
+                    self._cache.pop(name, None)
+                deleted += 1
+        return deleted
+
+
+def is_blob_ref(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(BLOB_REF_PREFIX) and len(value) == len(BLOB_REF_PREFIX) + 64
+
+
+blob_store = BlobStore()
+
+
+def resolve(value: Any) -> Any:
+    """블롭 참조면 실제 내용을, 아니면 값을 그대로 반환합니다."""
+    return blob_store.get(value) if is_blob_ref(value) else value
@@ -0,0 +1,99 @@
+"""
+LLM/검색 호출 카세트 확인 및 오프라인 재생 CLI (카세트 구현은 llm_common.cassette)
+
+    CASSETTE_RECORD=1 uvicorn main:app                            # run마다 runs/{run_id}/cassette.jsonl.gz 저장
+    CASSETTE_REPLAY=runs/<id>/cassette.jsonl.gz uvicorn main:app  # 모든 run을 카세트로 재생 (부하 테스트용)
+
+    python cassette.py show runs/<id>/cassette.jsonl.gz           # 노드별 호출 수/시간/토큰
+    python cassette.py replay runs/<id>/cassette.jsonl.gz --runs 5 --latency-scale 0   # 오프라인 재생 벤치마크
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from collections import defaultdict
+from typing import Any, Dict, List
+
+import common_path  # noqa: F401 (llm_common)
+from llm_common.cassette import Cassette, use_cassette, CASSETTE_LATENCY_SCALE, CASSETTE_STRICT
+
+
+def _node_table(entries: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    table: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "tokens": 0, "errors": 0})
+    for entry in entries:
+        row = table[f"{entry['kind']} {entry['node']}"]
+        row["calls"] += 1
+        row["seconds"] += entry["seconds"]
+        row["tokens"] += (entry.get("usage") or {}).get("total_tokens") or 0
+        row["errors"] += 1 if entry.get("error") else 0
+    return dict(sorted(table.items()))
+
+
+def show(path: str):
+    recorded = Cassette.load(path)
+    meta, entries = recorded.meta, recorded.entries
+    print(f"📼 {path} (run {meta.get('run_id')}, {meta.get('recorded_at')})")
+    print(f"   query: {meta.get('query')}")
+    for slot, row in _node_table(entries).items():
+        print(f"   {row['calls']:>4} calls {row['seconds']:>8.2f}s {row['tokens']:>8} tok {row['errors']:>3} err  {slot}")
+
+
+async def _replay_once(graph, meta: Dict[str, Any], cassette: Cassette, index: int):
+    from langchain_core.messages import HumanMessage
+    from retry_budget import new_budget
+    run_id = f"replay-{index}-{int(time.time() * 1000)}"
+    inputs = {
+        "messages": [HumanMessage(content=meta.get("query") or "")],
+        "run_id": run_id, "agent_results": None, "plan": None, "budget": new_budget(),
+    }
+    with use_cassette(cassette):
+        await graph.ainvoke(inputs, {"configurable": {"thread_id": run_id}})
+
+
+def replay(path: str, runs: int, latency_scale: float, strict: bool):
+    """메인 그래프를 카세트로 runs번 재생하고 run당 벽시계/CPU 시간과 호출 차이를 출력합니다."""
+    os.environ.setdefault("OPENAI_API_KEY", "sk-replay") # 클라이언트 생성용 (재생 중에는 호출하지 않음)
+    os.environ.setdefault("TAVILY_API_KEY", "tvly-replay")
+    from pipeline import app
+
+    recorded = Cassette.load(path)
+    meta, entries = recorded.meta, recorded.entries
+    graph = app.get()
+    for i in range(runs):
+        cassette = Cassette("replay", entries=entries, meta=meta, latency_scale=latency_scale, strict=strict)
+        wall, cpu = time.perf_counter(), time.process_time()
+        error = None
+        try:
+            asyncio.run(_replay_once(graph, meta, cassette, i))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        stats = cassette.stats()
+        print(f"▶️ replay {i + 1}/{runs}: wall {wall:.2f}s | cpu {cpu:.2f}s | exact {stats['exact']} | "
+              f"fallback {stats['fallback']} | missed {stats['missed']} | unused {stats['unused']}"
+              + (f" | ❌ {error}" if error else ""))
+    recorded = sum(e["seconds"] for e in entries)
+    print(f"📼 recorded: {len(entries)} calls, {recorded:.2f}s of call time (latency scale {latency_scale})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM/검색 호출 카세트 확인 및 오프라인 재생")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show_parser = sub.add_parser("show", help="노드별 기록된 호출 요약")
+    show_parser.add_argument("path")
+    replay_parser = sub.add_parser("replay", help="메인 그래프를 카세트로 재생 (네트워크 없음)")
+    replay_parser.add_argument("path")
+    replay_parser.add_argument("--runs", type=int, default=3)
+    replay_parser.add_argument("--latency-scale", type=float, default=CASSETTE_LATENCY_SCALE, help="1.0: 원래 지연 시간, 0: 지연 없음")
+    replay_parser.add_argument("--strict", action="store_true", default=CASSETTE_STRICT, help="요청이 바뀐 호출은 대체하지 않고 실패")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        show(args.path)
+    else:
+        replay(args.path, args.runs, args.latency_scale, args.strict)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
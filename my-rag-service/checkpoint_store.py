@@ -0,0 +1,184 @@
+import os
+import re
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterator, List, Set
+
+from langchain_core.messages import BaseMessage, RemoveMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from blob_store import blob_store
+
+# --- 체크포인터 설정 ---
+# 'sqlite': 디스크(WAL)에 저장되어 재시작 후에도 이어서 실행 가능 / 'memory': 프로세스 메모리 (테스트용)
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "sqlite")
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", "checkpoints.sqlite")
+
+# --- 보존 정책 ---
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "5"))          # 스레드별로 남길 최근 체크포인트 수
+THREAD_TTL_SECONDS = int(os.getenv("THREAD_TTL_SECONDS", str(7 * 24 * 3600)))  # 이 시간 동안 사용되지 않은 스레드는 삭제
+CHECKPOINT_COMPACT_INTERVAL = int(os.getenv("CHECKPOINT_COMPACT_INTERVAL", "300"))
+MESSAGE_HISTORY_LIMIT = int(os.getenv("MESSAGE_HISTORY_LIMIT", "10"))       # 스레드에 남길 최근 메시지 수
+
+# 직렬화된 체크포인트/쓰기 기록 안의 블롭 참조 ('blob:<sha256>', msgpack/JSON 모두 문자열이 UTF-8 그대로 저장됨)
+_BLOB_REF_PATTERN = re.compile(rb"blob:([0-9a-f]{64})")
+
+# memory 백엔드용 스레드 활동 기록 { thread_id: last_seen }
+_memory_activity: Dict[str, float] = {}
+
+
+def _is_sqlite(saver) -> bool:
+    return hasattr(saver, "conn")
+
+
+@asynccontextmanager
+async def open_checkpointer():
+    """설정된 백엔드의 체크포인터를 엽니다. (sqlite는 WAL 모드, 종료 시 연결을 닫음)"""
+    if CHECKPOINT_BACKEND != "sqlite":
+        yield MemorySaver()
+        return
+
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    async with AsyncSqliteSaver.from_conn_string(CHECKPOINT_DB_PATH) as saver:
+        await saver.setup()  # PRAGMA journal_mode=WAL + 테이블 생성
+        async with saver.lock:
+            await saver.conn.execute(
+                "CREATE TABLE IF NOT EXISTS thread_activity (thread_id TEXT PRIMARY KEY, last_seen REAL NOT NULL)"
+            )
+            await saver.conn.commit()
+        print(f"💾 SQLite checkpointer: {CHECKPOINT_DB_PATH}")
+        yield saver
+
+
+async def touch_thread(saver, thread_id: str):
+    """스레드의 마지막 사용 시각을 갱신합니다. (TTL 만료 판단용)"""
+    now = time.time()
+    if not _is_sqlite(saver):
+        _memory_activity[thread_id] = now
+        return
+    async with saver.lock:
+        await saver.conn.execute(
+            "INSERT INTO thread_activity (thread_id, last_seen) VALUES (?, ?) "
+            "ON CONFLICT(thread_id) DO UPDATE SET last_seen = excluded.last_seen",
+            (thread_id, now),
+        )
+        await saver.conn.commit()
+
+
+async def _expired_threads(saver, cutoff: float) -> List[str]:
+    if not _is_sqlite(saver):
+        return [t for t, seen in _memory_activity.items() if seen < cutoff]
+    async with saver.lock:
+        async with saver.conn.execute("SELECT thread_id FROM thread_activity WHERE last_seen < ?", (cutoff,)) as cur:
+            return [row[0] for row in await cur.fetchall()]
+
+
+def _serialized_values(value: Any) -> Iterator[bytes]:
+    """MemorySaver의 storage/writes/blobs 안에 중첩된 직렬화 바이트를 모두 꺼냅니다."""
+    if isinstance(value, (bytes, bytearray)):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _serialized_values(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _serialized_values(item)
+
+
+async def live_blob_digests(saver) -> Set[str]:
+    """남아 있는 체크포인트와 쓰기 기록이 참조하는 블롭의 sha256 집합"""
+    live: Set[str] = set()
+    if not _is_sqlite(saver):
+        for data in _serialized_values([saver.storage, saver.writes, saver.blobs]):
+            live.update(d.decode() for d in _BLOB_REF_PATTERN.findall(data))
+        return live
+    async with saver.lock:
+        for query in ("SELECT checkpoint FROM checkpoints", "SELECT value FROM writes"):
+            async with saver.conn.execute(query) as cur:
+                async for (data,) in cur:
+                    if data:
+                        live.update(d.decode() for d in _BLOB_REF_PATTERN.findall(data))
+    return live
+
+
+async def compact_checkpoints(saver, keep_last: int = None, ttl_seconds: int = None) -> Dict[str, int]:
+    """
+    보존 정책을 적용합니다.
+    1. TTL 동안 사용되지 않은 스레드 전체 삭제
+    2. (sqlite) 스레드별 최근 N개 루트 체크포인트보다 오래된 체크포인트/쓰기 기록 삭제 (서브그래프 네임스페이스 포함)
+    3. 남은 체크포인트가 참조하지 않고 BLOB_TTL_SECONDS가 지난 블롭 삭제 (지워진 체크포인트의 산출물, Chrome trace)
+    """
+    keep_last = CHECKPOINT_KEEP_LAST if keep_last is None else keep_last
+    ttl_seconds = THREAD_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+
+    expired = await _expired_threads(saver, time.time() - ttl_seconds)
+    for thread_id in expired:
+        await saver.adelete_thread(thread_id)
+        if _is_sqlite(saver):
+            async with saver.lock:
+                await saver.conn.execute("DELETE FROM thread_activity WHERE thread_id = ?", (thread_id,))
+                await saver.conn.commit()
+        else:
+            _memory_activity.pop(thread_id, None)
+
+    pruned = 0
+    if _is_sqlite(saver):
+        async with saver.lock:
+            # checkpoint_id(uuid6)는 시간 순으로 정렬되므로 N번째 최신 루트 체크포인트를 스레드별 기준점으로 사용
+            async with saver.conn.execute(
+                """
+                SELECT thread_id, checkpoint_id FROM (
+                    SELECT thread_id, checkpoint_id,
+                           ROW_NUMBER() OVER (PARTITION BY thread_id ORDER BY checkpoint_id DESC) AS rn
+                    FROM checkpoints WHERE checkpoint_ns = ''
+                ) WHERE rn = ?
+                """,
+                (keep_last,),
+            ) as cur:
+                cutoffs = await cur.fetchall()
+            for thread_id, min_id in cutoffs:
+                cursor = await saver.conn.execute(
+                    "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id < ?", (thread_id, min_id)
+                )
+                pruned += cursor.rowcount
+            await saver.conn.execute(
+                """
+                DELETE FROM writes WHERE NOT EXISTS (
+                    SELECT 1 FROM checkpoints c
+                    WHERE c.thread_id = writes.thread_id
+                      AND c.checkpoint_ns = writes.checkpoint_ns
+                      AND c.checkpoint_id = writes.checkpoint_id
+                )
+                """
+            )
+            await saver.conn.commit()
+
+    deleted_blobs = 0
+    if os.path.isdir(blob_store.directory):
+        deleted_blobs = await asyncio.to_thread(blob_store.sweep, await live_blob_digests(saver))
+
+    if expired or pruned or deleted_blobs:
+        print(f"🧹 Checkpoint compaction: expired threads={len(expired)}, pruned checkpoints={pruned}, deleted blobs={deleted_blobs}")
+    return {"expired_threads": len(expired), "pruned_checkpoints": pruned, "deleted_blobs": deleted_blobs}
+
+
+async def run_compaction_loop(saver, interval: int = None):
+    """서버가 떠 있는 동안 주기적으로 보존 정책을 적용합니다."""
+    interval = CHECKPOINT_COMPACT_INTERVAL if interval is None else interval
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await compact_checkpoints(saver)
+        except Exception as e:
+            print(f"⚠️ Checkpoint compaction failed: {e}")
+
+
+def compact_message_history(messages: List[BaseMessage], limit: int = None) -> List[RemoveMessage]:
+    """새 메시지 1개를 추가했을 때 최근 limit개만 남도록, 삭제할 오래된 메시지의 RemoveMessage 목록을 만듭니다."""
+    limit = MESSAGE_HISTORY_LIMIT if limit is None else limit
+    excess = len(messages) + 1 - limit
+    if excess <= 0:
+        return []
+    return [RemoveMessage(id=m.id) for m in messages[:excess] if m.id]
@@ -0,0 +1,135 @@
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Iterable
+
+import common_path  # noqa: F401 (llm_common)
+from llm_common.tokens import count_tokens
+
+# --- 토큰 예산 설정 ---
+WRITER_CONTEXT_BUDGET = int(os.getenv("WRITER_CONTEXT_BUDGET", "6000"))
+RESEARCH_DATA_BUDGET = int(os.getenv("RESEARCH_DATA_BUDGET", "3000"))
+REVIEW_CONTEXT_BUDGET = int(os.getenv("REVIEW_CONTEXT_BUDGET", "4000"))
+
+
+# --- 추출 요약 (Extractive Compression) ---
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?。])\s+|\n+")
+
+
+def _split_units(text: str) -> List[str]:
+    return [u.strip() for u in _SENTENCE_SPLIT.split(text) if u and u.strip()]
+
+
+def _query_terms(query: str) -> List[str]:
+    return [t.lower() for t in re.findall(r"\w+", query or "") if len(t) >= 2]
+
+
+def compress_extractive(text: str, max_tokens: int, query: Optional[str] = None) -> str:
+    """
+    예산을 넘는 텍스트에서 쿼리와 관련도가 높은 문장만 골라 원래 순서대로 이어 붙입니다.
+    예산 안이면 그대로 반환합니다.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    units = _split_units(text)
+    terms = _query_terms(query)
+
+    def score(item):
+        idx, unit = item
+        lowered = unit.lower()
+        hits = sum(1 for t in terms if t in lowered)
+        # 관련도가 같으면 앞쪽 문장을 우선 (도입부가 보통 핵심)
+        return (hits, -idx)
+
+    selected, used = [], 0
+    for idx, unit in sorted(enumerate(units), key=score, reverse=True):
+        cost = count_tokens(unit) + 1
+        if used + cost > max_tokens:
+            continue
+        selected.append(idx)
+        used += cost
+
+    return "\n".join(units[i] for i in sorted(selected))
+
+
+def truncate_lines(text: str, max_tokens: int) -> str:
+    """코드/다이어그램처럼 순서가 중요한 텍스트는 앞에서부터 줄 단위로 자릅니다."""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    kept, used = [], 0
+    for line in text.splitlines():
+        cost = count_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept + ["# ... (토큰 예산 초과로 생략)"])
+
+
+class ContextBudget:
+    """
+    프롬프트 섹션별로 토큰 예산을 배분하고, 예산을 넘는 섹션을 압축합니다.
+    weights: {섹션 이름: 가중치}. 예산을 다 쓰지 않은 섹션의 잔여분은 나머지 섹션에 재분배됩니다.
+    ordered: 추출 요약 대신 앞부분 보존(줄 단위 절단)을 적용할 섹션 이름들 (코드, Mermaid 등)
+    """
+
+    def __init__(self, total_tokens: int, weights: Dict[str, float], ordered: Iterable[str] = ()):
+        self.total_tokens = total_tokens
+        self.weights = weights
+        self.ordered = set(ordered)
+
+    def allocate(self, sections: Dict[str, str]) -> Dict[str, int]:
+        sizes = {name: count_tokens(text or "") for name, text in sections.items()}
+        allocation: Dict[str, int] = {}
+        remaining = self.total_tokens
+        pending = [name for name in sections]
+
+        # 가중치 몫보다 작은 섹션을 먼저 확정하고, 남는 예산을 다시 나눕니다.
+        while pending:
+            weight_sum = sum(self.weights.get(n, 1.0) for n in pending)
+            shares = {n: int(remaining * self.weights.get(n, 1.0) / weight_sum) for n in pending}
+            fitting = [n for n in pending if sizes[n] <= shares[n]]
+            if not fitting:
+                allocation.update(shares)
+                break
+            for n in fitting:
+                allocation[n] = sizes[n]
+                remaining -= sizes[n]
+                pending.remove(n)
+
+        return allocation
+
+    def fit(self, sections: Dict[str, str], query: Optional[str] = None) -> Dict[str, str]:
+        allocation = self.allocate(sections)
+        fitted = {}
+        for name, text in sections.items():
+            text = text or ""
+            if name in self.ordered:
+                fitted[name] = truncate_lines(text, allocation[name])
+            else:
+                fitted[name] = compress_extractive(text, allocation[name], query)
+        return fitted
+
+
+# --- 노드별 프롬프트 토큰 기록 ---
+# 구조: { run_id: { node_name: prompt_tokens } }
+_prompt_tokens: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+_usage_lock = threading.Lock()
+
+
+def record_prompt_tokens(run_id: Optional[str], node: str, prompt_text: str) -> int:
+    tokens = count_tokens(prompt_text)
+    if run_id:
+        with _usage_lock:
+            _prompt_tokens[run_id][node] += tokens
+    return tokens
+
+
+def pop_prompt_tokens(run_id: str) -> Dict[str, int]:
+    """실행이 끝난 run의 노드별 프롬프트 토큰 수를 꺼내고 기록을 비웁니다."""
+    with _usage_lock:
+        usage = _prompt_tokens.pop(run_id, {})
+    return dict(usage)
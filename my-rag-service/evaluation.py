@@ -1,28 +1,71 @@
+"""
+파이프라인 품질 평가 (LLM-as-a-Judge)
+
+데이터셋(로컬 JSONL 또는 LangSmith)의 예제마다 파이프라인을 실행하고 심판 LLM으로 채점합니다.
+예제는 EVAL_CONCURRENCY개씩 동시에 실행하며, 심판 판정은 (출력 해시, 평가 기준)으로 캐시되어
+출력이 바뀌지 않은 예제를 다시 평가할 때는 심판을 호출하지 않습니다.
+
+    python evaluation.py --create-dataset                        # LangSmith 데이터셋 생성
+    python evaluation.py --dataset eval_dataset.jsonl            # 로컬 JSONL ({"input": ..., "expected": {...}} 한 줄씩)
+    python evaluation.py --langsmith pipeline_evaluation_week10 --concurrency 8
+"""
 import os
+import sys
+import json
+import time
 import uuid
+import sqlite3
+import asyncio
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
 from langsmith import Client
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from dotenv import load_dotenv
 
+import common_path  # noqa: F401 (llm_common)
+from llm_common.rate_limiter import LimitedChatOpenAI, priority
+from llm_common.lazy_init import Lazy
+from llm_common.model_registry import load_json_env
+from tracing import RunTracer
+
 load_dotenv()
 
-client = Client()
+# LangSmith 클라이언트는 LangSmith 데이터셋을 쓸 때만 생성 (로컬 JSONL 평가는 네트워크 없이 시작)
+client = Lazy(Client, "langsmith")
+
+# --- 평가 설정 ---
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "4"))   # 동시에 실행할 예제 수 (파이프라인 + 심판)
+JUDGE_MODEL = os.getenv("JUDGE_MODEL", "gpt-4o-mini")
+JUDGE_CACHE_DB_PATH = os.getenv("JUDGE_CACHE_DB_PATH", "judge_cache.sqlite")
+EVAL_RESULTS_DIR = os.getenv("EVAL_RESULTS_DIR", "eval_results")
+# 모델별 1M 토큰당 가격(USD): [prompt, completion, cached prompt]. MODEL_PRICES='{"gpt-4o": [2.5, 10, 1.25]}' 형식으로 덮어씁니다.
+DEFAULT_MODEL_PRICES = {
+    "gpt-4.1-nano": [0.10, 0.40, 0.025],
+    "gpt-4.1-mini": [0.40, 1.60, 0.10],
+    "gpt-4o-mini": [0.15, 0.60, 0.075],
+    "gpt-4o": [2.50, 10.00, 1.25],
+}
+MODEL_PRICES = load_json_env("MODEL_PRICES", DEFAULT_MODEL_PRICES)
+QUALITY_METRICS = ("completeness", "relevance", "hallucination", "format")
 
 # --- 1. 평가 데이터셋 생성 ---
 dataset_name = "pipeline_evaluation_week10"
 
 def create_evaluation_dataset():
-    if client.has_dataset(dataset_name=dataset_name):
+    if client.get().has_dataset(dataset_name=dataset_name):
         print(f"Dataset '{dataset_name}' already exists.")
-        return client.read_dataset(dataset_name=dataset_name)
-    
-    dataset = client.create_dataset(
+        return client.get().read_dataset(dataset_name=dataset_name)
+
+    dataset = client.get().create_dataset(
         dataset_name=dataset_name,
         description="RAG Pipeline Quality Evaluation Dataset",
     )
-    
+
     # 예제 데이터 추가
     test_cases = [
         {
@@ -34,8 +77,8 @@ def create_evaluation_dataset():
             "expected": {"has_code": True, "language": "python"}
         }
     ]
-    
-    client.create_examples(
+
+    client.get().create_examples(
         inputs=[case["input"] for case in test_cases],
         outputs=[case["expected"] for case in test_cases],
         dataset_id=dataset.id,
@@ -44,48 +87,47 @@ def create_evaluation_dataset():
     return dataset
 
 
+def load_jsonl_examples(path: str) -> List[Dict[str, Any]]:
+    """로컬 JSONL 데이터셋: 한 줄에 {"id"(선택), "input": 질문, "expected": 평가 기준}"""
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if line.strip():
+                row = json.loads(line)
+                examples.append({"id": str(row.get("id", i)), "input": row["input"], "expected": row.get("expected") or {}})
+    return examples
+
+
+def load_langsmith_examples(name: str) -> List[Dict[str, Any]]:
+    """LangSmith 데이터셋의 예제를 로컬 JSONL과 같은 형태로 변환"""
+    return [
+        {"id": str(example.id), "input": example.inputs["messages"][0]["content"], "expected": example.outputs or {}}
+        for example in client.get().list_examples(dataset_name=name)
+    ]
+
+
 # --- 2. 자동 평가 함수 (LLM-as-a-Judge) ---
 
-evaluator_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+# 평가는 배치 작업이므로 대화형 요청보다 뒤에서 대기. 심판 클라이언트는 첫 판정 때 생성 (import 시 API 키 불필요)
+_evaluator_llm = Lazy(lambda: LimitedChatOpenAI(model=JUDGE_MODEL, temperature=0, priority="batch"), "judge_llm")
 
-def evaluate_pipeline_output(run, example):
-    """
-    run: LangSmith의 실행 객체 (출력값 포함)
-    example: 데이터셋의 예제 객체 (입력값 및 정답 출력값 포함)
-    """
-    # 실제 출력값 및 예상 정답 추출
-    # 참고: 파이프라인의 반환 구조에 따라 로직 조정이 필요할 수 있음
-    
-    # run.outputs가 전체 상태(State)일 수 있으므로 'agent_results'를 추출
-    outputs = run.outputs if run.outputs else {}
-    agent_results = outputs.get("agent_results", {})
-    
-    # 최종 텍스트 추출 시도
-    actual_text = ""
-    if "final_doc" in agent_results:
-        actual_text = agent_results["final_doc"]
-    elif "research" in agent_results:
-        actual_text = agent_results["research"]
-    elif "code" in agent_results:
-        actual_text = agent_results["code"]
-    
-    expected = example.outputs if example.outputs else {}
-    input_text = example.inputs["messages"][0]["content"]
+def get_evaluator_llm() -> LimitedChatOpenAI:
+    return _evaluator_llm.get()
 
-    # LLM 심판(Judge) 프롬프트
-    prompt = ChatPromptTemplate.from_template("""
+# LLM 심판(Judge) 프롬프트
+judge_prompt = ChatPromptTemplate.from_template("""
     You are an expert evaluator for RAG systems.
-    
+
     [Input Question]: {input}
     [Actual Output]: {actual}
     [Expected Criteria]: {expected}
-    
+
     Evaluate the Output based on the following metrics:
     1. Completeness (0-1): Does it answer the question fully?
     2. Relevance (0-1): Is it relevant to the input?
     3. Hallucination (0-1): Does it contain non-factual info? (1 = Hallucinated, 0 = Clean)
     4. Format (0-1): Does it follow requested format (e.g. code blocks)?
-    
+
     Return JSON:
     {{
         "completeness": 0.8,
@@ -95,19 +137,106 @@ def evaluate_pipeline_output(run, example):
         "reason": "Brief explanation"
     }}
     """)
-    
-    chain = prompt | evaluator_llm | JsonOutputParser()
-    
+
+JUDGE_ERROR = {"completeness": 0, "relevance": 0, "hallucination": 0, "format": 0, "reason": "Error"}
+
+
+def output_text(agent_results: Dict[str, Any]) -> str:
+    """파이프라인 결과에서 평가할 최종 텍스트 (final_doc > research > code)"""
+    for key in ("final_doc", "research", "code"):
+        if agent_results.get(key):
+            return agent_results[key]
+    return ""
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def criteria_hash(input_text: str, expected: Dict[str, Any]) -> str:
+    """같은 출력이라도 질문/정답 기준/심판 프롬프트/심판 모델이 바뀌면 다시 채점"""
+    template = judge_prompt.messages[0].prompt.template
+    return _sha256(json.dumps([input_text, expected, template, JUDGE_MODEL], ensure_ascii=False, sort_keys=True))
+
+
+class JudgeCache:
+    """(출력 해시, 평가 기준 해시) -> 심판 판정 (SQLite WAL, 스레드별 커넥션)"""
+
+    def __init__(self, path: str = JUDGE_CACHE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            """
+            CREATE TABLE IF NOT EXISTS judge_cache (
+                output_hash TEXT NOT NULL,
+                criteria_hash TEXT NOT NULL,
+                verdict TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (output_hash, criteria_hash)
+            )
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, output_hash: str, criteria: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT verdict FROM judge_cache WHERE output_hash = ? AND criteria_hash = ?", (output_hash, criteria)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, output_hash: str, criteria: str, verdict: Dict[str, Any]):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO judge_cache (output_hash, criteria_hash, verdict, created_at) VALUES (?, ?, ?, ?)",
+            (output_hash, criteria, json.dumps(verdict, ensure_ascii=False), time.time()),
+        )
+
+
+def judge(input_text: str, actual_text: str, expected: Dict[str, Any], cache: Optional[JudgeCache] = None,
+          tracer: Optional[RunTracer] = None) -> Dict[str, Any]:
+    """
+    심판 판정 + 'cached' 여부. 실패한 판정은 캐시하지 않음
+    (동기 호출: 평가 실행기는 asyncio.to_thread로 호출하고, LangSmith evaluate()에서는 그대로 사용)
+    """
+    keys = (_sha256(actual_text), criteria_hash(input_text, expected))
+    if cache is not None:
+        hit = cache.get(*keys)
+        if hit is not None:
+            return {**hit, "cached": True}
+    chain = judge_prompt | get_evaluator_llm() | JsonOutputParser()
     try:
-        score_data = chain.invoke({
-            "input": input_text,
-            "actual": actual_text,
-            "expected": str(expected)
-        })
+        verdict = chain.invoke(
+            {"input": input_text, "actual": actual_text, "expected": str(expected)},
+            config={"callbacks": [tracer]} if tracer is not None else None,
+        )
     except Exception as e:
         print(f"Evaluation failed: {e}")
-        score_data = {"completeness": 0, "relevance": 0, "hallucination": 0, "format": 0, "reason": "Error"}
+        return {**JUDGE_ERROR, "cached": False}
+    if cache is not None:
+        cache.put(*keys, verdict)
+    return {**verdict, "cached": False}
+
+
+def evaluate_pipeline_output(run, example):
+    """
+    LangSmith evaluate()용 평가 함수
+    run: LangSmith의 실행 객체 (출력값 포함)
+    example: 데이터셋의 예제 객체 (입력값 및 정답 출력값 포함)
+    """
+    # run.outputs가 전체 상태(State)일 수 있으므로 'agent_results'를 추출
+    outputs = run.outputs if run.outputs else {}
+    actual_text = output_text(outputs.get("agent_results", {}))
+    expected = example.outputs if example.outputs else {}
+    input_text = example.inputs["messages"][0]["content"]
 
+    score_data = judge(input_text, actual_text, expected, JudgeCache())
     return {
         "key": "quality_metrics",
         "score": score_data["completeness"], # 주요 점수
@@ -115,7 +244,142 @@ def evaluate_pipeline_output(run, example):
         # 추가 지표는 필요 시 별도로 로깅하거나, 딕셔너리 형태로 반환 가능
     }
 
+
+# --- 3. 평가 실행기 ---
+def token_cost(model_tokens: Dict[str, Dict[str, int]]) -> Optional[float]:
+    """모델별 토큰 -> USD (가격을 모르는 모델이 있으면 None)"""
+    total = 0.0
+    for model, tokens in model_tokens.items():
+        price = next((MODEL_PRICES[name] for name in sorted(MODEL_PRICES, key=len, reverse=True) if model.startswith(name)), None)
+        if price is None:
+            return None
+        prompt, completion, cached = price
+        uncached = tokens["prompt"] - tokens["cached"]
+        total += (uncached * prompt + tokens["completion"] * completion + tokens["cached"] * cached) / 1_000_000
+    return round(total, 6)
+
+
+async def evaluate_example(graph, example: Dict[str, Any], cache: Optional[JudgeCache]) -> Dict[str, Any]:
+    from langchain_core.messages import HumanMessage
+    from blob_store import resolve
+    from retry_budget import new_budget
+
+    run_id = f"eval-{uuid.uuid4().hex[:8]}"
+    tracer = RunTracer(registry=None)
+    row: Dict[str, Any] = {"id": example["id"], "input": example["input"]}
+    started = time.perf_counter()
+    try:
+        output = await graph.ainvoke(
+            {"messages": [HumanMessage(content=example["input"])], "run_id": run_id,
+             "agent_results": None, "plan": None, "budget": new_budget()},
+            {"configurable": {"thread_id": run_id}, "callbacks": [tracer]},
+        )
+        agent_results = {k: resolve(v) for k, v in (output.get("agent_results") or {}).items()}
+        actual_text = output_text(agent_results)
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+        actual_text = ""
+    row["latency_s"] = round(time.perf_counter() - started, 3)
+
+    model_tokens = tracer.model_tokens()
+    row["llm_calls"] = tracer.summary()["totals"].get("llm_calls", 0)
+    row["prompt_tokens"] = sum(t["prompt"] for t in model_tokens.values())
+    row["completion_tokens"] = sum(t["completion"] for t in model_tokens.values())
+    row["cost_usd"] = token_cost(model_tokens)
+
+    judge_tracer = RunTracer(registry=None)
+    verdict = await asyncio.to_thread(judge, example["input"], actual_text, example["expected"], cache, judge_tracer)
+    row.update({metric: verdict.get(metric, 0) for metric in QUALITY_METRICS})
+    row["reason"] = verdict.get("reason", "")
+    row["judge_cached"] = verdict["cached"]
+    row["judge_cost_usd"] = token_cost(judge_tracer.model_tokens()) if not verdict["cached"] else 0.0
+    return row
+
+
+async def run_evaluation(examples: List[Dict[str, Any]], concurrency: int = EVAL_CONCURRENCY,
+                         cache: Optional[JudgeCache] = None, graph=None) -> List[Dict[str, Any]]:
+    """예제를 concurrency개씩 동시에 평가 (파이프라인 실행 -> 심판). 결과는 예제 순서대로"""
+    if graph is None:
+        from pipeline import app
+        graph = app.get()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(example):
+        async with semaphore:
+            row = await evaluate_example(graph, example, cache)
+            cached = " (cached)" if row["judge_cached"] else ""
+            print(f"  ✅ {row['id']}: completeness {row['completeness']} | {row['latency_s']}s{cached}")
+            return row
+
+    with priority("batch"): # 대화형 요청보다 뒤에서 대기
+        return await asyncio.gather(*(one(example) for example in examples))
+
+
+def summarize_rows(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    from bench_suite import percentile
+
+    def mean(key):
+        values = [row[key] for row in rows if isinstance(row.get(key), (int, float))]
+        return round(sum(values) / len(values), 4) if values else None
+
+    latencies = [row["latency_s"] for row in rows]
+    costs = [row["cost_usd"] for row in rows]
+    return {
+        "examples": len(rows),
+        "errors": sum(1 for row in rows if row.get("error")),
+        **{metric: mean(metric) for metric in QUALITY_METRICS},
+        "latency_p50_s": round(percentile(latencies, 50), 3),
+        "latency_p95_s": round(percentile(latencies, 95), 3),
+        "mean_prompt_tokens": mean("prompt_tokens"),
+        "mean_completion_tokens": mean("completion_tokens"),
+        "total_cost_usd": round(sum(costs), 6) if None not in costs else None,
+        "judge_cache_hits": sum(1 for row in rows if row["judge_cached"]),
+        "judge_cost_usd": round(sum(row["judge_cost_usd"] or 0.0 for row in rows), 6),
+    }
+
+
+def print_report(rows: List[Dict[str, Any]], summary: Dict[str, Any]):
+    print(f"\n{'id':<12} {'compl':>5} {'relev':>5} {'hallu':>5} {'fmt':>5} {'latency':>8} {'tokens':>8} {'cost$':>9}  judge")
+    for row in rows:
+        tokens = row["prompt_tokens"] + row["completion_tokens"]
+        cost = f"{row['cost_usd']:.5f}" if row["cost_usd"] is not None else "?"
+        print(f"{row['id'][:12]:<12} {row['completeness']:>5} {row['relevance']:>5} {row['hallucination']:>5} "
+              f"{row['format']:>5} {row['latency_s']:>7.2f}s {tokens:>8} {cost:>9}  "
+              f"{'cached' if row['judge_cached'] else 'called'}{' ❌ ' + row['error'] if row.get('error') else ''}")
+    print(f"📊 {json.dumps(summary, ensure_ascii=False)}")
+
+
 # --- Main Execution ---
+def main():
+    parser = argparse.ArgumentParser(description="파이프라인 품질 평가 (LLM-as-a-Judge, 심판 판정 캐시)")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dataset", help="로컬 JSONL 데이터셋 경로")
+    source.add_argument("--langsmith", nargs="?", const=dataset_name, help="LangSmith 데이터셋 이름")
+    source.add_argument("--create-dataset", action="store_true", help="LangSmith 평가 데이터셋 생성")
+    parser.add_argument("--concurrency", type=int, default=EVAL_CONCURRENCY)
+    parser.add_argument("--limit", type=int, help="앞에서부터 N개 예제만 평가")
+    parser.add_argument("--no-judge-cache", action="store_true", help="캐시된 판정을 쓰지 않고 모두 다시 채점")
+    parser.add_argument("--output", help="결과 JSON 경로 (기본: eval_results/<시각>.json)")
+    args = parser.parse_args()
+
+    if args.create_dataset:
+        create_evaluation_dataset()
+        return
+
+    examples = load_jsonl_examples(args.dataset) if args.dataset else load_langsmith_examples(args.langsmith)
+    examples = examples[:args.limit] if args.limit else examples
+    print(f"🧪 Evaluating {len(examples)} examples (concurrency={args.concurrency})...")
+    rows = asyncio.run(run_evaluation(examples, args.concurrency, None if args.no_judge_cache else JudgeCache()))
+    summary = summarize_rows(rows)
+    print_report(rows, summary)
+
+    output = args.output or os.path.join(EVAL_RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"dataset": args.dataset or args.langsmith, "summary": summary, "examples": rows},
+                  f, ensure_ascii=False, indent=2)
+    print(f"💾 Saved evaluation results to {output}")
+
+
 if __name__ == "__main__":
-    create_evaluation_dataset()
-    print("Evaluation script ready. Use 'langsmith evaluate' or integration tests to run it.")
+    sys.exit(main())
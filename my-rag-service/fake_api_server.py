@@ -0,0 +1,295 @@
+"""
+오프라인 벤치마크용 로컬 가짜 API 서버 (OpenAI 호환 + Tavily)
+
+- POST /v1/chat/completions : 메시지 내용/구조화 출력 스키마 이름으로 규칙(rules)을 찾아 스크립트된 응답을 반환
+                              (규칙이 없으면 JSON 스키마로 예시 객체 생성). response_format(json_schema)과 tools 모두 지원
+- POST /v1/embeddings       : 입력별로 결정적인(같은 입력 -> 같은 벡터) 단위 벡터
+- POST /search              : Tavily 검색 형식의 결과
+엔드포인트(및 규칙)별 지연 시간 분포를 설정할 수 있습니다. (constant / uniform / normal / lognormal + tail)
+
+    python fake_api_server.py --port 8765 --config bench_config.json
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 ...
+"""
+import re
+import sys
+import json
+import math
+import time
+import base64
+import struct
+import random
+import hashlib
+import argparse
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_CONFIG_PATH = "bench_config.json"
+EMBEDDING_DIMENSIONS = 1536
+
+
+def sample_latency(spec: Optional[Dict[str, Any]], rng: random.Random) -> float:
+    """지연 시간 분포 설정에서 한 번 뽑은 값(초)"""
+    if not spec:
+        return 0.0
+    dist = spec.get("dist", "constant")
+    if dist == "uniform":
+        ms = rng.uniform(spec.get("min_ms", 0), spec.get("max_ms", 0))
+    elif dist == "normal":
+        ms = rng.gauss(spec.get("mean_ms", 0), spec.get("std_ms", 0))
+    elif dist == "lognormal":
+        ms = spec.get("median_ms", 0) * math.exp(rng.gauss(0, spec.get("sigma", 0.5)))
+    else:
+        ms = spec.get("ms", 0)
+    tail = spec.get("tail")
+    if tail and rng.random() < tail.get("p", 0):
+        ms += tail.get("ms", 0)  # 드물게 발생하는 느린 응답(straggler)
+    return max(0.0, ms) / 1000
+
+
+def example_from_schema(schema: Dict[str, Any], defs: Optional[Dict[str, Any]] = None) -> Any:
+    """JSON 스키마를 만족하는 최소 예시 객체 (enum은 첫 값, 배열은 원소 1개)"""
+    defs = schema.get("$defs", {}) if defs is None else defs
+    if "$ref" in schema:
+        return example_from_schema(defs[schema["$ref"].split("/")[-1]], defs)
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"]
+            return example_from_schema(options[0], defs) if options else None
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+    if "default" in schema:
+        return schema["default"]
+    kind = schema.get("type", "string")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "string")
+    if kind == "object":
+        return {name: example_from_schema(prop, defs) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [example_from_schema(schema.get("items", {}), defs)]
+    if kind == "integer":
+        return schema.get("minimum", 1)
+    if kind == "number":
+        return float(schema.get("minimum", 1.0))
+    if kind == "boolean":
+        return True
+    if kind == "null":
+        return None
+    return "stub"
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content")
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _structured_request(body: Dict[str, Any]) -> Tuple[Optional[str], Optional[Dict[str, Any]], Optional[str]]:
+    """(스키마 이름, 스키마, 'json_schema' | 'tools') - 구조화 출력 요청이 아니면 (None, None, None)"""
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        spec = response_format.get("json_schema", {})
+        return spec.get("name"), spec.get("schema", {}), "json_schema"
+    tools = body.get("tools") or []
+    if tools and body.get("tool_choice"):
+        function = tools[0].get("function", {})
+        return function.get("name"), function.get("parameters", {}), "tools"
+    return None, None, None
+
+
+def _vector(item: Any, dimensions: int) -> List[float]:
+    seed = int(hashlib.sha256(json.dumps(item, ensure_ascii=False).encode("utf-8")).hexdigest()[:16], 16)
+    rng = random.Random(seed)
+    values = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [v / norm for v in values]
+
+
+class FakeAPIServer:
+    def __init__(self, config: Dict[str, Any], seed: int = 0):
+        self.config = config
+        self.latency = config.get("latency", {})
+        self.rules = [dict(rule, _pattern=re.compile(rule["match"]) if rule.get("match") else None)
+                      for rule in config.get("rules", [])]
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = 0
+        self._calls = defaultdict(int)
+        self._injected = defaultdict(float)
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    # --- 공통 ---
+    def _delay(self, key: str, spec: Optional[Dict[str, Any]], extra: float = 0.0):
+        with self._lock:
+            seconds = sample_latency(spec, self._rng) + extra
+            self._calls[key] += 1
+            self._injected[key] += seconds
+            self._ids += 1
+        time.sleep(seconds)
+        return self._ids
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                key: {"calls": n, "mean_injected_ms": round(self._injected[key] / n * 1000, 1)}
+                for key, n in sorted(self._calls.items())
+            }
+
+    def _match_rule(self, text: str, schema_name: Optional[str]) -> Optional[Dict[str, Any]]:
+        for rule in self.rules:
+            if "schema" in rule and rule["schema"] != schema_name:
+                continue
+            if rule["_pattern"] is not None and not rule["_pattern"].search(text):
+                continue
+            if schema_name is not None and "json" not in rule:
+                continue  # 구조화 요청에는 json 규칙만 적용
+            if schema_name is None and "content" not in rule:
+                continue
+            return rule
+        return None
+
+    # --- 엔드포인트 ---
+    def chat_completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        messages = body.get("messages", [])
+        text = "\n".join(_message_text(m) for m in messages)
+        schema_name, schema, mode = _structured_request(body)
+        rule = self._match_rule(text, schema_name)
+        name = (rule or {}).get("name") or schema_name or "default"
+
+        message: Dict[str, Any] = {"role": "assistant", "content": None}
+        finish_reason = "stop"
+        if schema is not None:
+            payload = rule["json"] if rule else example_from_schema(schema)
+            output = json.dumps(payload, ensure_ascii=False)
+            if mode == "tools":
+                message["tool_calls"] = [{
+                    "id": "call_fake", "type": "function",
+                    "function": {"name": schema_name, "arguments": output},
+                }]
+                finish_reason = "tool_calls"
+            else:
+                message["content"] = output
+        else:
+            output = rule["content"] if rule else self.config.get("default_content", "스텁 응답입니다.")
+            message["content"] = output
+
+        spec = (rule or {}).get("latency") or self.latency.get("chat")
+        completion_tokens = max(1, len(output) // 4)
+        per_token = (spec or {}).get("per_output_token_ms", 0) / 1000
+        request_id = self._delay(f"chat:{name}", spec, per_token * completion_tokens)
+        prompt_tokens = max(1, len(text) // 4)
+        return {
+            "id": f"chatcmpl-fake-{request_id}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason, "logprobs": None}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+            "system_fingerprint": None,
+        }
+
+    def embeddings(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dimensions = body.get("dimensions") or EMBEDDING_DIMENSIONS
+        self._delay("embeddings", self.latency.get("embeddings"))
+        data = []
+        for i, item in enumerate(inputs):
+            vector = _vector(item, dimensions)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"{dimensions}f", *vector)).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        tokens = sum(len(item) if isinstance(item, list) else max(1, len(item) // 4) for item in inputs)
+        return {"object": "list", "data": data, "model": body.get("model", "fake"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    def search(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        query = body.get("query", "")
+        count = body.get("max_results") or self.config.get("search_results", 3)
+        self._delay("search", self.latency.get("search"))
+        digest = hashlib.sha256(query.encode("utf-8")).hexdigest()[:8]
+        results = [{
+            "title": f"{query} - 자료 {i + 1}",
+            "url": f"https://example.com/bench/{digest}/{i}",
+            "content": f"{query}에 대한 벤치마크용 검색 결과 {i + 1}. " + "관련 설명 문장입니다. " * 20,
+            "score": round(0.9 - i * 0.1, 2),
+            "raw_content": None,
+        } for i in range(count)]
+        return {"query": query, "answer": f"{query} 요약", "images": [], "results": results, "response_time": 0.0}
+
+    # --- 서버 ---
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> "FakeAPIServer":
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                path = self.path.split("?")[0].rstrip("/")
+                if path.endswith("/chat/completions"):
+                    payload = server.chat_completion(body)
+                elif path.endswith("/embeddings"):
+                    payload = server.embeddings(body)
+                elif path.endswith("/search"):
+                    payload = server.search(body)
+                else:
+                    self.send_error(404)
+                    return
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass  # 요청마다 로그를 찍지 않음
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def load_config(path: str = DEFAULT_CONFIG_PATH) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="오프라인 벤치마크용 가짜 OpenAI/Tavily 서버")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_PATH)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeAPIServer(load_config(args.config), seed=args.seed).start(args.host, args.port)
+    print(f"🧪 Fake API server listening on {fake.url} (OPENAI_BASE_URL={fake.url}/v1, Tavily={fake.url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+        sys.exit(0)
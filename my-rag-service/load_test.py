@@ -0,0 +1,363 @@
+"""
+비동기 open-loop 부하 테스트 (/api/v1/run -> /status 폴링 -> /result)
+
+응답을 기다리지 않고 정해진 도착 과정(Poisson / bursty / constant)대로 요청을 보내므로, 서버가 느려져도 부하가 줄지 않습니다.
+도착률 단계(--rates)마다 e2e·제출·상태 조회 지연 시간 히스토그램, 대기열 대기 시간(queue wait), 오류율, 서버 RSS 추이를 기록하고
+처리량이 도착률을 따라가지 못하기 시작하는 포화 지점을 찾습니다.
+
+    # 가짜 LLM/검색 서버(fake_api_server) + uvicorn을 직접 띄워서 측정
+    python load_test.py --spawn --workers 2 --rates 0.5 1 2 4 --duration 60
+
+    # 이미 떠 있는 서버 대상 (RSS는 --server-pid로 지정한 프로세스와 자식 프로세스 합계)
+    python load_test.py --base-url http://127.0.0.1:8000/api/v1 --arrival bursty --rates 1 --server-pid 12345
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from bench_suite import WORKER_ENV, summarize
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASE_URL = "http://127.0.0.1:8000/api/v1"
+DEFAULT_RESULTS_DIR = os.path.join(SERVICE_DIR, "load_results")
+TERMINAL_STATUSES = {"completed", "failed", "cancelled", "timed_out"}
+HISTOGRAM_BOUNDS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000, 300000]
+DEFAULT_QUERIES = [
+    "RAG 시스템에서 검색 품질을 높이는 방법은?",
+    "LangGraph 기반 멀티 에이전트 아키텍처를 설명해줘",
+    "벡터 데이터베이스 선택 기준과 구현 예제를 알려줘",
+]
+
+
+def create_server_app():
+    """--spawn 모드의 uvicorn factory: 워커 프로세스마다 Tavily 주소를 가짜 서버로 바꾼 뒤 main.app을 반환"""
+    from langchain_community.utilities import tavily_search
+    tavily_search.TAVILY_API_URL = os.environ["BENCH_TAVILY_URL"]
+    from main import app
+    return app
+
+
+def arrival_times(kind: str, rate: float, duration: float, rng: random.Random,
+                  burst_factor: float = 4.0, burst_period: float = 20.0) -> List[float]:
+    """
+    [0, duration) 안의 도착 시각 목록. 평균 도착률은 모두 rate(초당)입니다.
+    - poisson : 지수 분포 간격
+    - constant: 1/rate 고정 간격
+    - bursty  : burst_period마다 앞쪽 1/burst_factor 구간에만 rate*burst_factor로 몰려서 도착 (on/off Poisson)
+    """
+    times: List[float] = []
+    t = 0.0
+    if kind == "constant":
+        while t < duration:
+            times.append(t)
+            t += 1 / rate
+        return times
+    if kind == "poisson":
+        while True:
+            t += rng.expovariate(rate)
+            if t >= duration:
+                return times
+            times.append(t)
+    on_length = burst_period / burst_factor
+    while True:
+        t += rng.expovariate(rate * burst_factor)
+        if t % burst_period >= on_length:
+            # off 구간이면 다음 burst 시작으로 옮긴 뒤 새 간격을 다시 뽑음 (무기억성, 경계에 도착을 만들지 않음)
+            t = (t // burst_period + 1) * burst_period
+            if t >= duration:
+                return times
+            continue
+        if t >= duration:
+            return times
+        times.append(t)
+
+
+def histogram(values_ms: List[float]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    lower = 0
+    for bound in HISTOGRAM_BOUNDS_MS + [float("inf")]:
+        label = f"<{bound}" if bound != float("inf") else f">={lower}"
+        counts[label] = sum(1 for v in values_ms if lower <= v < bound)
+        lower = bound
+    return counts
+
+
+def process_rss_bytes(pid: int) -> int:
+    """pid와 모든 자식 프로세스의 RSS 합계 (Linux /proc 기준, 읽을 수 없으면 0)"""
+    total = 0
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+                    break
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                total += sum(process_rss_bytes(int(child)) for child in f.read().split())
+    except (OSError, ValueError):
+        pass
+    return total
+
+
+class LoadRecorder:
+    def __init__(self):
+        self.submit: List[float] = []
+        self.status: List[float] = []
+        self.result: List[float] = []
+        self.e2e: List[float] = []
+        self.queue_wait: List[float] = []
+        self.outcomes: Dict[str, int] = {}
+        self.completed_at: List[float] = []
+
+    def outcome(self, name: str):
+        self.outcomes[name] = self.outcomes.get(name, 0) + 1
+
+
+async def drive_run(client: httpx.AsyncClient, query: str, args, recorder: LoadRecorder):
+    """run 하나를 제출하고 끝날 때까지 상태를 폴링한 뒤 결과를 받습니다."""
+    started = time.perf_counter()
+    try:
+        response = await client.post("/run", json={"query": query, "thread_id": f"load-{random.getrandbits(48):x}",
+                                                   "use_cache": args.cache})
+        response.raise_for_status()
+        run_id = response.json()["run_id"]
+    except Exception:
+        recorder.outcome("submit_error")
+        return
+    recorder.submit.append(time.perf_counter() - started)
+
+    state: Dict[str, Any] = {}
+    while True:
+        await asyncio.sleep(args.poll_interval)
+        if time.perf_counter() - started > args.run_timeout:
+            recorder.outcome("client_timeout")
+            return
+        polled = time.perf_counter()
+        try:
+            response = await client.get(f"/status/{run_id}")
+            response.raise_for_status()
+            state = response.json()
+        except Exception:
+            recorder.outcome("status_error")
+            continue
+        recorder.status.append(time.perf_counter() - polled)
+        if state["status"] in TERMINAL_STATUSES:
+            break
+
+    if state.get("queue_wait_seconds") is not None:
+        recorder.queue_wait.append(state["queue_wait_seconds"])
+    if state["status"] != "completed":
+        recorder.outcome(state["status"])
+        return
+    fetched = time.perf_counter()
+    try:
+        response = await client.get(f"/result/{run_id}")
+        response.raise_for_status()
+    except Exception:
+        recorder.outcome("result_error")
+        return
+    recorder.result.append(time.perf_counter() - fetched)
+    recorder.e2e.append(time.perf_counter() - started)
+    recorder.completed_at.append(time.perf_counter())
+    recorder.outcome("completed")
+
+
+async def sample_rss(pid: Optional[int], interval: float, samples: List[List[float]], origin: float):
+    while pid:
+        samples.append([round(time.perf_counter() - origin, 1), round(process_rss_bytes(pid) / 1e6, 1)])
+        await asyncio.sleep(interval)
+
+
+async def run_step(client: httpx.AsyncClient, rate: float, args, pid: Optional[int], rng: random.Random) -> Dict[str, Any]:
+    """도착률 하나로 duration 동안 요청을 보내고, 진행 중인 run이 끝날 때까지 기다린 뒤 요약합니다."""
+    schedule = arrival_times(args.arrival, rate, args.duration, rng, args.burst_factor, args.burst_period)
+    recorder = LoadRecorder()
+    rss: List[List[float]] = []
+    origin = time.perf_counter()
+    sampler = asyncio.create_task(sample_rss(pid, args.rss_interval, rss, origin))
+    tasks = []
+    for i, at in enumerate(schedule):
+        delay = origin + at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(drive_run(client, args.queries[i % len(args.queries)], args, recorder)))
+    await asyncio.gather(*tasks)
+    sampler.cancel()
+
+    # 완료 간격으로 처리량 계산: 포화 전에는 도착 간격과 같고, 포화되면 대기열이 쌓이면서 완료 간격이 벌어짐
+    # (첫 run의 지연 시간을 분모에 넣지 않으므로 duration이 run 지연 시간보다 짧아도 왜곡되지 않음)
+    completed = recorder.outcomes.get("completed", 0)
+    span = max(recorder.completed_at) - min(recorder.completed_at) if completed > 1 else 0.0
+    throughput = (completed - 1) / span if span else 0.0
+    errors = len(schedule) - completed
+    arrival_span = schedule[-1] - schedule[0] if len(schedule) > 1 else 0.0
+    realized = (len(schedule) - 1) / arrival_span if arrival_span else rate
+    e2e_ms = [v * 1000 for v in recorder.e2e]
+    return {
+        "offered_rate": rate,
+        "arrivals": len(schedule),
+        "realized_rate": round(realized, 3), # 실제로 발생한 도착률 (Poisson 표본 오차 반영)
+        "outcomes": recorder.outcomes,
+        "error_rate": round(errors / len(schedule), 4) if schedule else 0.0,
+        "throughput_rps": round(throughput, 3),
+        "e2e": summarize(recorder.e2e),
+        "e2e_histogram_ms": histogram(e2e_ms),
+        "queue_wait": summarize(recorder.queue_wait),
+        "submit": summarize(recorder.submit),
+        "status_poll": summarize(recorder.status),
+        "result_fetch": summarize(recorder.result),
+        "rss_mb": rss,
+        "peak_rss_mb": max((mb for _, mb in rss), default=None),
+    }
+
+
+def saturated(step: Dict[str, Any], args) -> bool:
+    """처리량이 실제 도착률의 90%에 못 미치거나, 오류율/대기열 대기 시간이 기준을 넘으면 포화로 봅니다."""
+    return (step["throughput_rps"] < 0.9 * step["realized_rate"]
+            or step["error_rate"] > args.max_error_rate
+            or step["queue_wait"]["p95_ms"] > args.queue_wait_slo * 1000)
+
+
+def print_step(step: Dict[str, Any], mark: str):
+    e2e, wait = step["e2e"], step["queue_wait"]
+    print(f"{mark} rate {step['offered_rate']}/s (realized {step['realized_rate']}/s): {step['throughput_rps']} runs/s | e2e p50 {e2e['p50_ms']} / "
+          f"p95 {e2e['p95_ms']} / p99 {e2e['p99_ms']} ms | queue wait p95 {wait['p95_ms']} ms | "
+          f"errors {step['error_rate']:.1%} {step['outcomes']} | peak RSS {step['peak_rss_mb']} MB")
+    peak = max(step["e2e_histogram_ms"].values(), default=0) or 1
+    for label, count in step["e2e_histogram_ms"].items():
+        if count:
+            print(f"      {label:>10} ms | {'#' * max(1, round(count / peak * 40))} {count}")
+
+
+def wait_until_ready(base_url: str, timeout: float = 120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/rate_limits", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {base_url} did not become ready within {timeout}s")
+
+
+def spawn_server(args, workdir: str):
+    """가짜 API 서버와 uvicorn(main.app)을 띄우고 (fake_server, process, base_url)을 반환합니다."""
+    from fake_api_server import FakeAPIServer, load_config
+
+    fake = FakeAPIServer(load_config(args.config), seed=args.seed).start()
+    env = dict(os.environ, **WORKER_ENV)
+    # 대기열/저장소 변경의 효과를 보기 위해 run/체크포인트 저장소는 기본값(SQLite, 작업 디렉터리)을 사용
+    for name in ("RUN_STORE_BACKEND", "CHECKPOINT_BACKEND", "RESULT_CACHE"):
+        env.pop(name, None)
+    env["RESULT_CACHE"] = "1" if args.cache else "0"
+    env["OPENAI_BASE_URL"] = env["OPENAI_API_BASE"] = f"{fake.url}/v1"
+    env["BENCH_TAVILY_URL"] = fake.url
+    env["WEB_CONCURRENCY"] = str(args.workers)  # 워커별 리미터 한도 = 전체 한도 / 워커 수
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL  # 서버 로그가 결과 출력을 가리지 않도록
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "load_test:create_server_app", "--factory", "--app-dir", SERVICE_DIR,
+         "--host", "127.0.0.1", "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    base_url = f"http://127.0.0.1:{args.port}/api/v1"
+    try:
+        wait_until_ready(base_url)
+    except Exception:
+        process.terminate()
+        fake.stop()
+        raise
+    return fake, process, base_url
+
+
+async def run_load(args, base_url: str, pid: Optional[int]) -> List[Dict[str, Any]]:
+    rng = random.Random(args.seed)
+    steps = []
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout, limits=limits) as client:
+        for rate in args.rates:
+            print(f"🚦 {args.arrival} arrivals at {rate}/s for {args.duration}s...")
+            step = await run_step(client, rate, args, pid, rng)
+            step["saturated"] = saturated(step, args)
+            print_step(step, "🔥" if step["saturated"] else "✅")
+            steps.append(step)
+            if step["saturated"] and args.stop_at_saturation:
+                break
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FastAPI run 엔드포인트용 비동기 open-loop 부하 테스트")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL)
+    parser.add_argument("--spawn", action="store_true", help="가짜 API 서버 + uvicorn을 직접 띄워서 측정")
+    parser.add_argument("--workers", type=int, default=1, help="--spawn 시 uvicorn 워커 수")
+    parser.add_argument("--port", type=int, default=8765, help="--spawn 시 uvicorn 포트")
+    parser.add_argument("--config", default=os.path.join(SERVICE_DIR, "bench_config.json"), help="가짜 서버 설정")
+    parser.add_argument("--server-log", help="--spawn 시 서버 출력을 저장할 파일 (기본: 버림)")
+    parser.add_argument("--server-pid", type=int, help="RSS를 측정할 서버 프로세스 (--spawn이면 자동)")
+    parser.add_argument("--arrival", choices=["poisson", "bursty", "constant"], default="poisson")
+    parser.add_argument("--rates", nargs="+", type=float, default=[0.5, 1, 2], help="단계별 평균 도착률 (runs/s)")
+    parser.add_argument("--duration", type=float, default=30, help="단계별 요청 발생 시간(초)")
+    parser.add_argument("--burst-factor", type=float, default=4.0)
+    parser.add_argument("--burst-period", type=float, default=20.0)
+    parser.add_argument("--queries", nargs="+", default=DEFAULT_QUERIES)
+    parser.add_argument("--cache", action="store_true", help="결과 캐시 사용 (기본은 매번 그래프 실행)")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--run-timeout", type=float, default=600)
+    parser.add_argument("--request-timeout", type=float, default=30)
+    parser.add_argument("--max-connections", type=int, default=200)
+    parser.add_argument("--rss-interval", type=float, default=1.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.05)
+    parser.add_argument("--queue-wait-slo", type=float, default=5.0, help="대기열 대기 p95 기준(초)")
+    parser.add_argument("--stop-at-saturation", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="결과 JSON 경로 (기본: load_results/<시각>.json)")
+    args = parser.parse_args()
+
+    fake = process = None
+    base_url, pid = args.base_url, args.server_pid
+    with tempfile.TemporaryDirectory(prefix="load-") as workdir:
+        if args.spawn:
+            fake, process, base_url = spawn_server(args, workdir)
+            pid = process.pid
+            print(f"🧪 Spawned server {base_url} (pid {pid}, workers {args.workers}) against fake API {fake.url}")
+        try:
+            steps = asyncio.run(run_load(args, base_url, pid))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+            if fake is not None:
+                print(f"🧪 Fake API calls: {fake.stats()}")
+                fake.stop()
+
+    saturation = next((s["offered_rate"] for s in steps if s["saturated"]), None)
+    print(f"📈 Saturation point: {saturation}/s" if saturation else "📈 No saturation up to the highest rate")
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "base_url": base_url,
+        "arrival": args.arrival,
+        "duration": args.duration,
+        "workers": args.workers if args.spawn else None,
+        "saturation_rate": saturation,
+        "steps": steps,
+    }
+    output = args.output or os.path.join(DEFAULT_RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Saved load test results to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,119 @@
+import os
 import asyncio
+import json
+import time
 import uuid
-from contextlib import asynccontextmanager
-from typing import Dict
+import tracemalloc
+from datetime import datetime
+from contextlib import asynccontextmanager, nullcontext
+from typing import Dict, List, Optional
 
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+from fastapi import FastAPI, BackgroundTasks, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
-from langchain_core.messages import HumanMessage
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from langchain_core.messages import AIMessage, HumanMessage
 from dotenv import load_dotenv
 
-from models import RunRequest, RunResponse, RunStatusResponse, RunResultResponse
-from pipeline import app as graph_app
+from models import (
+    RunRequest, RunResponse, RunStatusResponse, RunResultResponse,
+    BatchRequest, BatchResponse, BatchStatusResponse,
+)
+from pipeline import app as default_app, build_app, models as model_registry
+from context_budget import pop_prompt_tokens
+from blob_store import blob_store, resolve
+from run_store import create_run_store
+from retry_budget import new_budget, latency_tracker, RUN_TARGET_SECONDS
+import common_path  # noqa: F401 (llm_common)
+from llm_common.rate_limiter import openai_limiter, search_limiter, priority, coalesce_prompts
+from llm_common.hedging import hedge_report
+from tracing import RunTracer, TRACE_SPANS, metrics as trace_metrics
+from llm_common.profiling import RunProfiler
+from llm_common.cassette import Cassette, use_cassette, CASSETTE_RECORD, CASSETTE_REPLAY
+from result_cache import ResultCache, RESULT_CACHE
+from run_scheduler import run_scheduler, RUN_SCHEDULER
+from run_control import start_run, finish_run, cancel_run, stop_reason, CANCEL_POLL_SECONDS
+from checkpoint_store import (
+    open_checkpointer,
+    run_compaction_loop,
+    touch_thread,
+    compact_message_history,
+)
 
 # Load environment variables
 load_dotenv()
 
-# In-memory storage for run status and results
+# --- 배치 실행 설정 ---
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4")) # 배치 하나에서 동시에 실행할 항목 수
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "1000"))
+BATCH_RESULTS_WAIT_SECONDS = float(os.getenv("BATCH_RESULTS_WAIT_SECONDS", "3600")) # 결과 스트리밍이 항목 완료를 기다리는 최대 시간 (전체)
+
+# run마다 Chrome/Perfetto trace-event JSON을 저장할지 기본값 (요청의 chrome_trace로 개별 지정, /api/v1/trace/{run_id})
+CHROME_TRACE = os.getenv("CHROME_TRACE", "0") == "1"
+
+# 실행 중 Python 힙 최대치(tracemalloc)를 metrics에 기록할지 여부 (프로세스 전체 기준, 측정용)
+STATE_MEMORY_PROFILE = os.getenv("STATE_MEMORY_PROFILE", "0") == "1"
+
+def checkpoint_size(values: Dict) -> int:
+    """최종 state를 체크포인터 직렬화 방식으로 직렬화했을 때의 바이트 수"""
+    serde = getattr(get_graph_app().checkpointer, "serde", None)
+    if serde is None:
+        return 0
+    try:
+        return len(serde.dumps_typed(values)[1])
+    except Exception:
+        return 0
+
+# 취소/마감으로 끝난 run의 상태 값
+STOP_STATUS = {"cancelled": "cancelled", "deadline": "timed_out"}
+FINISHED_STATUSES = {"completed", "failed", "cancelled", "timed_out"}
+
+def best_effort_doc(agent_results: Dict) -> str:
+    """최종 문서가 없으면(중간에 취소/마감) 지금까지 모인 자료를 이어 붙여 반환합니다."""
+    if agent_results.get("final_doc"):
+        return agent_results["final_doc"]
+    parts = [agent_results[k] for k in ("research", "code", "design") if agent_results.get(k)]
+    return "\n\n".join(parts) if parts else "No final document produced."
+
+# Storage for run status and results (기본 SQLite WAL: 여러 워커가 같은 상태를 공유)
 # Structure: { run_id: { "status": "running"|"completed"|"failed", "result": ..., "error": ... } }
-run_store: Dict[str, Dict] = {}
+run_store = create_run_store()
+
+# 의미 기반 완료 결과 캐시 (SQLite WAL: 여러 워커가 공유)
+result_cache = ResultCache() if RESULT_CACHE else None
+
+def cached_run_result(hit: Dict, execution_time: float) -> Dict:
+    """캐시 hit 결과를 이번 run의 결과로 변환 (metrics에 캐시 여부/유사도 표시)"""
+    result = dict(hit["result"])
+    result["metrics"] = {
+        **result.get("metrics", {}),
+        "execution_time": execution_time,
+        "cached": True,
+        "cache_entry_id": hit["entry_id"],
+        "cache_similarity": hit["similarity"],
+        "timestamp": datetime.now().isoformat(),
+    }
+    return result
+
+# 서버 시작 시 영속 체크포인터로 다시 컴파일되는 그래프
+graph_app = None
+checkpointer = None
+
+def get_graph_app():
+    """lifespan에서 컴파일한 그래프, 없으면(lifespan 없이 실행) 메모리 체크포인터 기본 그래프를 첫 사용 시 컴파일"""
+    return graph_app if graph_app is not None else default_app.get()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # 서버 시작 시 실행
-    print("🚀 RAG Service Started")
-    yield
-    # 서버 종료 시 실행
+    global graph_app, checkpointer
+    # 서버 시작 시 실행: 영속 체크포인터(SQLite WAL)로 그래프 컴파일 + 주기적 보존 정책 적용
+    async with open_checkpointer() as saver:
+        checkpointer = saver
+        graph_app = build_app(saver)
+        compactor = asyncio.create_task(run_compaction_loop(saver))
+        print("🚀 RAG Service Started")
+        yield
+        # 서버 종료 시 실행
+        compactor.cancel()
     print("🛑 RAG Service Stopped")
 
 app = FastAPI(
@@ -41,45 +131,154 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-async def process_graph(run_id: str, query: str, thread_id: str):
-    """LangGraph 파이프라인을 실행하는 백그라운드 태스크"""
-    import time
-    from datetime import datetime
+async def watch_cancel_requests(run_id: str):
+    """
+    다른 워커가 받은 DELETE 요청도 반영되도록 공유 run_store의 취소 요청을 주기적으로 확인합니다.
+    취소 요청을 보면 cancel_run 후 종료 (실행 전이면 태스크가 끝난 것으로 대기 중 취소를 알림)
+    """
+    while True:
+        state = (await run_store.aget(run_id)) or {}
+        if state.get("cancel_requested"):
+            cancel_run(run_id)
+            return
+        await asyncio.sleep(max(CANCEL_POLL_SECONDS, 0.5))
+
+async def process_graph(run_id: str, query: str, thread_id: str, deadline_seconds: float = None, use_cache: bool = True,
+                        chrome_trace: bool = None, profile: bool = False, tenant: str = None, lane: str = "interactive"):
+    """
+    LangGraph 파이프라인을 실행하는 백그라운드 태스크
+    (RUN_SCHEDULER=1) 그래프 실행 전에 run 스케줄러에서 슬롯을 받음: tenant(API 클라이언트, 없으면 thread_id)와 lane(interactive / bulk) 기준 가중 공정 큐
+    """
+    if ((await run_store.aget(run_id)) or {}).get("cancel_requested"):
+        # 시작 전에 취소된 run
+        await run_store.aupdate(run_id, status="cancelled")
+        return
 
+    thread_config = {"configurable": {"thread_id": thread_id}}
+    use_cache = use_cache and result_cache is not None
+    if use_cache:
+        # 캐시 결과는 질의만 보고 만든 것이므로 이전 대화가 없는 스레드에서만 조회/저장
+        snapshot = await get_graph_app().aget_state(thread_config)
+        use_cache = not (snapshot.values or {}).get("messages")
+    if use_cache:
+        # 의미가 같은 질의의 완료 결과가 있으면 그래프를 실행하지 않고 바로 반환 (스케줄러 슬롯을 쓰지 않음)
+        start_time = time.time()
+        hit = await asyncio.to_thread(result_cache.lookup, query)
+        if hit is not None:
+            result = cached_run_result(hit, time.time() - start_time)
+            # 그래프를 실행했을 때처럼 스레드에 질의/답변을 남겨 다음 턴의 대화 기록으로 사용
+            if checkpointer is not None:
+                await touch_thread(checkpointer, thread_id)
+            await get_graph_app().aupdate_state(
+                thread_config,
+                {"messages": [HumanMessage(content=query), AIMessage(content=result["final_doc"])], "next": ["FINISH"]},
+                as_node="supervisor",
+            )
+            print(f"♻️ Run {run_id} served from result cache (similarity {hit['similarity']})")
+            await run_store.aupdate(run_id, started_at=start_time, status="completed", result=result)
+            trace_metrics.inc("rag_runs_total", {"status": "cached"})
+            return
+
+    tenant = tenant or thread_id
+    # 취소 요청 감시는 슬롯 대기 전부터: 대기열에서 취소된 run은 슬롯을 기다리지 않고 바로 cancelled
+    watcher = asyncio.create_task(watch_cancel_requests(run_id))
+    if RUN_SCHEDULER:
+        acquire = asyncio.create_task(run_scheduler.acquire(tenant, lane))
+        await asyncio.wait({acquire, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if not acquire.done():
+            acquire.cancel() # 대기열에서 빠짐 (취소 직전에 슬롯을 받았으면 스케줄러가 반환)
+            await asyncio.gather(acquire, return_exceptions=True)
+            await run_store.aupdate(run_id, status="cancelled")
+            return
+        await acquire
+    if watcher.done():
+        # 슬롯을 받는 사이 취소된 run (start_run 전이라 cancel_run이 반영되지 않았음)
+        if RUN_SCHEDULER:
+            run_scheduler.release(tenant, lane)
+        await run_store.aupdate(run_id, status="cancelled")
+        return
+
+    start_run(run_id, deadline_seconds)
+    # (RunTracer: 모든 노드/LLM/검색 호출을 span으로 기록하고 /metrics 지표에 집계)
+    tracer = RunTracer()
+    profiler = None
+    cassette = None
+    # 여기부터 실패해도 finally에서 슬롯/감시 태스크/run_control을 정리하고 run을 failed로 마무리
     try:
-        run_store[run_id]["status"] = "running" # 상태를 '실행 중'으로 변경
+        # 상태를 '실행 중'으로 변경 (started_at: 대기열 대기 시간(queue wait, 스케줄러 대기 포함) 측정용)
+        await run_store.aupdate(run_id, started_at=time.time(), status="running")
+        # (요청에서 켠 경우에만) 샘플링 CPU 프로파일 + tracemalloc 할당 스냅샷, 결과 저장/직렬화까지 포함
+        profiler = RunProfiler().start() if profile else None
+        # (CASSETTE_RECORD=1) 모든 LLM/검색 호출을 기록, (CASSETTE_REPLAY=경로) 기록된 응답으로 재생
+        if CASSETTE_REPLAY:
+            cassette = Cassette.load(CASSETTE_REPLAY)
+        elif CASSETTE_RECORD:
+            cassette = Cassette("record", meta={"run_id": run_id, "query": query, "thread_id": thread_id})
         
         # [모니터링] 추적 시작
         start_time = time.time()
+        if STATE_MEMORY_PROFILE:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
         
         # LangGraph(pipeline.py)에 전달할 설정 및 입력값
-        config = {"configurable": {"thread_id": thread_id}}
+        config = {"configurable": {"thread_id": thread_id}, "callbacks": [tracer]}
+        
+        # 같은 스레드에 쌓인 오래된 메시지는 이번 입력과 함께 삭제(compaction)
+        history = []
+        if checkpointer is not None:
+            await touch_thread(checkpointer, thread_id)
+            snapshot = await get_graph_app().aget_state(config)
+            history = (snapshot.values or {}).get("messages", [])
+        
         inputs = {
-            "messages": [HumanMessage(content=query)],
+            "messages": compact_message_history(history) + [HumanMessage(content=query)],
             "run_id": run_id, # Creating directory in pipeline
-            "agent_results": {} # Initialize
+            "agent_results": None, # Initialize (이전 run의 결과 초기화)
+            "plan": None, # 새 요청마다 planner가 다시 계획을 세우도록 초기화
+            # 반복 예산: 요청 deadline이 있으면 그보다 짧게, 없으면 목표 시간(RUN_TARGET_SECONDS) 기준
+            "budget": new_budget(min(deadline_seconds, RUN_TARGET_SECONDS) if deadline_seconds else None)
         }
         
         # Invoke the graph# [핵심] pipeline.py에 정의된 그래프 실행!
-        output = await graph_app.ainvoke(inputs, config=config)
+        with use_cassette(cassette) if cassette is not None else nullcontext():
+            output = await get_graph_app().ainvoke(inputs, config=config)
         
         # [모니터링] 추적 종료
         end_time = time.time()
         execution_time = end_time - start_time
         
         # 결과 추출 (Writer가 작성한 최종 문서 등)
-        final_doc = output.get("agent_results", {}).get("final_doc", "No final document produced.")
+        # (Lean State 모드에서는 산출물이 블롭 참조로 저장되어 있으므로 여기서 한 번만 풀어줌)
+        agent_results = {k: resolve(v) for k, v in output.get("agent_results", {}).items()}
+        final_doc = best_effort_doc(agent_results)
+        stopped = stop_reason(run_id) # 'cancelled' / 'deadline' / None
         
         # [모니터링] 메트릭 수집
+        prompt_tokens = pop_prompt_tokens(run_id)
         metrics = {
             "input_length": len(query),
             "execution_time": execution_time,
-            "model_used": "gpt-4o-mini", # 로그 등에서 추출 가능
+            "model_used": tracer.models_used(), # 실제로 호출된 모델 (티어/캐스케이드 반영)
+            "prompt_tokens": prompt_tokens, # 노드별 프롬프트 토큰 수 (tiktoken)
+            "total_prompt_tokens": sum(prompt_tokens.values()),
+            "checkpoint_bytes": checkpoint_size(output), # 최종 state 직렬화 크기
+            "node_latency_estimates": latency_tracker.snapshot(), # 라우터가 반복 여부 판단에 쓰는 노드별 추정 시간 (p90)
+            "trace_summary": tracer.summary(), # 서브그래프/노드별 소요 시간, LLM·검색 호출 수, 토큰
+            "cached": False,
+            "cassette": cassette.stats() if cassette is not None else None, # 기록한 호출 수 / 재생 시 exact·fallback·missed·unused
             "timestamp": datetime.now().isoformat()
         }
+        if STATE_MEMORY_PROFILE:
+            metrics["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
         
         # [모니터링] 품질 경고
         alerts = []
+        if stopped == "cancelled":
+            alerts.append("CANCELLED")
+        elif stopped == "deadline":
+            alerts.append("DEADLINE_EXCEEDED")
         if execution_time > 30:
             alerts.append("SLOW_EXECUTION")
         if len(final_doc) < 50:
@@ -89,26 +288,59 @@ async def process_graph(run_id: str, query: str, thread_id: str):
         if alerts:
             print(f"⚠️ Alerts: {alerts}")
 
-        run_store[run_id]["status"] = "completed"
-        run_store[run_id]["result"] = {
+        result = {
             "final_doc": final_doc,
-            "full_state": output.get("agent_results", {}),
+            "full_state": agent_results,
             "metrics": metrics,
             "alerts": alerts
         }
+        if TRACE_SPANS:
+            result["trace"] = tracer.tree() # run 하나의 span 트리 (노드 > LLM/검색 호출)
+        status = STOP_STATUS.get(stopped, "completed")
+        await run_store.aupdate(run_id, status=status, result=result)
+        trace_metrics.inc("rag_runs_total", {"status": status})
+        trace_metrics.observe("rag_run_duration_seconds", {"status": status}, execution_time)
+        
+        # 끝까지 완료된 정상 결과만 캐시 (취소/마감/짧은 출력 제외)
+        if use_cache and stopped is None and "SHORT_OUTPUT" not in alerts:
+            await asyncio.to_thread(result_cache.put, query, result, run_id)
         
     except Exception as e:
         # 에러 발생 시 처리
         print(f"❌ Error in run {run_id}: {e}")
-        run_store[run_id]["status"] = "failed"
-        run_store[run_id]["error"] = str(e)
+        pop_prompt_tokens(run_id)
+        await run_store.aupdate(run_id, status="failed", error=str(e))
+        trace_metrics.inc("rag_runs_total", {"status": "failed"})
+    finally:
+        watcher.cancel()
+        finish_run(run_id)
+        if RUN_SCHEDULER:
+            run_scheduler.release(tenant, lane)
+        if (CHROME_TRACE if chrome_trace is None else chrome_trace):
+            # 실패/취소된 run도 어디서 시간을 썼는지 볼 수 있도록 항상 저장 (여러 워커가 공유하는 블롭 저장소)
+            trace_json = json.dumps(tracer.chrome_trace(run_id), ensure_ascii=False)
+            await run_store.aupdate(run_id, chrome_trace=await asyncio.to_thread(blob_store.put, trace_json))
+        if cassette is not None and cassette.mode == "record":
+            # 실패/취소된 run도 그때까지의 호출을 재현할 수 있도록 항상 저장
+            await asyncio.to_thread(cassette.save, f"runs/{run_id}/cassette.jsonl.gz")
+        if profiler is not None:
+            # run 산출물 디렉터리(runs/{run_id}/profile)에 저장하고 상태에는 요약만 기록
+            summary = await asyncio.to_thread(profiler.dump, f"runs/{run_id}/profile")
+            print(f"🔬 Run {run_id} Profile: {summary['directory']} (cpu {summary['cpu_seconds']}s / wall {summary['wall_seconds']}s)")
+            await run_store.aupdate(run_id, profile=summary)
 
 @app.post("/api/v1/run", response_model=RunResponse)
-async def submit_run(request: RunRequest, background_tasks: BackgroundTasks):
+async def submit_run(request: RunRequest, background_tasks: BackgroundTasks, profile: bool = False,
+                     x_profile: Optional[str] = Header(None), x_client_id: Optional[str] = Header(None)):
     run_id = str(uuid.uuid4()) # 고유 ID 생성
-    run_store[run_id] = {"status": "pending"} # 대기 상태로 등록
+    # thread_id를 생략한 요청끼리 대화 기록을 섞지 않도록 run마다 새 스레드 (결과 캐시도 이전 대화가 없는 스레드에서만 사용됨)
+    thread_id = request.thread_id or run_id
+    await run_store.acreate(run_id, created_at=time.time()) # 대기 상태로 등록 (created_at: queue wait 측정용)
     
-    background_tasks.add_task(process_graph, run_id, request.query, request.thread_id)
+    # ?profile=true 또는 X-Profile: 1 헤더로 이 run만 프로파일링
+    background_tasks.add_task(process_graph, run_id, request.query, thread_id, request.deadline_seconds,
+                              request.use_cache, request.chrome_trace, profile or x_profile == "1",
+                              x_client_id or thread_id, "interactive") # X-Client-Id 헤더 단위로 공정 스케줄링 (없으면 스레드, 익명 run은 run마다 따로)
     
     # [중요] 백그라운드 작업 등록
     # 클라이언트에게는 바로 응답을 주고, process_graph는 서버 뒤단에서 따로 돕니다.
@@ -118,32 +350,258 @@ async def submit_run(request: RunRequest, background_tasks: BackgroundTasks):
         message="Request submitted successfully. Check status with /api/v1/status/{run_id}"
     )
 
+@app.delete("/api/v1/run/{run_id}", response_model=RunResponse)
+async def delete_run(run_id: str):
+    # 실행 중인 run을 취소: 진행 중인 LLM/검색 호출을 중단하고 지금까지의 결과로 마무리
+    state = await run_store.aget(run_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Run ID not found")
+    if state["status"] in FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Run already finished. Current status: {state['status']}")
+    
+    await run_store.aupdate(run_id, cancel_requested=True) # 다른 워커에서 실행 중이어도 반영되도록 공유 저장소에 기록
+    cancel_run(run_id) # 이 워커에서 실행 중이면 즉시 취소
+    return RunResponse(
+        run_id=run_id,
+        status="cancelling",
+        message="Cancellation requested. The best result so far will be available at /api/v1/result/{run_id}"
+    )
+
 @app.get("/api/v1/status/{run_id}", response_model=RunStatusResponse)
 async def get_status(run_id: str):
     # run_store에서 현재 상태(running/completed 등)를 확인해서 알려줌
-    if run_id not in run_store:
+    state = await run_store.aget(run_id)
+    if state is None:
         raise HTTPException(status_code=404, detail="Run ID not found")
     
-    state = run_store[run_id]
+    queue_wait = None
+    if state.get("created_at") and state.get("started_at"):
+        queue_wait = round(state["started_at"] - state["created_at"], 3)
     return RunStatusResponse(
         run_id=run_id,
         status=state["status"],
         result=state.get("result"),
-        logs=state.get("logs") # Placeholder if we implement log capture
+        logs=state.get("logs"), # Placeholder if we implement log capture
+        queue_wait_seconds=queue_wait,
+        profile=state.get("profile")
     )
 
 @app.get("/api/v1/result/{run_id}")
 async def get_result(run_id: str):
     # 작업이 'completed' 일 때만 결과를 반환
-    if run_id not in run_store:
+    state = await run_store.aget(run_id)
+    if state is None:
         raise HTTPException(status_code=404, detail="Run ID not found")
     
-    state = run_store[run_id]
-    if state["status"] != "completed":
+    if state["status"] not in ("completed", "cancelled", "timed_out") or "result" not in state:
          raise HTTPException(status_code=400, detail=f"Run is not completed. Current status: {state['status']}")
          
     return state["result"]
 
+async def process_batch(batch_id: str, run_ids: List[str], queries: List[str], concurrency: int,
+                        coalesce: bool = False, deadline_seconds: float = None, use_cache: bool = True,
+                        tenant: str = None):
+    """
+    배치의 모든 항목을 최대 concurrency개씩 실행합니다.
+    항목은 같은 프로세스의 그래프/리미터/캐시를 공유하며, 공용 리미터에서는 'batch' 우선순위로 대화형 요청 뒤에 섭니다.
+    run 스케줄러에서는 bulk 레인의 tenant(API 클라이언트, 없으면 배치 단위)로 줄을 섭니다.
+    """
+    tenant = tenant or f"batch:{batch_id}"
+    await run_store.aupdate(batch_id, status="running")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_item(index: int, run_id: str, query: str):
+        async with semaphore:
+            # 항목마다 별도 스레드: 대화 기록이 항목 간에 섞이지 않도록
+            await process_graph(run_id, query, f"batch-{batch_id}-{index}", deadline_seconds, use_cache,
+                                tenant=tenant, lane="bulk")
+
+    with priority("batch"), (coalesce_prompts() if coalesce else nullcontext()) as group:
+        await asyncio.gather(
+            *(run_item(i, run_id, query) for i, (run_id, query) in enumerate(zip(run_ids, queries))),
+            return_exceptions=True,
+        )
+    fields = {"status": "completed"}
+    if group is not None:
+        fields["prompt_calls"] = group.stats()
+        print(f"📦 Batch {batch_id} prompt calls: {group.stats()}")
+    await run_store.aupdate(batch_id, **fields)
+
+def batch_item_line(index: int, run_id: str, state: Optional[Dict]) -> str:
+    state = state or {}
+    result = state.get("result") or {}
+    return json.dumps({
+        "index": index,
+        "run_id": run_id,
+        "query": state.get("query"),
+        "status": state.get("status"),
+        "final_doc": result.get("final_doc"),
+        "metrics": result.get("metrics"),
+        "alerts": result.get("alerts"),
+        "error": state.get("error"),
+    }, ensure_ascii=False) + "\n"
+
+async def iter_batch_results(run_ids: List[str], wait: bool, max_wait: float = None, poll_seconds: float = 1.0):
+    """
+    항목 순서대로 결과를 한 줄씩 내보냅니다. wait=True면 아직 끝나지 않은 항목은 끝날 때까지 기다렸다가 내보냄
+    저장소에 없는 항목은 바로 오류 줄로, 전체 대기 시간(max_wait, 기본 BATCH_RESULTS_WAIT_SECONDS)을 넘기면
+    남은 항목은 기다리지 않고 현재 상태로 내보내 스트림이 끝나지 않는 일이 없게 합니다.
+    """
+    deadline = time.monotonic() + (BATCH_RESULTS_WAIT_SECONDS if max_wait is None else max_wait)
+    for index, run_id in enumerate(run_ids):
+        state = await run_store.aget(run_id)
+        while wait and state is not None and state.get("status") not in FINISHED_STATUSES and time.monotonic() < deadline:
+            await asyncio.sleep(poll_seconds)
+            state = await run_store.aget(run_id)
+        if state is None:
+            state = {"status": "missing", "error": "run not found in store"}
+        elif wait and state.get("status") not in FINISHED_STATUSES:
+            state = {**state, "error": state.get("error") or "timed out waiting for result"}
+        yield batch_item_line(index, run_id, state)
+
+@app.post("/api/v1/batch", response_model=BatchResponse)
+async def submit_batch(request: BatchRequest, background_tasks: BackgroundTasks, x_client_id: Optional[str] = Header(None)):
+    # 여러 질의를 하나의 배치로 제출: 항목마다 run을 만들고 정해진 동시성으로 실행
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="queries must not be empty")
+    if len(request.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"Too many queries (max {BATCH_MAX_QUERIES})")
+    
+    batch_id = str(uuid.uuid4())
+    run_ids = [str(uuid.uuid4()) for _ in request.queries]
+    def create_runs():
+        for run_id, query in zip(run_ids, request.queries):
+            run_store.create(run_id, batch_id=batch_id, query=query, created_at=time.time())
+    await asyncio.to_thread(create_runs)
+    concurrency = max(1, request.concurrency or BATCH_CONCURRENCY)
+    await run_store.acreate(batch_id, kind="batch", run_ids=run_ids, concurrency=concurrency, coalesce_prompts=request.coalesce_prompts)
+    
+    background_tasks.add_task(
+        process_batch, batch_id, run_ids, request.queries, concurrency, request.coalesce_prompts,
+        request.deadline_seconds, request.use_cache, x_client_id
+    )
+    return BatchResponse(
+        batch_id=batch_id,
+        status="submitted",
+        total=len(run_ids),
+        message="Batch submitted. Check progress with /api/v1/batch/{batch_id} and download results from /api/v1/batch/{batch_id}/results"
+    )
+
+def batch_statuses(run_ids: List[str]) -> List[str]:
+    return [(run_store.get(run_id) or {}).get("status", "pending") for run_id in run_ids]
+
+async def get_batch_state(batch_id: str) -> Dict:
+    state = await run_store.aget(batch_id)
+    if state is None or state.get("kind") != "batch":
+        raise HTTPException(status_code=404, detail="Batch ID not found")
+    return state
+
+@app.get("/api/v1/batch/{batch_id}", response_model=BatchStatusResponse)
+async def get_batch_status(batch_id: str):
+    # 항목(run) 상태를 모아 전체 진행률 계산 (공유 run_store 기준이라 어느 워커든 응답 가능)
+    state = await get_batch_state(batch_id)
+    counts: Dict[str, int] = {}
+    for status in await asyncio.to_thread(batch_statuses, state["run_ids"]):
+        counts[status] = counts.get(status, 0) + 1
+    total = len(state["run_ids"])
+    finished = sum(n for status, n in counts.items() if status in FINISHED_STATUSES)
+    return BatchStatusResponse(
+        batch_id=batch_id,
+        status=state["status"],
+        total=total,
+        counts=counts,
+        progress=round(finished / total, 4) if total else 1.0,
+        prompt_calls=state.get("prompt_calls")
+    )
+
+@app.get("/api/v1/batch/{batch_id}/results")
+async def get_batch_results(batch_id: str, wait: bool = True):
+    # 모든 항목 결과를 하나의 JSONL로 스트리밍 (wait=false면 현재 상태 그대로 즉시 반환)
+    state = await get_batch_state(batch_id)
+    return StreamingResponse(
+        iter_batch_results(state["run_ids"], wait),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="batch-{batch_id}.jsonl"'}
+    )
+
+@app.get("/api/v1/cache")
+async def get_cache_stats():
+    # 결과 캐시 항목 수와 hit 비율 (모든 워커 합계)
+    if result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **result_cache.stats()}
+
+@app.delete("/api/v1/cache")
+async def invalidate_cache(query: Optional[str] = None, entry_id: Optional[str] = None):
+    # entry_id 항목, 또는 query와 같거나 유사한 항목을 무효화 (둘 다 없으면 전체 삭제)
+    if result_cache is None:
+        raise HTTPException(status_code=404, detail="Result cache is disabled")
+    removed = await asyncio.to_thread(result_cache.invalidate, query, entry_id)
+    return {"removed": removed, **result_cache.stats()}
+
+@app.get("/api/v1/rate_limits")
+async def get_rate_limits():
+    # 공용 리미터의 우선순위 클래스별 대기 시간(queue wait) 지표
+    return {
+        "openai": openai_limiter.stats(),
+        "tavily": search_limiter.stats()
+    }
+
+@app.get("/api/v1/hedging")
+async def get_hedging():
+    # 호출 이름별 헤지 발동 비율과 p99 개선폭 (헤징이 없었을 때 vs 있을 때)
+    return hedge_report()
+
+@app.get("/api/v1/scheduler")
+async def get_scheduler():
+    # 레인별 실행/대기 수와 테넌트별 스케줄러 대기 시간 (mean/p95/max, 이 워커 기준)
+    if not RUN_SCHEDULER:
+        return {"enabled": False}
+    return {"enabled": True, **run_scheduler.stats()}
+
+@app.get("/api/v1/models")
+async def get_models():
+    # 티어별 모델/호출 수/지연 시간/토큰, 노드별 캐스케이드와 상위 티어로 넘어간 횟수
+    return model_registry.report()
+
+@app.get("/api/v1/trace/{run_id}")
+async def get_chrome_trace(run_id: str):
+    # Chrome/Perfetto trace-event JSON 다운로드 (chrome://tracing 또는 ui.perfetto.dev에서 열기)
+    state = await run_store.aget(run_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Run ID not found")
+    if not state.get("chrome_trace"):
+        if state["status"] not in FINISHED_STATUSES:
+            raise HTTPException(status_code=409, detail=f"Run not finished yet. Current status: {state['status']}")
+        raise HTTPException(status_code=404, detail="No trace recorded for this run (set chrome_trace=true or CHROME_TRACE=1)")
+    try:
+        trace_json = await asyncio.to_thread(resolve, state["chrome_trace"])
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Trace expired (blobs are kept for BLOB_TTL_SECONDS)")
+    return Response(
+        content=trace_json,
+        media_type="application/json",
+        headers={"Content-Disposition": f'attachment; filename="trace-{run_id}.json"'},
+    )
+
+def model_registry_metrics() -> str:
+    """모델 레지스트리의 노드별 캐스케이드 에스컬레이션 횟수를 Prometheus 형식으로"""
+    lines = [
+        "# HELP rag_model_escalations_total Cascade calls that fell through to a higher model tier",
+        "# TYPE rag_model_escalations_total counter",
+    ]
+    for node, info in sorted(model_registry.report()["nodes"].items()):
+        lines.append(f'rag_model_escalations_total{{node="{node}"}} {info["escalations"]}')
+    return "\n".join(lines) + "\n"
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus 스크레이프용 (워커 프로세스 단위 지표: 노드/LLM/검색 지연 시간, 토큰, 재시도, 오류)
+    return PlainTextResponse(
+        trace_metrics.render() + model_registry_metrics(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
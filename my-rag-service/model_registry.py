@@ -0,0 +1,19 @@
+import common_path  # noqa: F401 (llm_common)
+from llm_common.model_registry import ModelRegistry, load_json_env
+
+# --- 모델 티어 설정 (my-rag-service) ---
+# 레지스트리/캐스케이드 구현은 llm_common.model_registry, 여기에는 이 앱의 티어 구성만 둡니다.
+# 티어 이름 -> 모델 이름. MODEL_TIERS='{"fast": "gpt-4.1-nano", "standard": "gpt-4o-mini"}' 형식으로 덮어씁니다.
+DEFAULT_MODEL_TIERS = {"fast": "gpt-4.1-nano", "standard": "gpt-4o-mini"}
+# 노드 -> 시도할 티어 순서(캐스케이드). 앞 티어의 출력이 검증을 통과하지 못하면 다음 티어로 다시 호출합니다.
+# 짧은 분류/판정성 호출만 저렴한 티어부터 시작하고, 나머지 노드는 DEFAULT_MODEL_TIER 하나만 사용합니다.
+DEFAULT_NODE_TIERS = {
+    "planner": ["fast", "standard"],
+    "supervisor": ["fast", "standard"],
+    "research_reflect": ["fast", "standard"],
+    "code_reflect": ["fast", "standard"],
+    "designer_reflect": ["fast", "standard"],
+}
+
+MODEL_TIERS = load_json_env("MODEL_TIERS", DEFAULT_MODEL_TIERS)
+NODE_TIERS = load_json_env("NODE_TIERS", DEFAULT_NODE_TIERS)
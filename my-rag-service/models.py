@@ -3,7 +3,10 @@ from typing import Optional, Dict, Any, List
 
 class RunRequest(BaseModel):
     query: str
-    thread_id: Optional[str] = "default_thread"
+    thread_id: Optional[str] = None # 대화를 이어갈 스레드. 생략하면 run마다 새 스레드(run_id)
+    deadline_seconds: Optional[float] = None # 이 시간이 지나면 진행 중인 호출을 중단하고 지금까지의 결과로 마무리
+    use_cache: bool = True # 의미가 같은 이전 질의의 완료 결과가 있으면 바로 반환 (RESULT_CACHE=1일 때)
+    chrome_trace: Optional[bool] = None # Chrome trace-event JSON 저장 여부 (None이면 CHROME_TRACE 환경 변수)
 
 class RunResponse(BaseModel):
     run_id: str
@@ -15,6 +18,29 @@ class RunStatusResponse(BaseModel):
     status: str
     result: Optional[Dict[str, Any]] = None
     logs: Optional[List[str]] = None
+    queue_wait_seconds: Optional[float] = None # 제출(pending)부터 실행 시작까지 대기한 시간
+    profile: Optional[Dict[str, Any]] = None # 프로파일링한 run의 요약 (전체는 runs/{run_id}/profile)
 
 class RunResultResponse(BaseModel):
     result: Dict[str, Any]
+
+class BatchRequest(BaseModel):
+    queries: List[str]
+    concurrency: Optional[int] = None # 동시에 실행할 항목 수 (기본값 BATCH_CONCURRENCY)
+    coalesce_prompts: bool = False # 항목 간 동일한 프롬프트(LLM 호출)를 한 번만 호출하고 결과를 공유
+    deadline_seconds: Optional[float] = None # 항목(run)별 마감 시간
+    use_cache: bool = True # 항목별 결과 캐시 사용 여부
+
+class BatchResponse(BaseModel):
+    batch_id: str
+    status: str
+    total: int
+    message: str
+
+class BatchStatusResponse(BaseModel):
+    batch_id: str
+    status: str
+    total: int
+    counts: Dict[str, int] # 항목 상태별 개수 (pending/running/completed/failed/...)
+    progress: float # 끝난 항목 비율 (0.0 ~ 1.0)
+    prompt_calls: Optional[Dict[str, int]] = None # coalesce_prompts 사용 시 전체/병합된 LLM 호출 수
@@ -1,17 +1,55 @@
 import os
+import re
 import json
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from typing import Annotated, List, TypedDict, Dict, Any, Literal
 from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
 from langgraph.graph import StateGraph, END, START
 from langgraph.graph.message import add_messages
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
 from pydantic import BaseModel, Field
-from langchain_community.tools.tavily_search import TavilySearchResults
 from langgraph.checkpoint.memory import MemorySaver
 from dotenv import load_dotenv
 
+from retrieval import (
+    LocalCorpusRetriever,
+    coverage_score,
+    web_results_to_chunks,
+    dedupe_chunks,
+    format_chunks,
+    LOCAL_COVERAGE_THRESHOLD,
+    LOCAL_MERGE_THRESHOLD,
+)
+from context_budget import (
+    ContextBudget,
+    compress_extractive,
+    count_tokens,
+    truncate_lines,
+    record_prompt_tokens,
+    WRITER_CONTEXT_BUDGET,
+    RESEARCH_DATA_BUDGET,
+    REVIEW_CONTEXT_BUDGET,
+)
+from validators import validate_python, validate_mermaid
+from blob_store import blob_store, resolve
+from run_control import RunCancelled, call_cancellable, should_stop
+from retry_budget import (
+    can_afford,
+    track_latency,
+    WRITER_QUALITY_THRESHOLD,
+    WRITER_RESERVE_NODES,
+)
+import common_path  # noqa: F401 (llm_common)
+from llm_common.rate_limiter import search_limiter
+from llm_common.cassette import taped
+from llm_common.model_registry import ModelRegistry
+from llm_common.hedging import hedged
+from llm_common.lazy_init import Lazy
+from model_registry import MODEL_TIERS, NODE_TIERS
+
 load_dotenv()
 
 # --- Helper Functions ---
@@ -29,17 +67,137 @@ def save_step_to_file(run_id, step_name, result):
         "step_name": step_name,
         "result": result
     }
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    def write(_):
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+    # 추적(tracing)에서 파일 쓰기 span으로 보이도록 'io:' 이름의 Runnable로 실행
+    RunnableLambda(write, name=f"io:write {step_name}").invoke(None)
+
+# --- Lean State 모드 ---
+# 켜져 있으면 서브그래프 로그를 state에 쌓지 않고(TRACE_SINK=1일 때만 파일로 기록),
+# 큰 산출물은 블롭 저장소에 한 번만 저장한 뒤 state에는 참조 ID만 남깁니다.
+LEAN_STATE = os.getenv("LEAN_STATE", "0") == "1"
+TRACE_SINK = os.getenv("TRACE_SINK", "0") == "1"
+
+def append_trace(run_id, name, content):
+    """runs/{run_id}/trace.jsonl에 단계 로그를 한 줄씩 추가합니다."""
+    directory = f"runs/{run_id}"
+    os.makedirs(directory, exist_ok=True)
+    import time
+    with open(f"{directory}/trace.jsonl", "a", encoding="utf-8") as f:
+        f.write(json.dumps({"ts": time.time(), "name": name, "content": content}, ensure_ascii=False) + "\n")
+
+def step_log(state, content: str, name: str) -> Dict[str, Any]:
+    """노드 반환값에 병합할 로그 업데이트. Lean State 모드에서는 state 대신 외부 싱크로만 보냅니다."""
+    if not LEAN_STATE:
+        return {"logs": [AIMessage(content=content, name=name)]}
+    if TRACE_SINK and state.get("run_id"):
+        append_trace(state["run_id"], name, content)
+    return {}
+
+def store_artifact(text: str) -> str:
+    """Lean State 모드에서는 산출물을 블롭 저장소에 넣고 참조 ID를 반환합니다."""
+    if LEAN_STATE and text:
+        return blob_store.put(text)
+    return text
+
+def _call_model(run_id: str, node_name: str, hedge: bool, fn, *args):
+    if hedge:
+        return call_cancellable(run_id, hedged, node_name, fn, *args)
+    return call_cancellable(run_id, fn, *args)
+
+def run_chain(prompt, inputs: Dict[str, Any], node_name: str, run_id: str = None, hedge: bool = False, accept=None):
+    """
+    프롬프트 | 노드 티어 모델 | 파서 체인을 실행하고, 렌더링된 프롬프트의 토큰 수를 노드별로 기록합니다.
+    hedge=True: 짧은 분류성 호출은 느린 응답에 대비해 헤징(LLM_HEDGING=1일 때)
+    accept: 캐스케이드 노드에서 저렴한 티어의 출력을 그대로 쓸지 판단하는 검증 함수 (False면 상위 티어로 재시도)
+    """
+    record_prompt_tokens(run_id, node_name, prompt.format(**inputs))
+    return models.invoke(
+        node_name,
+        lambda model: _call_model(run_id, node_name, hedge, (prompt | model | StrOutputParser()).invoke, inputs),
+        accept,
+    )
+
+def run_chain_batch(prompt, inputs_list: List[Dict[str, Any]], node_name: str, run_id: str = None):
+    """여러 입력에 대해 체인을 병렬 실행합니다. (프롬프트 토큰은 입력마다 기록)"""
+    for inputs in inputs_list:
+        record_prompt_tokens(run_id, node_name, prompt.format(**inputs))
+    return models.invoke(
+        node_name,
+        lambda model: call_cancellable(run_id, (prompt | model | StrOutputParser()).batch, inputs_list),
+    )
+
+def run_structured(schema, messages: List[BaseMessage], node_name: str, run_id: str = None, hedge: bool = False):
+    """구조화 출력 호출. 스키마 파싱에 실패하면(예외 또는 다른 타입) 상위 티어로 재시도합니다."""
+    return models.invoke(
+        node_name,
+        lambda model: _call_model(run_id, node_name, hedge, model.with_structured_output(schema).invoke, messages),
+        lambda result: isinstance(result, schema),
+    )
+
+def is_pass_or_fail(text: str) -> bool:
+    """'PASS'/'FAIL' 중 정확히 하나로 답했는지 (저렴한 티어 판정 출력 검증)"""
+    return ("PASS" in text) != ("FAIL" in text)
+
+def has_review_status(text: str) -> bool:
+    """리뷰 출력이 '상태: PASS/FAIL' 형식을 지켰는지 (저렴한 티어 리뷰 출력 검증)"""
+    return re.search(r"상태:\s*\[?\s*(PASS|FAIL)", text) is not None
+
+def invoke_subgraph(subgraph, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """서브그래프를 실행합니다. 실행이 취소/마감되면 마지막으로 완료된 단계의 state(지금까지의 최선 결과)를 반환합니다."""
+    if isinstance(subgraph, Lazy):
+        subgraph = subgraph.get() # 첫 호출 시 컴파일
+    last = dict(inputs)
+    try:
+        for values in subgraph.stream(inputs, stream_mode="values"):
+            last = values
+    except RunCancelled as e:
+        print(f"⏹️ 서브그래프 중단 ({e}), 마지막 결과로 마무리")
+    return last
+
+# --- 리뷰 설정 ---
+# 로컬 정적 검증을 통과한 결과에 대해서만 LLM 의미 리뷰를 추가로 수행할지 여부
+CODE_SEMANTIC_REVIEW = os.getenv("CODE_SEMANTIC_REVIEW", "1") == "1"
+DESIGN_SEMANTIC_REVIEW = os.getenv("DESIGN_SEMANTIC_REVIEW", "1") == "1"
 
 # --- LLM & Tools ---
-llm = ChatOpenAI(model='gpt-4o-mini', temperature=0)
-# Ensure Tavily API Key is set in env or handle error
-try:
-    search_tool = TavilySearchResults(k=3)
-except Exception:
-    print("Warning: Tavily API Key missing, search will fail if called.")
-    search_tool = None # Handle appropriately in node
+# 노드별 모델 티어/캐스케이드는 model_registry에서 관리하며, 모든 호출은 공용 리미터(RPM/TPM)를 거칩니다.
+models = ModelRegistry(MODEL_TIERS, NODE_TIERS, no_escalate=(RunCancelled,))
+# 클라이언트와 컴파일된 그래프는 import 시점이 아니라 첫 사용 시점에 한 번만 생성합니다. (lazy_init.Lazy)
+def _create_search_tool():
+    # langchain_community import 자체가 무거우므로 함께 미룸
+    from langchain_community.tools.tavily_search import TavilySearchResults
+    # Ensure Tavily API Key is set in env or handle error
+    try:
+        return TavilySearchResults(k=3)
+    except Exception:
+        print("Warning: Tavily API Key missing, search will fail if called.")
+        return None # Handle appropriately in node
+
+_search_tool = Lazy(_create_search_tool, "tavily")
+# 로컬 PDF 코퍼스 검색기 (인덱스가 없으면 자동 비활성화)
+_local_retriever = Lazy(LocalCorpusRetriever, "local_retriever")
+
+def get_search_tool():
+    return _search_tool.get()
+
+def get_local_retriever() -> LocalCorpusRetriever:
+    return _local_retriever.get()
+
+def local_search(topic: str):
+    """로컬 코퍼스 검색. 추적(tracing)에서 검색 span으로 기록되도록 'search:' 이름의 Runnable로 실행합니다."""
+    return RunnableLambda(lambda q: taped("search", "local_corpus", q, lambda: get_local_retriever().search(q)),
+                          name="search:local_corpus").invoke(topic)
+
+def web_search(query: str, run_id: str = None):
+    """Tavily 검색 (공용 검색 리미터 + 취소 가능, 카세트가 켜져 있으면 기록/재생)"""
+    def limited_search(q):
+        search_limiter.acquire() # 대기하는 사이 취소된 run은 검색하지 않음 (call_cancellable의 stop_check)
+        return get_search_tool().invoke(q)
+
+    # 리미터 대기도 취소 가능한 호출 안에서 (대기 중 취소/마감되면 바로 RunCancelled)
+    return taped("search", "tavily", query, lambda: call_cancellable(run_id, limited_search, query))
 
 # ==========================================
 # 1. Research Subgraph
@@ -51,28 +209,56 @@ class ResearchState(TypedDict):
     quality: str
     retry_count: int
     run_id: str # Added to pass run_id down
+    sources: List[Dict[str, Any]] # 청크 출처 정보 (local/web)
+    local_coverage: float
+    budget: Dict[str, float] # run 반복 예산 (MainState에서 전달)
 
+@track_latency("research_execute")
 def research_execute_node(state: ResearchState):
     print(f"[Research] 정보 수집 중... Topic: {state['topic']}")
     topic = state["topic"]
     
-    try:
-        if search_tool:
-            results = search_tool.invoke(topic)
-            content = "\\n".join([r["content"] for r in results])
-        else:
-            content = "검색 도구를 사용할 수 없습니다 (API Key Missing)."
-    except Exception as e:
-        content = f"검색 실패: {str(e)}"
+    # 1. 로컬 코퍼스 우선 검색
+    local_chunks = local_search(topic)
+    coverage = coverage_score(local_chunks)
+    print(f"      ㄴ 로컬 커버리지: {coverage:.2f} ({len(local_chunks)}개 청크)")
+    
+    if coverage >= LOCAL_COVERAGE_THRESHOLD:
+        # 로컬 자료만으로 충분 -> 웹 검색 생략
+        chunks = local_chunks
+    else:
+        # 2. 커버리지가 낮으면 웹 검색으로 보완 (중간 구간은 로컬 결과와 병합)
+        chunks = local_chunks if coverage >= LOCAL_MERGE_THRESHOLD else []
+        try:
+            if get_search_tool():
+                results = web_search(topic, state.get("run_id"))
+                chunks = chunks + web_results_to_chunks(results)
+        except Exception as e:
+            print(f"      ㄴ 웹 검색 실패: {e}")
+    
+    if chunks:
+        content = format_chunks(chunks)
+    elif get_search_tool() is None:
+        content = "검색 도구를 사용할 수 없습니다 (API Key Missing)."
+    else:
+        content = "검색 실패: 수집된 자료가 없습니다."
         
     return {
         "raw_data": content, 
-        "logs": [AIMessage(content=f"검색 완료: {len(content)}자", name="researcher")]
+        "sources": chunks,
+        "local_coverage": coverage,
+        **step_log(state, f"검색 완료: {len(content)}자 (local coverage {coverage:.2f})", "researcher")
     }
 
+@track_latency("research_reflect")
 def research_reflect_node(state: ResearchState):
     print("[Research Sub] 정보 충분성 평가 중...")
     
+    # 로컬 코퍼스가 주제를 충분히 커버하면 LLM 평가 없이 통과
+    if state.get("local_coverage", 0.0) >= LOCAL_COVERAGE_THRESHOLD:
+        print("      ㄴ 평가 결과: PASS (로컬 코퍼스 커버리지 충분)")
+        return {"quality": "PASS", **step_log(state, "평가 결과: PASS (local)", "evaluator")}
+    
     chain = ChatPromptTemplate.from_template(
         """당신은 엄격한 연구 팀장입니다. 수집된 자료가 주제 '{topic}'을 설명하기에 충분한지 평가하세요.
         
@@ -81,14 +267,16 @@ def research_reflect_node(state: ResearchState):
         
         자료가 주제를 포괄적으로 설명하면 'PASS', 부족하거나 편향되었다면 'FAIL'이라고만 답하세요.
         """
-    ) | llm | StrOutputParser()
+    )
     
-    evaluation = chain.invoke({"topic": state["topic"], "data": state["raw_data"]})
+    data = compress_extractive(state["raw_data"], RESEARCH_DATA_BUDGET, state["topic"])
+    evaluation = run_chain(chain, {"topic": state["topic"], "data": data}, "research_reflect", state.get("run_id"), hedge=True, accept=is_pass_or_fail)
     quality = "PASS" if "PASS" in evaluation else "FAIL"
     
     print(f"      ㄴ 평가 결과: {quality}")
-    return {"quality": quality, "logs": [AIMessage(content=f"평가 결과: {quality}", name="evaluator")]}
+    return {"quality": quality, **step_log(state, f"평가 결과: {quality}", "evaluator")}
 
+@track_latency("research_revise")
 def research_revise_node(state: ResearchState):
     print(" [Research] 추가 검색(보완) 수행 중...")
     topic = state["topic"]
@@ -104,37 +292,44 @@ def research_revise_node(state: ResearchState):
         위 자료에서 빠진 내용이나 더 구체적인 정보가 필요한 부분을 파악하여,
         검색 엔진에 입력할 '구체적인 추가 검색어' 1개를 제안해주세요. (설명 없이 검색어만 출력)
         """
-    ) | llm | StrOutputParser()
+    )
     
-    new_query = query_chain.invoke({"topic": topic, "data": current_data[:2000]})
+    data = compress_extractive(current_data, RESEARCH_DATA_BUDGET // 2, topic)
+    new_query = run_chain(query_chain, {"topic": topic, "data": data}, "research_revise", state.get("run_id"))
     print(f"      ㄴ생성된 추가 검색어: '{new_query}'")
     
+    new_chunks = []
     try:
-        if search_tool:
-            search_results = search_tool.invoke(new_query)
-            new_content = "\\n".join([f"- {r['content']}" for r in search_results])
+        if get_search_tool():
+            new_chunks = web_results_to_chunks(web_search(new_query, state.get("run_id")))
+            new_content = format_chunks(new_chunks)
         else:
             new_content = "검색 도구 없음"
     except Exception as e:
         new_content = f"추가 검색 실패: {str(e)}"
         
     combined_data = current_data + f"\\n\\n[추가 검색 결과 ({new_query})]:\\n" + new_content
+    # 누적 자료가 무한히 커지지 않도록 토큰 예산 안으로 압축
+    combined_data = compress_extractive(combined_data, RESEARCH_DATA_BUDGET, topic)
     
     return {
         "raw_data": combined_data, 
+        "sources": state.get("sources", []) + new_chunks,
         "retry_count": state.get("retry_count", 0) + 1,
-        "logs": [AIMessage(content=f"추가 검색 완료: {new_query}", name="researcher")]
+        **step_log(state, f"추가 검색 완료: {new_query}", "researcher")
     }
 
+@track_latency("research_submit")
 def research_submit_node(state: ResearchState):
     summary_chain = ChatPromptTemplate.from_template(
         "다음 자료를 바탕으로 '{topic}'에 대한 핵심 내용을 요약 정리해줘:\\n\\n{data}"
-    ) | llm | StrOutputParser()
+    )
     
-    final_summary = summary_chain.invoke({"topic": state["topic"], "data": state["raw_data"]})
+    data = compress_extractive(state["raw_data"], RESEARCH_DATA_BUDGET, state["topic"])
+    final_summary = run_chain(summary_chain, {"topic": state["topic"], "data": data}, "research_submit", state.get("run_id"))
     
     if "run_id" in state:
-        save_step_to_file(state["run_id"], "Research_Done", {"summary": final_summary})
+        save_step_to_file(state["run_id"], "Research_Done", {"summary": final_summary, "sources": state.get("sources", [])})
         
     return {"raw_data": final_summary}
 
@@ -148,19 +343,142 @@ research_workflow.add_edge(START, "execute")
 research_workflow.add_edge("execute", "reflect")
 
 def route_research(state: ResearchState):
-    if state["quality"] == "FAIL" and state.get("retry_count", 0) < 1:
+    if should_stop(state.get("run_id")):
+        return "submit"
+    # 보완 검색 1회 + 요약/Writer 초안까지 남은 시간 안에 들어올 때만 재검색
+    if state["quality"] == "FAIL" and can_afford(
+        state.get("budget"), state.get("retry_count", 0), ["research_revise"],
+        reserve_nodes=("research_submit",) + WRITER_RESERVE_NODES, max_rounds=1,
+    ):
         return "revise"
     return "submit"
 
 research_workflow.add_conditional_edges("reflect", route_research, {"submit": "submit", "revise": "revise"})
 research_workflow.add_edge("revise", "submit")
 research_workflow.add_edge("submit", END)
-research_app = research_workflow.compile()
+research_app = Lazy(research_workflow.compile, "research_app")
+
+
+# --- 병렬 다중 쿼리 리서치 (reflect -> revise 순차 루프 대체) ---
+# 'multi_query': 하위 검색어를 한 번에 만들어 동시에 검색 / 'reflect': 검색 -> 충분성 평가 -> 보완 검색 (기존 방식)
+RESEARCH_MODE = os.getenv("RESEARCH_MODE", "multi_query")
+RESEARCH_MAX_QUERIES = int(os.getenv("RESEARCH_MAX_QUERIES", "4"))
+# 하위 검색어 중 고유한 자료를 하나 이상 가져온 비율이 이 값 미만이면 2차 검색을 수행합니다.
+RESEARCH_COVERAGE_THRESHOLD = float(os.getenv("RESEARCH_COVERAGE_THRESHOLD", "0.6"))
+
+class ResearchQueries(BaseModel):
+    queries: List[str] = Field(description="주제의 서로 다른 측면(정의, 원리, 사례, 비교, 최신 동향 등)을 다루는 검색어 목록")
+
+def generate_sub_queries(state: ResearchState) -> List[str]:
+    """주제를 서로 겹치지 않는 하위 검색어들로 분해합니다. (LLM 1회)"""
+    system_prompt = f"""당신은 노련한 리서처입니다.
+    주제 '{state["topic"]}'를 포괄적으로 조사하기 위해 검색 엔진에 입력할 검색어를 최대 {RESEARCH_MAX_QUERIES}개 제안하세요.
+    각 검색어는 서로 다른 측면을 다루어야 하며, 주제 자체를 그대로 반복하지 마세요.
+    """
+    record_prompt_tokens(state.get("run_id"), "research_queries", system_prompt)
+    try:
+        result = run_structured(ResearchQueries, [SystemMessage(content=system_prompt)], "research_queries", state.get("run_id"))
+        queries = [q.strip() for q in result.queries if q and q.strip()]
+    except Exception as e:
+        print(f"      ㄴ 하위 검색어 생성 실패: {e}")
+        queries = []
+    return list(dict.fromkeys(queries))[:RESEARCH_MAX_QUERIES]
+
+def _safe_search(query: str, run_id: str = None) -> List[Dict[str, Any]]:
+    try:
+        return web_results_to_chunks(web_search(query, run_id), query=query)
+    except Exception as e:
+        print(f"      ㄴ 검색 실패 ({query}): {e}")
+        return []
+
+def _search_wave(queries: List[str], pool: ThreadPoolExecutor, run_id: str = None) -> Dict[str, List[Dict[str, Any]]]:
+    # 호출마다 컨텍스트를 복사해 넘겨야 추적 콜백(RunTracer, LangSmith)이 검색 호출까지 이어짐
+    futures = {q: pool.submit(contextvars.copy_context().run, _safe_search, q, run_id) for q in queries}
+    return {q: f.result() for q, f in futures.items()}
+
+def _query_coverage(queries: List[str], chunks: List[Dict[str, Any]]) -> float:
+    """고유 청크를 하나 이상 기여한 검색어의 비율"""
+    if not queries:
+        return 1.0
+    contributing = {c.get("query") for c in chunks}
+    return sum(q in contributing for q in queries) / len(queries)
+
+@track_latency("research_search")
+def research_multi_query_node(state: ResearchState):
+    print(f"[Research] 병렬 다중 쿼리 검색 중... Topic: {state['topic']}")
+    topic = state["topic"]
+    
+    # 1. 로컬 코퍼스 우선 검색 (충분하면 웹 검색 생략)
+    local_chunks = local_search(topic)
+    local_coverage = coverage_score(local_chunks)
+    if local_coverage >= LOCAL_COVERAGE_THRESHOLD or get_search_tool() is None:
+        chunks = local_chunks
+        content = format_chunks(chunks) if chunks else "검색 도구를 사용할 수 없습니다 (API Key Missing)."
+        return {
+            "raw_data": content,
+            "sources": chunks,
+            "local_coverage": local_coverage,
+            "quality": "PASS",
+            **step_log(state, f"로컬 검색 완료: {len(chunks)}개 청크", "researcher")
+        }
+    
+    base_chunks = local_chunks if local_coverage >= LOCAL_MERGE_THRESHOLD else []
+    
+    with ThreadPoolExecutor(max_workers=RESEARCH_MAX_QUERIES + 1) as pool:
+        # 2. 주제 자체 검색은 하위 검색어 생성(LLM)과 동시에 시작
+        topic_future = pool.submit(contextvars.copy_context().run, _safe_search, topic, state.get("run_id"))
+        sub_queries = [q for q in generate_sub_queries(state) if q != topic]
+        print(f"      ㄴ 하위 검색어: {sub_queries}")
+        
+        # 3. 1차 검색: 하위 검색어 동시 실행 후 중복 제거
+        results = {topic: topic_future.result(), **_search_wave(sub_queries, pool, state.get("run_id"))}
+        chunks = dedupe_chunks(base_chunks + [c for q in [topic] + sub_queries for c in results[q]])
+        coverage = _query_coverage(sub_queries, chunks)
+        
+        # 4. 커버리지가 낮으면 고유 자료를 못 가져온 검색어만 주제와 결합해 2차 검색
+        if coverage < RESEARCH_COVERAGE_THRESHOLD:
+            uncovered = [q for q in sub_queries if q not in {c.get("query") for c in chunks}]
+            print(f"      ㄴ 커버리지 {coverage:.2f} -> 2차 검색: {uncovered}")
+            second = _search_wave([f"{topic} {q}" for q in uncovered], pool, state.get("run_id"))
+            for q in uncovered:
+                for c in second[f"{topic} {q}"]:
+                    c["query"] = q # 커버리지 계산을 위해 원래 하위 검색어로 귀속
+            chunks = dedupe_chunks(chunks + [c for cs in second.values() for c in cs])
+            coverage = _query_coverage(sub_queries, chunks)
+    
+    print(f"      ㄴ 고유 청크 {len(chunks)}개, 쿼리 커버리지 {coverage:.2f}")
+    content = format_chunks(chunks) if chunks else "검색 실패: 수집된 자료가 없습니다."
+    
+    return {
+        "raw_data": content,
+        "sources": chunks,
+        "local_coverage": local_coverage,
+        "quality": "PASS",
+        **step_log(state, f"병렬 검색 완료: {len(sub_queries) + 1}개 쿼리, 고유 청크 {len(chunks)}개", "researcher")
+    }
+
+research_multi_workflow = StateGraph(ResearchState)
+research_multi_workflow.add_node("search", research_multi_query_node)
+research_multi_workflow.add_node("submit", research_submit_node)
+research_multi_workflow.add_edge(START, "search")
+research_multi_workflow.add_edge("search", "submit")
+research_multi_workflow.add_edge("submit", END)
+research_multi_app = Lazy(research_multi_workflow.compile, "research_multi_app")
 
 
 # ==========================================
 # 2. Writer Subgraph
 # ==========================================
+# 연구 자료를 가장 우선하고, 코드/구조도는 순서가 깨지지 않게 앞부분부터 보존합니다.
+writer_budget = ContextBudget(
+    WRITER_CONTEXT_BUDGET,
+    weights={"data": 3.0, "code": 2.0, "design": 1.0, "critique": 1.0},
+    ordered=("code", "design"),
+)
+
+# 'section': 비평에서 지적된 섹션만 다시 써서 이전 초안에 이어 붙임 / 'full': 매번 문서 전체를 재작성
+WRITER_REVISION_MODE = os.getenv("WRITER_REVISION_MODE", "section")
+
 class WriterState(TypedDict):
     topic: str
     research_data: str
@@ -172,11 +490,131 @@ class WriterState(TypedDict):
     code_data: str 
     design_data: str
     run_id: str
+    section_critiques: List[Dict[str, str]] # [{'heading': ..., 'feedback': ...}]
+    budget: Dict[str, float]
+
+class SectionCritique(BaseModel):
+    heading: str = Field(description="수정이 필요한 섹션의 제목. 문서의 마크다운 제목과 똑같이 쓰되 '#'은 제외")
+    feedback: str = Field(description="이 섹션에 대한 구체적인 수정 지시")
+
+class WriterReview(BaseModel):
+    score: float = Field(description="0~10점 사이의 품질 점수")
+    feedback: str = Field(description="문서 전체에 대한 요약 피드백")
+    sections: List[SectionCritique] = Field(default_factory=list, description="수정이 필요한 섹션 목록 (문제 없는 섹션은 제외)")
 
+_HEADING = re.compile(r"^#{1,3}\s+(.+?)\s*#*\s*$")
+
+def _normalize_heading(heading: str) -> str:
+    return re.sub(r"\s+", " ", heading.strip().lstrip("#").strip()).lower()
+
+def split_sections(doc: str) -> List[Dict[str, str]]:
+    """
+    마크다운 문서를 제목(#~###) 단위 섹션으로 나눕니다. 코드 블록 안의 '#' 주석은 제목으로 보지 않습니다.
+    각 섹션의 text를 순서대로 이어 붙이면 원문과 같습니다.
+    """
+    sections = [{"heading": "", "text": ""}]
+    in_fence = False
+    for line in doc.splitlines(keepends=True):
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        match = None if in_fence else _HEADING.match(line.rstrip("\n"))
+        if match:
+            sections.append({"heading": match.group(1), "text": line})
+        else:
+            sections[-1]["text"] += line
+    return [sec for sec in sections if sec["text"]]
+
+def fit_draft_for_review(draft: str, topic: str) -> str:
+    """
+    비평 프롬프트에 넣을 초안. REVIEW_CONTEXT_BUDGET을 넘으면 섹션마다 예산을 나눠 본문만 추출 요약합니다.
+    (제목 줄은 그대로 남겨 비평이 섹션을 지목할 수 있게 함)
+    """
+    if count_tokens(draft) <= REVIEW_CONTEXT_BUDGET:
+        return draft
+    sections = split_sections(draft)
+    headings, bodies = [], {}
+    for i, sec in enumerate(sections):
+        heading, _, body = sec["text"].partition("\n") if sec["heading"] else ("", "", sec["text"])
+        headings.append(heading)
+        bodies[str(i)] = body
+    budget = ContextBudget(max(0, REVIEW_CONTEXT_BUDGET - sum(count_tokens(h) + 1 for h in headings)), weights={})
+    fitted = budget.fit(bodies, query=topic)
+    return "\n".join("\n".join(part for part in (heading, fitted[str(i)]) if part) for i, heading in enumerate(headings))
+
+def revise_flagged_sections(state: WriterState):
+    """지적된 섹션만 병렬로 다시 작성해 이전 초안에 끼워 넣습니다. 대상 섹션을 찾지 못하면 None."""
+    sections = split_sections(state["draft"])
+    index = {_normalize_heading(sec["heading"]): i for i, sec in enumerate(sections) if sec["heading"]}
+    targets = []
+    for c in state.get("section_critiques") or []:
+        i = index.get(_normalize_heading(c.get("heading", "")))
+        if i is not None:
+            targets.append((i, c["feedback"]))
+    if not targets:
+        return None
+    
+    chain = ChatPromptTemplate.from_template(
+        """당신은 '전문 수석 에디터'입니다. 주제 '{topic}' 문서의 한 섹션을 편집자 피드백에 맞춰 다시 작성하세요.
+        
+        [참고 자료]
+        {data}
+        
+        [현재 섹션]
+        {section}
+        
+        [피드백]
+        {feedback}
+        
+        [작성 지침]
+        - 첫 줄의 마크다운 제목은 그대로 유지하세요.
+        - 이 섹션의 내용만 출력하세요. (다른 섹션이나 설명 제외)
+        - 섹션 안의 코드/Mermaid 블록은 피드백이 요구하지 않는 한 그대로 두세요.
+        """
+    )
+    
+    inputs = [
+        {
+            "topic": state["topic"],
+            "data": compress_extractive(
+                resolve(state.get("research_data", "")) or "자료 없음",
+                WRITER_CONTEXT_BUDGET // 4,
+                f"{state['topic']} {sections[i]['heading']} {feedback}",
+            ),
+            "section": sections[i]["text"].strip(),
+            "feedback": feedback,
+        }
+        for i, feedback in targets
+    ]
+    rewritten = run_chain_batch(chain, inputs, "writer_revise_section", state.get("run_id"))
+    
+    for (i, _), new_text in zip(targets, rewritten):
+        new_text = new_text.strip()
+        heading_line = sections[i]["text"].splitlines()[0]
+        if not new_text.startswith("#"):
+            new_text = f"{heading_line}\n{new_text}"
+        trailing = sections[i]["text"][len(sections[i]["text"].rstrip()):]
+        sections[i]["text"] = new_text + (trailing or "\n")
+    
+    print(f"      ㄴ 섹션 단위 수정: {[sections[i]['heading'] for i, _ in targets]}")
+    return "".join(sec["text"] for sec in sections)
+
+@track_latency("writer_execute")
 def writer_execute_node(state: WriterState):
     count = state.get('revision_count', 0)
     print(f"[Writer Sub] 글 작성 중... (버전 {count + 1})")
     
+    # 수정 라운드: 지적된 섹션만 다시 작성 (실패 시 전체 재작성으로 진행)
+    if WRITER_REVISION_MODE == "section" and count > 0 and state.get("draft") and state.get("section_critiques"):
+        draft = revise_flagged_sections(state)
+        if draft is not None:
+            if "run_id" in state:
+                save_step_to_file(state["run_id"], "Write_Done", {"final_draft": draft})
+            return {
+                "draft": draft,
+                "revision_count": count + 1,
+                **step_log(state, f"초안 v{count+1} 섹션 수정 완료", "writer")
+            }
+    
     chain = ChatPromptTemplate.from_template(
         """당신은 상황에 맞춰 최적의 글을 쓰는 '전문 수석 에디터'입니다.
         제공된 재료들을 바탕으로 주제 '{topic}'에 가장 적합한 형식의 문서를 작성하세요.
@@ -201,15 +639,17 @@ def writer_execute_node(state: WriterState):
            - 주제가 학술적이면 전문적으로, 대중적이면 읽기 쉽게 작성하세요.
            - 서론-본론-결론의 완결성 있는 구조를 갖추세요.
         """
-    ) | llm | StrOutputParser()
+    )
     
-    draft = chain.invoke({
-        "topic": state["topic"],
-        "data": state.get("research_data", "자료 없음"),
-        "code": state.get("code_data", "없음"), 
-        "design": state.get("design_data", "없음"), 
+    # 섹션별 토큰 예산 배분 (예산 초과 섹션만 압축)
+    sections = writer_budget.fit({
+        "data": resolve(state.get("research_data", "자료 없음")),
+        "code": resolve(state.get("code_data", "없음")), 
+        "design": resolve(state.get("design_data", "없음")), 
         "critique": state.get("critique", "없음")
-    })
+    }, query=state["topic"])
+    
+    draft = run_chain(chain, {"topic": state["topic"], **sections}, "writer_execute", state.get("run_id"))
     
     if "run_id" in state:
         save_step_to_file(state["run_id"], "Write_Done", {"final_draft": draft})
@@ -217,34 +657,72 @@ def writer_execute_node(state: WriterState):
     return {
         "draft": draft, 
         "revision_count": count + 1,
-        "logs": [AIMessage(content=f"초안 v{count+1} 작성 완료", name="writer")]
+        **step_log(state, f"초안 v{count+1} 작성 완료", "writer")
+    }
+
+WRITER_REVIEW_CRITERIA = """[평가 기준]
+        1. 주제 적합성: 요청한 주제를 정확히 다루고 있는가?
+        2. 구체성: 막연한 내용이 아니라 구체적인 사실/예시가 있는가?
+        3. 논리적 흐름: 서론-본론-결론의 구조가 탄탄한가?
+        
+        주의: 조금이라도 모호하거나, 평범한 내용이라면 7점 미만으로 점수를 주세요. 
+        완벽하지 않으면 9점 이상을 주지 마세요."""
+
+def writer_reflect_sections_node(state: WriterState):
+    """섹션 단위 비평: 점수와 함께 수정이 필요한 섹션과 섹션별 피드백을 구조화하여 반환합니다."""
+    headings = [sec["heading"] for sec in split_sections(state["draft"]) if sec["heading"]]
+    system_prompt = f"""당신은 세계적인 저널의 '엄격한 수석 편집자'입니다. 
+        아래 글이 사용자 요청 주제인 '{state["topic"]}'에 완벽하게 부합하는지 비판적으로 평가하세요.
+        
+        {WRITER_REVIEW_CRITERIA}
+        
+        수정이 필요한 섹션은 아래 [섹션 제목] 중에서 골라 제목을 그대로 적고, 섹션별로 구체적인 수정 지시를 주세요.
+        
+        [섹션 제목]: {headings}
+        
+        [글]: {fit_draft_for_review(state["draft"], state["topic"])}
+        """
+    
+    record_prompt_tokens(state.get("run_id"), "writer_reflect", system_prompt)
+    try:
+        review = run_structured(WriterReview, [SystemMessage(content=system_prompt)], "writer_reflect", state.get("run_id"))
+        score, fb = float(review.score), review.feedback
+        section_critiques = [c.model_dump() for c in review.sections]
+    except Exception:
+        score, fb, section_critiques = 5.0, "형식 오류", []
+    
+    print(f"      ㄴ 점수: {score}점 (수정 대상 섹션 {len(section_critiques)}개)")
+    
+    return {
+        "score": score,
+        "critique": fb,
+        "section_critiques": section_critiques,
+        **step_log(state, f"평가: {score}점 / {fb}", "critic")
     }
 
+@track_latency("writer_reflect")
 def writer_reflect_node(state: WriterState):
     print("[Writer Sub] 품질 평가 중...")
     
+    if WRITER_REVISION_MODE == "section":
+        return writer_reflect_sections_node(state)
+    
     chain = ChatPromptTemplate.from_template(
         """당신은 세계적인 저널의 '엄격한 수석 편집자'입니다. 
         아래 글이 사용자 요청 주제인 '{topic}'에 완벽하게 부합하는지 비판적으로 평가하세요.
         
-        [평가 기준]
-        1. 주제 적합성: 요청한 주제를 정확히 다루고 있는가?
-        2. 구체성: 막연한 내용이 아니라 구체적인 사실/예시가 있는가?
-        3. 논리적 흐름: 서론-본론-결론의 구조가 탄탄한가?
-        
-        주의: 조금이라도 모호하거나, 평범한 내용이라면 7점 미만으로 점수를 주세요. 
-        완벽하지 않으면 9점 이상을 주지 마세요.
+        """ + WRITER_REVIEW_CRITERIA + """
         
         형식: 점수/구체적인_피드백 (예: 6.5/주제와 관련 없는 내용이 포함되어 있고 예시가 부족합니다)
         
         [글]: {draft}
         """
-    ) | llm | StrOutputParser()
+    )
     
-    response = chain.invoke({
-        "draft": state["draft"],
+    response = run_chain(chain, {
+        "draft": fit_draft_for_review(state["draft"], state["topic"]),
         "topic": state["topic"] 
-    })
+    }, "writer_reflect", state.get("run_id"))
     
     try:
         score_str, fb = response.split("/", 1)
@@ -257,7 +735,7 @@ def writer_reflect_node(state: WriterState):
     return {
         "score": score, 
         "critique": fb,
-        "logs": [AIMessage(content=f"평가: {score}점 / {fb}", name="critic")]
+        **step_log(state, f"평가: {score}점 / {fb}", "critic")
     }
     
 writer_workflow = StateGraph(WriterState)
@@ -267,12 +745,16 @@ writer_workflow.add_edge(START, "execute")
 writer_workflow.add_edge("execute", "reflect")
 
 def route_writer(state: WriterState):
-    if state["score"] >= 8.5 or state["revision_count"] >= 3:
+    if should_stop(state.get("run_id")):
+        return "end"
+    if state["score"] >= WRITER_QUALITY_THRESHOLD:
+        return "end"
+    if not can_afford(state.get("budget"), state["revision_count"], ["writer_execute", "writer_reflect"]):
         return "end"
     return "execute"
 
 writer_workflow.add_conditional_edges("reflect", route_writer, {"execute": "execute", "end": END})
-writer_app = writer_workflow.compile()
+writer_app = Lazy(writer_workflow.compile, "writer_app")
 
 
 # ==========================================
@@ -286,7 +768,9 @@ class CodeState(TypedDict):
     quality: str
     retry_count: int
     run_id: str
+    budget: Dict[str, float]
 
+@track_latency("code_execute")
 def code_execute_node(state: CodeState):
     print(f"[Code Agent] '{state['topic']}' 코드 초안 작성 중...")
     
@@ -300,9 +784,9 @@ def code_execute_node(state: CodeState):
         3. 마크다운 코드 블록(```python ... ```)으로 감싸지 말고 순수 코드만 출력하거나, 
            코드 블록을 쓴다면 파싱 가능한 형태로 주세요.
         """
-    ) | llm | StrOutputParser()
+    )
     
-    code = chain.invoke({"topic": state["topic"]})
+    code = run_chain(chain, {"topic": state["topic"]}, "code_execute", state.get("run_id"))
     
     if "run_id" in state:
         save_step_to_file(state["run_id"], "Code_Done", {"code": code})
@@ -310,12 +794,32 @@ def code_execute_node(state: CodeState):
     return {
         "code_result": code, 
         "retry_count": 0,
-        "logs": [AIMessage(content="코드 초안 생성 완료", name="coder")]
+        **step_log(state, "코드 초안 생성 완료", "coder")
     }
 
+@track_latency("code_reflect")
 def code_reflect_node(state: CodeState):
     print("[Code Agent] 코드 품질 리뷰 중...")
     
+    # 1. 로컬 정적 검증 (ast 파싱, 주석 밀도, 선택적 샌드박스 실행) - LLM 호출 없이 ms 단위
+    issues = validate_python(state["code_result"])
+    if issues:
+        print(f"      ㄴ 로컬 검증 결과: FAIL ({len(issues)}건)")
+        return {
+            "quality": "FAIL",
+            "critique": "상태: FAIL\n피드백: " + " / ".join(issues),
+            **step_log(state, f"로컬 검증 실패: {issues[0]}", "validator")
+        }
+    
+    if not CODE_SEMANTIC_REVIEW:
+        print("      ㄴ 로컬 검증 결과: PASS (의미 리뷰 생략)")
+        return {
+            "quality": "PASS",
+            "critique": "",
+            **step_log(state, "로컬 검증 통과", "validator")
+        }
+    
+    # 2. 로컬 검증을 통과한 코드만 LLM 의미 리뷰
     chain = ChatPromptTemplate.from_template(
         """당신은 까다로운 코드 리뷰어(Code Reviewer)입니다.
         아래 코드를 검토하고 점수와 피드백을 제공하세요.
@@ -333,9 +837,10 @@ def code_reflect_node(state: CodeState):
         상태: [PASS 또는 FAIL]
         피드백: [구체적인 개선점 또는 오류 내용]
         """
-    ) | llm | StrOutputParser()
+    )
     
-    review_result = chain.invoke({"code": state["code_result"]})
+    # 리뷰 프롬프트는 REVIEW_CONTEXT_BUDGET 안에서 (코드는 순서가 중요하므로 앞에서부터 줄 단위로 자름)
+    review_result = run_chain(chain, {"code": truncate_lines(state["code_result"], REVIEW_CONTEXT_BUDGET)}, "code_reflect", state.get("run_id"), accept=has_review_status)
     
     try:
         status_line = review_result.split("\\n")[0]
@@ -349,9 +854,10 @@ def code_reflect_node(state: CodeState):
     return {
         "quality": quality, 
         "critique": critique,
-        "logs": [AIMessage(content=f"리뷰 완료: {quality}", name="reviewer")]
+        **step_log(state, f"리뷰 완료: {quality}", "reviewer")
     }
 
+@track_latency("code_revise")
 def code_revise_node(state: CodeState):
     print(" [Code Agent] 피드백 반영하여 코드 수정 중...")
     
@@ -366,17 +872,17 @@ def code_revise_node(state: CodeState):
         
         피드백을 반영하여 개선된 '전체 코드'만 다시 출력하세요. (설명 제외)
         """
-    ) | llm | StrOutputParser()
+    )
     
-    new_code = chain.invoke({
+    new_code = run_chain(chain, {
         "code": state["code_result"],
         "critique": state["critique"]
-    })
+    }, "code_revise", state.get("run_id"))
     
     return {
         "code_result": new_code,
         "retry_count": state["retry_count"] + 1,
-        "logs": [AIMessage(content=f"코드 수정 완료 (시도 {state['retry_count']+1}회)", name="coder")]
+        **step_log(state, f"코드 수정 완료 (시도 {state['retry_count']+1}회)", "coder")
     }
 
 code_workflow = StateGraph(CodeState)
@@ -388,13 +894,17 @@ code_workflow.add_edge(START, "execute")
 code_workflow.add_edge("execute", "reflect")
 
 def route_code(state: CodeState):
-    if state["quality"] == "PASS" or state["retry_count"] >= 3:
+    if should_stop(state.get("run_id")):
+        return END
+    if state["quality"] == "PASS":
+        return END
+    if not can_afford(state.get("budget"), state["retry_count"], ["code_revise", "code_reflect"], reserve_nodes=WRITER_RESERVE_NODES):
         return END
     return "revise"
 
 code_workflow.add_conditional_edges("reflect", route_code, {"revise": "revise", END: END})
 code_workflow.add_edge("revise", "reflect")
-code_app = code_workflow.compile()
+code_app = Lazy(code_workflow.compile, "code_app")
 
 
 # ==========================================
@@ -408,7 +918,9 @@ class DesignerState(TypedDict):
     quality: str
     retry_count: int
     run_id: str
+    budget: Dict[str, float]
 
+@track_latency("designer_execute")
 def designer_execute_node(state: DesignerState):
     print(f"[Designer Agent] '{state['topic']}' 시각화 구조 설계 중...")
     
@@ -421,9 +933,9 @@ def designer_execute_node(state: DesignerState):
         2. 설명 텍스트 없이 오직 Mermaid 코드만 출력하세요.
         3. 마크다운 태그(```mermaid)는 제외하고 순수 코드만 주세요.
         """
-    ) | llm | StrOutputParser()
+    )
     
-    design = chain.invoke({"topic": state["topic"]})
+    design = run_chain(chain, {"topic": state["topic"]}, "designer_execute", state.get("run_id"))
     
     if "run_id" in state:
         save_step_to_file(state["run_id"], "Design_Done", {"design": design})
@@ -431,12 +943,32 @@ def designer_execute_node(state: DesignerState):
     return {
         "design_result": design,
         "retry_count": 0,
-        "logs": [AIMessage(content="다이어그램 초안 생성 완료", name="designer")]
+        **step_log(state, "다이어그램 초안 생성 완료", "designer")
     }
 
+@track_latency("designer_reflect")
 def designer_reflect_node(state: DesignerState):
     print("[Designer Agent] 다이어그램 문법 및 적절성 검사 중...")
     
+    # 1. 로컬 Mermaid 문법 파서 - LLM 호출 없이 ms 단위
+    issues = validate_mermaid(state["design_result"])
+    if issues:
+        print(f"      ㄴ 로컬 검증 결과: FAIL ({len(issues)}건)")
+        return {
+            "quality": "FAIL",
+            "critique": "상태: FAIL\n피드백: " + " / ".join(issues),
+            **step_log(state, f"로컬 검증 실패: {issues[0]}", "validator")
+        }
+    
+    if not DESIGN_SEMANTIC_REVIEW:
+        print("      ㄴ 로컬 검증 결과: PASS (의미 리뷰 생략)")
+        return {
+            "quality": "PASS",
+            "critique": "",
+            **step_log(state, "로컬 검증 통과", "validator")
+        }
+    
+    # 2. 문법이 올바른 다이어그램만 LLM으로 주제 적합성 리뷰
     chain = ChatPromptTemplate.from_template(
         """당신은 Mermaid 문법 전문가입니다. 
         아래 코드가 문법적으로 올바르고 주제를 잘 표현하는지 검사하세요.
@@ -449,9 +981,9 @@ def designer_reflect_node(state: DesignerState):
         상태: [PASS 또는 FAIL]
         피드백: [오류 내용 또는 개선점]
         """
-    ) | llm | StrOutputParser()
+    )
     
-    review_result = chain.invoke({"code": state["design_result"]})
+    review_result = run_chain(chain, {"code": truncate_lines(state["design_result"], REVIEW_CONTEXT_BUDGET)}, "designer_reflect", state.get("run_id"), accept=has_review_status)
     
     try:
         status_line = review_result.split("\\n")[0]
@@ -465,9 +997,10 @@ def designer_reflect_node(state: DesignerState):
     return {
         "quality": quality,
         "critique": critique,
-        "logs": [AIMessage(content=f"검사 완료: {quality}", name="reviewer")]
+        **step_log(state, f"검사 완료: {quality}", "reviewer")
     }
 
+@track_latency("designer_revise")
 def designer_revise_node(state: DesignerState):
     print("[Designer Agent] 피드백 반영하여 수정 중...")
     
@@ -482,17 +1015,17 @@ def designer_revise_node(state: DesignerState):
         
         수정된 전체 Mermaid 코드만 출력하세요. (설명 제외)
         """
-    ) | llm | StrOutputParser()
+    )
     
-    new_design = chain.invoke({
+    new_design = run_chain(chain, {
         "code": state["design_result"],
         "critique": state["critique"]
-    })
+    }, "designer_revise", state.get("run_id"))
     
     return {
         "design_result": new_design,
         "retry_count": state["retry_count"] + 1,
-        "logs": [AIMessage(content=f"수정 완료 (시도 {state['retry_count']+1}회)", name="designer")]
+        **step_log(state, f"수정 완료 (시도 {state['retry_count']+1}회)", "designer")
     }
 
 designer_workflow = StateGraph(DesignerState)
@@ -504,30 +1037,39 @@ designer_workflow.add_edge(START, "execute")
 designer_workflow.add_edge("execute", "reflect")
 
 def route_design(state: DesignerState):
-    if state["quality"] == "PASS" or state["retry_count"] >= 3:
+    if should_stop(state.get("run_id")):
+        return END
+    if state["quality"] == "PASS":
+        return END
+    if not can_afford(state.get("budget"), state["retry_count"], ["designer_revise", "designer_reflect"], reserve_nodes=WRITER_RESERVE_NODES):
         return END
     return "revise"
 
 designer_workflow.add_conditional_edges("reflect", route_design, {"revise": "revise", END: END})
 designer_workflow.add_edge("revise", "reflect")
-designer_app = designer_workflow.compile()
+designer_app = Lazy(designer_workflow.compile, "designer_app")
 
 
 # ==========================================
 # 5. Main Supervisor Graph
 # ==========================================
 def update_agent_results(existing: Dict[str, Any], new_data: Dict[str, Any]) -> Dict[str, Any]:
+    # None이 들어오면 초기화 (같은 thread_id의 새 run이 이전 run의 결과를 이어받지 않도록)
+    if new_data is None:
+        return {}
     if existing is None:
-        return new_data
-    merged = existing.copy()
-    merged.update(new_data)
-    return merged
+        return dict(new_data)
+    # 새 얕은 dict 반환: 이전 스냅샷/stream 청크가 나중에 바뀌지 않도록 기존 dict는 건드리지 않음
+    # (큰 산출물은 블롭 참조라 얕은 복사 비용이 작음)
+    return {**existing, **new_data}
 
 class MainState(TypedDict):
     messages: Annotated[List[BaseMessage], add_messages]
     agent_results: Annotated[Dict[str, Any], update_agent_results]
     next: List[str]
     run_id: str # Pass run_id
+    plan: List[str] # planner 모드에서 결정된 자료 생성 서브그래프 목록 (None이면 아직 계획 전)
+    budget: Dict[str, float] # run 반복 예산 (retry_budget.new_budget). 모든 성찰 루프 라우터가 참고
 
 class SupervisorDecision(BaseModel):
     next: List[Literal['research_subgraph', 'code_subgraph', 'designer_subgraph', 'writer_subgraph', 'FINISH']] = Field(
@@ -535,8 +1077,89 @@ class SupervisorDecision(BaseModel):
     )
     reasoning: str = Field(description="이 결정을 내린 이유 (성찰)")
 
+# --- Supervisor 모드 ---
+# 'planner': 요청을 한 번만 LLM으로 분류해 실행 계획(DAG)을 세우고, 이후 홉은 규칙 기반으로 라우팅
+# 'llm'    : 서브그래프가 끝날 때마다 LLM이 다음 작업자를 결정 (기존 방식, 계획 실패 시에도 사용)
+SUPERVISOR_MODE = os.getenv("SUPERVISOR_MODE", "planner")
+
+# 자료 생성 서브그래프 -> agent_results 키
+PLAN_RESULT_KEYS = {
+    "research_subgraph": "research",
+    "code_subgraph": "code",
+    "designer_subgraph": "design",
+}
+
+class ExecutionPlan(BaseModel):
+    needs_research: bool = Field(description="자료 조사(동향, 개념 설명, 분석 근거)가 필요한가?")
+    needs_code: bool = Field(description="구현/개발/알고리즘 등 예제 코드가 필요한가?")
+    needs_design: bool = Field(description="설계/구조도/흐름도 등 다이어그램이 필요한가?")
+    reasoning: str = Field(description="이 분류를 내린 이유")
+
+def plan_request(state: MainState):
+    """사용자 요청을 한 번만 분류하여 필요한 자료 생성 서브그래프 목록을 반환합니다. 실패 시 None."""
+    messages = state.get("messages", [])
+    last_user_msg = messages[-1].content if messages else ""
+    
+    system_prompt = f"""당신은 유능한 AI 프로젝트 매니저입니다.
+    사용자의 요청을 분석하여 최종 문서를 쓰기 전에 어떤 자료가 필요한지 분류하세요.
+    
+    [사용자 요청]: "{last_user_msg}"
+    
+    [판단 가이드]
+    - 요청이 '구현', '개발', '알고리즘', '코드' 등을 포함하나요? -> needs_code
+    - 요청이 '설계', '구조도', '아키텍처', '흐름' 등을 포함하나요? -> needs_design
+    - 개념 설명, '동향 파악', '분석 보고서', '에세이' 등 근거 자료가 필요한가요? -> needs_research
+    - 코드만 요청한 경우에는 Research를 생략해도 됩니다.
+    """
+    
+    record_prompt_tokens(state.get("run_id"), "planner", system_prompt)
+    try:
+        decision = run_structured(ExecutionPlan, [SystemMessage(content=system_prompt)], "planner", state.get("run_id"), hedge=True)
+    except Exception as e:
+        print(f"⚠️ [Planner] 계획 수립 실패, LLM Supervisor로 전환: {e}")
+        return None
+    
+    if not isinstance(decision, ExecutionPlan):
+        return None
+    
+    plan = []
+    if decision.needs_research:
+        plan.append("research_subgraph")
+    if decision.needs_code:
+        plan.append("code_subgraph")
+    if decision.needs_design:
+        plan.append("designer_subgraph")
+    
+    print(f"\\n[Planner] 실행 계획: {plan} -> writer_subgraph ({decision.reasoning})")
+    return plan
+
+def plan_next_step(plan: List[str], results: Dict[str, Any]) -> List[str]:
+    """계획과 현재 결과만으로 다음 작업자를 결정합니다. (LLM 호출 없음)"""
+    if "final_doc" in results:
+        return ["FINISH"]
+    # 아직 결과가 없는 자료 생성 서브그래프는 병렬로 한 번에 실행
+    pending = [name for name in plan if PLAN_RESULT_KEYS[name] not in results]
+    if pending:
+        return pending
+    return ["writer_subgraph"]
+
 def supervisor_node(state: MainState):
     results = state.get("agent_results", {})
+    
+    # 취소/마감된 run은 더 이상 작업자를 부르지 않고 지금까지의 결과로 종료
+    if should_stop(state.get("run_id")):
+        print("\\n[Main Supervisor] 실행 취소/마감 -> FINISH")
+        return {"next": ["FINISH"]}
+    
+    if SUPERVISOR_MODE == "planner":
+        plan = state.get("plan")
+        if plan is None:
+            plan = plan_request(state)
+        if plan is not None:
+            next_agents = plan_next_step(plan, results)
+            print(f"\\n[Main Supervisor] (planner) 지시: {next_agents}")
+            return {"next": next_agents, "plan": plan}
+    
     messages = state.get("messages", [])
     last_user_msg = messages[-1].content if messages else ""
     
@@ -581,8 +1204,11 @@ def supervisor_node(state: MainState):
     
     print(f"\\n[Main Supervisor] 현재 상태: {status}")
 
-    model = llm.with_structured_output(SupervisorDecision)
-    decision = model.invoke([SystemMessage(content=system_prompt)])
+    record_prompt_tokens(state.get("run_id"), "supervisor", system_prompt)
+    try:
+        decision = run_structured(SupervisorDecision, [SystemMessage(content=system_prompt)], "supervisor", state.get("run_id"), hedge=True)
+    except RunCancelled:
+        return {"next": ["FINISH"]}
     
     # 🛑 Safeguard: If Research is done but LLM selects Research again -> Redirect to Writer
     if "research_subgraph" in decision.next and status["research"] == "있음":
@@ -594,45 +1220,54 @@ def supervisor_node(state: MainState):
 
 def call_research_subgraph(state: MainState):
     print("[Main] 'Research 서브그래프' 호출")
-    topic = state["messages"][0].content
-    output = research_app.invoke({"topic": topic, "run_id": state.get("run_id","")})
-    return {"agent_results": {"research": output["raw_data"]}}
+    topic = state["messages"][-1].content
+    subgraph = research_multi_app if RESEARCH_MODE == "multi_query" else research_app
+    output = invoke_subgraph(subgraph, {"topic": topic, "run_id": state.get("run_id",""), "sources": [], "budget": state.get("budget")})
+    return {"agent_results": {
+        "research": store_artifact(output.get("raw_data", "")),
+        "research_sources": [{k: v for k, v in c.items() if k != "content"} for c in output.get("sources", [])]
+    }}
 
 def call_writer_subgraph(state: MainState):
     print("\\n[Main] 'Writer 서브그래프' 호출")
-    topic = state["messages"][0].content
+    topic = state["messages"][-1].content
     results = state["agent_results"]
     
-    output = writer_app.invoke({
+    output = invoke_subgraph(writer_app, {
         "topic": topic, 
         "research_data": results.get("research", ""),
         "code_data": results.get("code", ""),
         "design_data": results.get("design", ""),
         "revision_count": 0,
-        "run_id": state.get("run_id","")
+        "run_id": state.get("run_id",""),
+        "budget": state.get("budget")
     })
     
-    return {"agent_results": {"final_doc": output["draft"]}}
+    if not output.get("draft"):
+        return {}
+    return {"agent_results": {"final_doc": store_artifact(output["draft"])}}
 
 def call_code_subgraph(state: MainState):
     print("[Main] 'Code 팀' (서브그래프) 호출")
-    topic = state["messages"][0].content
-    output = code_app.invoke({
+    topic = state["messages"][-1].content
+    output = invoke_subgraph(code_app, {
         "topic": topic,
         "retry_count": 0,
-        "run_id": state.get("run_id","")
+        "run_id": state.get("run_id",""),
+        "budget": state.get("budget")
     })
-    return {"agent_results": {"code": output["code_result"]}}
+    return {"agent_results": {"code": store_artifact(output.get("code_result", ""))}}
 
 def call_designer_subgraph(state: MainState):
     print("[Main] 'Designer 팀' (서브그래프) 호출")
-    topic = state["messages"][0].content
-    output = designer_app.invoke({
+    topic = state["messages"][-1].content
+    output = invoke_subgraph(designer_app, {
         "topic": topic,
         "retry_count": 0,
-        "run_id": state.get("run_id","")
+        "run_id": state.get("run_id",""),
+        "budget": state.get("budget")
     })
-    return {"agent_results": {"design": output["design_result"]}}
+    return {"agent_results": {"design": store_artifact(output.get("design_result", ""))}}
 
 main_workflow = StateGraph(MainState)
 main_workflow.add_node("supervisor", supervisor_node)
@@ -665,5 +1300,10 @@ main_workflow.add_conditional_edges(
     }
 )
 
+def build_app(checkpointer=None):
+    """주어진 체크포인터로 메인 그래프를 컴파일합니다. (서버에서는 SQLite 체크포인터 사용)"""
+    return main_workflow.compile(checkpointer=checkpointer)
+
 memory = MemorySaver()
-app = main_workflow.compile(checkpointer=memory)
+# 기본(메모리 체크포인터) 메인 그래프. 서버는 lifespan에서 영속 체크포인터로 따로 컴파일합니다.
+app = Lazy(lambda: build_app(memory), "app")
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+import common_path  # noqa: F401 (llm_common)
+from llm_common.tokens import count_tokens
+from llm_common.rate_limiter import openai_limiter
+
+# --- 결과 캐시 설정 ---
+# 의미가 거의 같은 질의(예: 같은 질문의 다른 표현)는 그래프를 다시 돌리지 않고 이전 final_doc을 바로 반환합니다.
+RESULT_CACHE = os.getenv("RESULT_CACHE", "1") == "1"
+RESULT_CACHE_DB_PATH = os.getenv("RESULT_CACHE_DB_PATH", "result_cache.sqlite")
+RESULT_CACHE_THRESHOLD = float(os.getenv("RESULT_CACHE_THRESHOLD", "0.92"))   # 코사인 유사도가 이 값 이상이면 hit
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", str(24 * 3600)))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1000"))
+RESULT_CACHE_EMBEDDING_MODEL = os.getenv("RESULT_CACHE_EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_MEMO_SIZE = 256
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).lower()
+
+
+def _query_hash(query: str) -> str:
+    return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+def _openai_embedder(model: str) -> Callable[[str], List[float]]:
+    from langchain_openai import OpenAIEmbeddings
+
+    embeddings = OpenAIEmbeddings(model=model)
+
+    def embed(text: str) -> List[float]:
+        openai_limiter.acquire(count_tokens(text))  # 임베딩 호출도 공용 리미터를 거침
+        return embeddings.embed_query(text)
+
+    return embed
+
+
+class ResultCache:
+    """
+    질의 임베딩을 키로 하는 완료 결과 캐시 (SQLite WAL, 여러 워커가 공유).
+    - 정규화한 질의 문자열이 같으면 임베딩 없이 바로 hit
+    - 그 외에는 TTL 안의 항목 중 코사인 유사도가 가장 높은 항목이 threshold 이상이면 hit
+    """
+
+    def __init__(self, path: str = RESULT_CACHE_DB_PATH, threshold: float = RESULT_CACHE_THRESHOLD,
+                 ttl_seconds: float = RESULT_CACHE_TTL_SECONDS, max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+                 embed: Optional[Callable[[str], List[float]]] = None):
+        self.path = path
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._embed_fn = embed
+        self._memo: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memo_lock = threading.Lock()
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS result_cache (
+                entry_id TEXT PRIMARY KEY,
+                query TEXT NOT NULL,
+                query_hash TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                result TEXT NOT NULL,
+                run_id TEXT,
+                created_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_hash ON result_cache (query_hash)")
+        conn.execute("CREATE TABLE IF NOT EXISTS result_cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _embed(self, query: str) -> np.ndarray:
+        """정규화된 임베딩 (lookup 후 put에서 같은 질의를 다시 임베딩하지 않도록 최근 결과를 보관)"""
+        key = _query_hash(query)
+        with self._memo_lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+        if self._embed_fn is None:
+            self._embed_fn = _openai_embedder(RESULT_CACHE_EMBEDDING_MODEL)
+        vector = np.asarray(self._embed_fn(query), dtype=np.float32)
+        vector /= (np.linalg.norm(vector) or 1.0)
+        with self._memo_lock:
+            self._memo[key] = vector
+            while len(self._memo) > EMBEDDING_MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return vector
+
+    def _count(self, name: str):
+        self._conn().execute(
+            "INSERT INTO result_cache_stats (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def _hit(self, entry_id: str, row_result: str, similarity: float, exact: bool) -> Dict[str, Any]:
+        self._conn().execute("UPDATE result_cache SET hits = hits + 1 WHERE entry_id = ?", (entry_id,))
+        self._count("hits")
+        return {"entry_id": entry_id, "result": json.loads(row_result), "similarity": round(similarity, 4), "exact": exact}
+
+    def lookup(self, query: str) -> Optional[Dict[str, Any]]:
+        """hit이면 {'entry_id', 'result', 'similarity', 'exact'}, miss면 None"""
+        min_created = time.time() - self.ttl_seconds
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT entry_id, result FROM result_cache WHERE query_hash = ? AND created_at >= ? "
+            "ORDER BY created_at DESC LIMIT 1",
+            (_query_hash(query), min_created),
+        ).fetchone()
+        if row:
+            return self._hit(row[0], row[1], 1.0, True)
+
+        try:
+            vector = self._embed(query)
+        except Exception as e:
+            print(f"⚠️ Result cache embedding failed: {e}")
+            self._count("misses")
+            return None
+
+        rows = conn.execute(
+            "SELECT entry_id, embedding FROM result_cache WHERE created_at >= ?", (min_created,)
+        ).fetchall()
+        best_id, best_score = None, -1.0
+        if rows:
+            matrix = np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+            best_id, best_score = rows[best][0], float(scores[best])
+        if best_id is None or best_score < self.threshold:
+            self._count("misses")
+            return None
+        result = conn.execute("SELECT result FROM result_cache WHERE entry_id = ?", (best_id,)).fetchone()
+        if result is None:  # 조회 사이에 다른 워커가 무효화
+            self._count("misses")
+            return None
+        return self._hit(best_id, result[0], best_score, False)
+
+    def put(self, query: str, result: Dict[str, Any], run_id: Optional[str] = None) -> Optional[str]:
+        try:
+            vector = self._embed(query)
+        except Exception as e:
+            print(f"⚠️ Result cache embedding failed: {e}")
+            return None
+        entry_id = str(uuid.uuid4())
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO result_cache (entry_id, query, query_hash, embedding, result, run_id, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (entry_id, query, _query_hash(query), vector.tobytes(),
+                 json.dumps(result, ensure_ascii=False, default=str), run_id, time.time()),
+            )
+            # 만료 항목 삭제 + 최대 개수 초과분은 오래된 것부터 삭제
+            conn.execute("DELETE FROM result_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM result_cache WHERE entry_id NOT IN "
+                "(SELECT entry_id FROM result_cache ORDER BY created_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return entry_id
+
+    def invalidate(self, query: Optional[str] = None, entry_id: Optional[str] = None) -> int:
+        """entry_id, 또는 query와 같거나 유사한(threshold 이상) 항목을 삭제합니다. 둘 다 없으면 전체 삭제. 삭제 개수 반환"""
+        conn = self._conn()
+        if entry_id:
+            return conn.execute("DELETE FROM result_cache WHERE entry_id = ?", (entry_id,)).rowcount
+        if query is None:
+            return conn.execute("DELETE FROM result_cache").rowcount
+
+        targets = {r[0] for r in conn.execute(
+            "SELECT entry_id FROM result_cache WHERE query_hash = ?", (_query_hash(query),)
+        ).fetchall()}
+        try:
+            vector = self._embed(query)
+            for other_id, blob in conn.execute("SELECT entry_id, embedding FROM result_cache").fetchall():
+                if float(np.frombuffer(blob, dtype=np.float32) @ vector) >= self.threshold:
+                    targets.add(other_id)
+        except Exception as e:
+            print(f"⚠️ Result cache embedding failed, invalidating exact matches only: {e}")
+        for target in targets:
+            conn.execute("DELETE FROM result_cache WHERE entry_id = ?", (target,))
+        return len(targets)
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        counters = dict(conn.execute("SELECT name, value FROM result_cache_stats").fetchall())
+        entries = conn.execute(
+            "SELECT COUNT(*) FROM result_cache WHERE created_at >= ?", (time.time() - self.ttl_seconds,)
+        ).fetchone()[0]
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds,
+        }
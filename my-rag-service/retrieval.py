@@ -0,0 +1,149 @@
+import os
+import re
+import hashlib
+from typing import List, Dict, Any, Optional
+
+# --- 로컬 코퍼스 설정 ---
+# rag-practice에서 PDF(rag1~3.pdf)를 인덱싱해 둔 Chroma DB를 기본값으로 사용합니다.
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag-practice", "chroma_recur_db")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", DEFAULT_INDEX_DIR)
+LOCAL_INDEX_COLLECTION = os.getenv("LOCAL_INDEX_COLLECTION", "recur_chunks_collection")
+
+# 로컬 커버리지 점수가 이 값 이상이면 웹 검색을 생략합니다.
+LOCAL_COVERAGE_THRESHOLD = float(os.getenv("LOCAL_COVERAGE_THRESHOLD", "0.75"))
+# 이 값 미만이면 로컬 결과는 버리고 웹 검색 결과만 사용합니다. (사이 구간은 병합)
+LOCAL_MERGE_THRESHOLD = float(os.getenv("LOCAL_MERGE_THRESHOLD", "0.4"))
+
+
+class LocalCorpusRetriever:
+    """
+    인덱싱된 PDF 코퍼스(Chroma)에서 청크를 검색합니다.
+    인덱스 디렉터리나 chromadb 패키지가 없으면 비활성화되어 빈 결과를 반환합니다.
+    """
+
+    def __init__(self, persist_directory: str = LOCAL_INDEX_DIR, collection_name: str = LOCAL_INDEX_COLLECTION, k: int = 4):
+        self.k = k
+        self.vector_store = None
+        self.enabled = os.path.isdir(persist_directory)
+
+        if not self.enabled:
+            print(f"⚠️ Local index not found ({persist_directory}). Local retrieval is DISABLED.")
+            return
+
+        try:
+            from langchain_chroma import Chroma
+            from langchain_openai import OpenAIEmbeddings
+
+            self.vector_store = Chroma(
+                collection_name=collection_name,
+                persist_directory=persist_directory,
+                embedding_function=OpenAIEmbeddings(model="text-embedding-3-small"),
+            )
+        except Exception as e:
+            print(f"⚠️ Local index unavailable: {e}")
+            self.enabled = False
+
+    def search(self, query: str) -> List[Dict[str, Any]]:
+        """
+        쿼리와 관련된 청크를 출처(provenance) 정보와 함께 반환합니다.
+        Return: [{'content': ..., 'source': 'local', 'ref': 'data/rag1.pdf', 'page': 3, 'score': 0.82}]
+        """
+        if not self.enabled:
+            return []
+
+        try:
+            docs_and_scores = self.vector_store.similarity_search_with_relevance_scores(query, k=self.k)
+        except Exception as e:
+            print(f"Local Retrieval Error: {e}")
+            return []
+
+        chunks = []
+        for doc, score in docs_and_scores:
+            metadata = doc.metadata or {}
+            chunks.append({
+                "content": doc.page_content,
+                "source": "local",
+                "ref": metadata.get("source", "unknown"),
+                "page": metadata.get("page"),
+                "score": round(float(score), 4),
+            })
+        return chunks
+
+
+def coverage_score(chunks: List[Dict[str, Any]], top_n: int = 3) -> float:
+    """상위 N개 청크의 평균 관련도 점수를 로컬 커버리지로 사용합니다. (청크가 없으면 0.0)"""
+    scores = sorted((c.get("score") or 0.0 for c in chunks), reverse=True)[:top_n]
+    if not scores:
+        return 0.0
+    return sum(scores) / len(scores)
+
+
+def web_results_to_chunks(results: List[Dict[str, Any]], query: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Tavily 검색 결과를 로컬 청크와 같은 형태로 변환합니다. (query: 이 결과를 가져온 검색어)"""
+    return [
+        {
+            "content": r.get("content", ""),
+            "source": "web",
+            "ref": r.get("url", "unknown"),
+            "page": None,
+            "score": r.get("score"),
+            "query": query,
+        }
+        for r in results
+    ]
+
+
+# --- 중복 제거 (Content Hash + MinHash) ---
+_MINHASH_PERMUTATIONS = 64
+_MERSENNE_PRIME = (1 << 61) - 1
+_MINHASH_PARAMS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME | 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME)
+    for i in range(_MINHASH_PERMUTATIONS)
+]
+
+
+def _normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip().lower()
+
+
+def _minhash(text: str, shingle_size: int = 5) -> List[int]:
+    """문자 n-gram 집합의 MinHash 시그니처를 계산합니다."""
+    shingles = {text[i:i + shingle_size] for i in range(max(1, len(text) - shingle_size + 1))}
+    hashed = [int.from_bytes(hashlib.blake2b(sh.encode(), digest_size=8).digest(), "big") for sh in shingles]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashed) for a, b in _MINHASH_PARAMS]
+
+
+def dedupe_chunks(chunks: List[Dict[str, Any]], near_dup_threshold: float = 0.7) -> List[Dict[str, Any]]:
+    """
+    같은 내용(정규화 후 해시 일치)이나 거의 같은 내용(MinHash 유사도 >= threshold)의 청크를 제거합니다.
+    먼저 나온 청크가 남습니다.
+    """
+    seen_hashes = set()
+    kept, signatures = [], []
+    for chunk in chunks:
+        text = _normalize_text(chunk.get("content", ""))
+        if not text:
+            continue
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        if digest in seen_hashes:
+            continue
+        signature = _minhash(text)
+        if any(
+            sum(x == y for x, y in zip(signature, other)) / _MINHASH_PERMUTATIONS >= near_dup_threshold
+            for other in signatures
+        ):
+            continue
+        seen_hashes.add(digest)
+        signatures.append(signature)
+        kept.append(chunk)
+    return kept
+
+
+def format_chunks(chunks: List[Dict[str, Any]]) -> str:
+    """청크 목록을 출처 태그가 달린 하나의 자료 문자열로 합칩니다."""
+    lines = []
+    for c in chunks:
+        ref = c["ref"] if c.get("page") is None else f"{c['ref']} p.{c['page']}"
+        lines.append(f"- [{c['source']}: {ref}] {c['content']}")
+    return "\n".join(lines)
@@ -0,0 +1,99 @@
+import os
+import time
+import threading
+import functools
+from collections import defaultdict, deque
+from typing import Dict, Iterable, Optional
+
+# --- 반복(성찰) 루프 예산 설정 ---
+# 고정된 재시도 횟수 대신, 남은 시간 안에 한 번 더 반복할 수 있을 때만 반복합니다.
+RUN_TARGET_SECONDS = float(os.getenv("RUN_TARGET_SECONDS", "120"))   # run 전체 목표 시간 (p99 목표)
+MAX_REFLECTION_ROUNDS = int(os.getenv("MAX_REFLECTION_ROUNDS", "3"))  # 비용 상한: 루프별 최대 반복 횟수
+WRITER_QUALITY_THRESHOLD = float(os.getenv("WRITER_QUALITY_THRESHOLD", "8.5"))
+LATENCY_QUANTILE = float(os.getenv("LATENCY_QUANTILE", "0.9"))         # 노드 소요 시간 추정에 쓰는 분위수
+DEFAULT_NODE_SECONDS = float(os.getenv("DEFAULT_NODE_SECONDS", "10"))  # 관측값이 없을 때의 추정치
+LATENCY_WINDOW = 50
+
+# 이후 단계(Writer 초안 작성 + 평가)를 위해 자료 생성 루프가 남겨 둘 시간
+WRITER_RESERVE_NODES = ("writer_execute", "writer_reflect")
+
+
+class LatencyTracker:
+    """노드별 최근 소요 시간을 보관하고 분위수로 다음 실행 시간을 추정합니다. (프로세스 내 run 간 공유)"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, node: str, seconds: float):
+        with self._lock:
+            self._samples[node].append(seconds)
+
+    def estimate(self, node: str, quantile: float = LATENCY_QUANTILE) -> float:
+        with self._lock:
+            samples = sorted(self._samples.get(node, ()))
+        if not samples:
+            return DEFAULT_NODE_SECONDS
+        return samples[min(len(samples) - 1, int(quantile * len(samples)))]
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            nodes = list(self._samples)
+        return {node: round(self.estimate(node), 3) for node in nodes}
+
+
+latency_tracker = LatencyTracker()
+
+
+def track_latency(node: str):
+    """노드 함수의 실행 시간을 latency_tracker에 기록하는 데코레이터"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                latency_tracker.record(node, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def new_budget(target_seconds: Optional[float] = None, max_rounds: Optional[int] = None) -> Dict[str, float]:
+    """
+    run 하나의 반복 예산. MainState에 그대로 들어가므로(체크포인트 직렬화) 단순 dict로 표현합니다.
+    {'deadline': 마감 시각(epoch), 'max_rounds': 루프별 최대 반복 횟수}
+    """
+    target_seconds = target_seconds or RUN_TARGET_SECONDS
+    return {
+        "deadline": time.time() + target_seconds,
+        "max_rounds": MAX_REFLECTION_ROUNDS if max_rounds is None else max_rounds,
+    }
+
+
+def remaining_seconds(budget: Optional[Dict[str, float]]) -> Optional[float]:
+    if not budget:
+        return None
+    return budget["deadline"] - time.time()
+
+
+def can_afford(budget: Optional[Dict[str, float]], rounds_done: int, next_nodes: Iterable[str],
+               reserve_nodes: Iterable[str] = (), max_rounds: int = MAX_REFLECTION_ROUNDS) -> bool:
+    """
+    한 번 더 반복(next_nodes 실행)해도 예산 안에 들어오는지 판단합니다.
+    1. 반복 횟수 상한 (비용, 루프별 max_rounds와 예산의 max_rounds 중 작은 값)
+    2. 남은 시간 >= 다음 반복 추정 시간 + 이후 단계(reserve_nodes) 추정 시간
+    예산이 없으면(단독 실행, 테스트) 횟수 상한만 적용합니다.
+    """
+    if budget:
+        max_rounds = min(max_rounds, budget.get("max_rounds", max_rounds))
+    if rounds_done >= max_rounds:
+        return False
+    remaining = remaining_seconds(budget)
+    if remaining is None:
+        return True
+    needed = sum(latency_tracker.estimate(n) for n in next_nodes) + sum(latency_tracker.estimate(n) for n in reserve_nodes)
+    if needed > remaining:
+        print(f"⏱️ 예산 부족으로 반복 중단: 필요 {needed:.1f}s > 남은 시간 {remaining:.1f}s")
+        return False
+    return True
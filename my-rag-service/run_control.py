@@ -0,0 +1,121 @@
+import os
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Optional
+
+import common_path  # noqa: F401 (llm_common)
+from llm_common.rate_limiter import stop_check
+
+# --- 실행 취소 / 마감 시간 설정 ---
+RUN_DEADLINE_SECONDS = float(os.getenv("RUN_DEADLINE_SECONDS", "0"))  # 요청에 deadline이 없을 때 기본값 (0이면 무제한)
+CANCEL_POLL_SECONDS = float(os.getenv("CANCEL_POLL_SECONDS", "0.2"))
+
+# 취소 가능한 호출(LLM/검색)을 실행하는 공용 스레드 풀. 취소된 호출은 결과를 버리고 백그라운드에서 마무리됩니다.
+_call_pool = ThreadPoolExecutor(max_workers=int(os.getenv("CANCELLABLE_CALL_WORKERS", "32")))
+
+
+class RunCancelled(Exception):
+    """run이 취소되었거나 마감 시간을 넘겨 진행 중인 호출을 중단할 때 발생합니다."""
+
+
+class RunControl:
+    """run 하나의 취소 플래그와 마감 시각"""
+
+    def __init__(self, deadline_seconds: Optional[float] = None):
+        self.started_at = time.time()
+        self.deadline = self.started_at + deadline_seconds if deadline_seconds else None
+        self._cancelled = threading.Event()
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    def stop_reason(self) -> Optional[str]:
+        if self._cancelled.is_set():
+            return self.reason
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.cancel("deadline")
+            return self.reason
+        return None
+
+    def raise_if_stopped(self):
+        if self.stop_reason():
+            raise RunCancelled(self.reason)
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+
+# { run_id: RunControl } (이 워커 프로세스에서 실행 중인 run)
+_controls: Dict[str, RunControl] = {}
+_lock = threading.Lock()
+
+
+def start_run(run_id: str, deadline_seconds: Optional[float] = None) -> RunControl:
+    deadline_seconds = deadline_seconds or RUN_DEADLINE_SECONDS or None
+    control = RunControl(deadline_seconds)
+    with _lock:
+        _controls[run_id] = control
+    return control
+
+
+def finish_run(run_id: str):
+    with _lock:
+        _controls.pop(run_id, None)
+
+
+def get_control(run_id: Optional[str]) -> Optional[RunControl]:
+    if not run_id:
+        return None
+    with _lock:
+        return _controls.get(run_id)
+
+
+def cancel_run(run_id: str, reason: str = "cancelled") -> bool:
+    """이 워커에서 실행 중인 run이면 취소 플래그를 세우고 True를 반환합니다."""
+    control = get_control(run_id)
+    if control is None:
+        return False
+    control.cancel(reason)
+    return True
+
+
+def stop_reason(run_id: Optional[str]) -> Optional[str]:
+    """'cancelled' / 'deadline' / None"""
+    control = get_control(run_id)
+    return control.stop_reason() if control else None
+
+
+def should_stop(run_id: Optional[str]) -> bool:
+    """라우터에서 사용: True면 반복을 멈추고 지금까지의 최선 결과로 마무리합니다."""
+    return stop_reason(run_id) is not None
+
+
+def call_cancellable(run_id: Optional[str], fn, *args, **kwargs):
+    """
+    fn을 실행하되, run이 취소되거나 마감 시간을 넘기면 완료를 기다리지 않고 RunCancelled를 발생시킵니다.
+    등록된 run이 아니면(테스트, 단독 실행) 그대로 호출합니다.
+    """
+    control = get_control(run_id)
+    if control is None:
+        return fn(*args, **kwargs)
+    if control.stop_reason():
+        raise RunCancelled(control.reason)
+
+    ctx = contextvars.copy_context()  # LangSmith 추적 등 컨텍스트 유지
+    # 공용 리미터 대기 중 취소/마감되면 버려진 스레드도 요청을 보내지 않고 RunCancelled로 끝남
+    ctx.run(stop_check.set, control.raise_if_stopped)
+    future = _call_pool.submit(ctx.run, fn, *args, **kwargs)
+    while True:
+        done, _ = wait([future], timeout=CANCEL_POLL_SECONDS)
+        if done:
+            return future.result()
+        if control.stop_reason():
+            future.cancel()
+            raise RunCancelled(control.reason)
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import asyncio
+import itertools
+from collections import Counter, OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from tracing import metrics as trace_metrics
+
+# --- run 스케줄러 설정 ---
+# 그래프 실행 앞에서 run을 가중 공정 큐(WFQ)로 줄 세웁니다. 도착 순서대로 모두 시작하는 대신
+# 1) 레인(interactive / bulk)끼리 가중치 비율로, 2) 같은 레인 안에서는 테넌트(API 클라이언트 또는 thread_id)끼리 공정하게 슬롯을 나눕니다.
+# bulk 레인은 전체 슬롯의 일부만 쓸 수 있어 대량 배치가 돌아가는 동안에도 대화형 요청이 바로 시작됩니다.
+RUN_SCHEDULER = os.getenv("RUN_SCHEDULER", "1") == "1"
+MAX_CONCURRENT_RUNS = int(os.getenv("MAX_CONCURRENT_RUNS", "16"))      # 워커 프로세스당 동시에 실행할 run 수
+BULK_MAX_CONCURRENT = int(os.getenv("BULK_MAX_CONCURRENT", str(max(1, MAX_CONCURRENT_RUNS // 2))))
+TENANT_MAX_CONCURRENT = int(os.getenv("TENANT_MAX_CONCURRENT", "4"))   # 테넌트 하나가 동시에 실행할 수 있는 run 수
+
+
+def _load_weights(name: str, default: Dict[str, float]) -> Dict[str, float]:
+    try:
+        return {**default, **json.loads(os.getenv(name) or "{}")}
+    except (json.JSONDecodeError, TypeError) as e:
+        print(f"⚠️ {name} 파싱 실패, 기본값 사용: {e}")
+        return dict(default)
+
+
+# 레인 가중치: interactive가 bulk보다 4배 자주 슬롯을 받음. SCHEDULER_LANE_WEIGHTS='{"interactive": 8, "bulk": 1}'
+LANE_WEIGHTS = _load_weights("SCHEDULER_LANE_WEIGHTS", {"interactive": 4.0, "bulk": 1.0})
+# 테넌트별 가중치 (기본 1). TENANT_WEIGHTS='{"team-a": 2}'
+TENANT_WEIGHTS = _load_weights("TENANT_WEIGHTS", {})
+SCHEDULER_WAIT_WINDOW = 500
+SCHEDULER_MAX_TENANTS = 1000 # 대기 시간 지표를 보관할 최근 테넌트 수
+
+trace_metrics.describe("rag_scheduler_wait_seconds", "histogram", "Time a run waited for a scheduler slot by lane")
+trace_metrics.describe("rag_scheduler_runs_total", "counter", "Runs admitted by the scheduler by lane")
+
+
+class RunScheduler:
+    """
+    가중 공정 큐 (start-time fair queuing, 이벤트 루프 하나에서 사용).
+    - 레인마다 가상 시각(virtual time)이 있고, 슬롯을 줄 때마다 1/레인 가중치만큼 증가 -> 가장 뒤처진 레인부터
+    - 레인 안에서는 테넌트별 가상 시각이 가장 작은 테넌트부터 (1/테넌트 가중치씩 증가)
+    - 쉬고 있던 레인/테넌트는 현재 가상 시각에서 다시 시작하므로 몰아서 쓸 몫이 쌓이지 않음
+    - 전체(max_concurrent), 레인(lane_caps), 테넌트(tenant_cap) 동시 실행 한도를 넘는 후보는 건너뜀
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_RUNS, lane_weights: Optional[Dict[str, float]] = None,
+                 lane_caps: Optional[Dict[str, int]] = None, tenant_cap: int = TENANT_MAX_CONCURRENT,
+                 tenant_weights: Optional[Dict[str, float]] = None):
+        self.max_concurrent = max_concurrent
+        self.lane_weights = dict(lane_weights or LANE_WEIGHTS)
+        self.lane_caps = dict(lane_caps if lane_caps is not None else {"bulk": BULK_MAX_CONCURRENT})
+        self.tenant_cap = tenant_cap
+        self.tenant_weights = dict(tenant_weights if tenant_weights is not None else TENANT_WEIGHTS)
+        self._queues: Dict[str, Dict[str, Deque[Tuple[int, asyncio.Future]]]] = defaultdict(dict)
+        self._lane_vtime: Dict[str, float] = defaultdict(float)
+        self._tenant_vtime: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._lane_clock: Dict[str, float] = defaultdict(float) # 레인 안에서 마지막으로 슬롯을 받은 테넌트의 가상 시각
+        self._clock = 0.0 # 마지막으로 슬롯을 받은 레인의 가상 시각
+        self._running = 0
+        self._running_lane: Counter = Counter()
+        self._running_tenant: Counter = Counter()
+        self._seq = itertools.count()
+        self._waits: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    # --- 큐 ---
+    def _enqueue(self, tenant: str, lane: str) -> asyncio.Future:
+        lane_queues = self._queues[lane]
+        if not any(lane_queues.values()):
+            self._lane_vtime[lane] = max(self._lane_vtime[lane], self._clock)
+        queue = lane_queues.setdefault(tenant, deque())
+        if not queue:
+            key = (lane, tenant)
+            self._tenant_vtime[key] = max(self._tenant_vtime[key], self._lane_clock[lane])
+        future = asyncio.get_running_loop().create_future()
+        queue.append((next(self._seq), future))
+        return future
+
+    def _remove(self, tenant: str, lane: str, future: asyncio.Future):
+        queue = self._queues[lane].get(tenant)
+        if queue:
+            for item in list(queue):
+                if item[1] is future:
+                    queue.remove(item)
+        if queue is not None and not queue:
+            del self._queues[lane][tenant]
+
+    def _pick(self) -> Optional[Tuple[str, str]]:
+        best = None
+        for lane, lane_queues in self._queues.items():
+            if self._running_lane[lane] >= self.lane_caps.get(lane, self.max_concurrent):
+                continue
+            tenants = [t for t, q in lane_queues.items() if q and self._running_tenant[t] < self.tenant_cap]
+            if not tenants:
+                continue
+            tenant = min(tenants, key=lambda t: (self._tenant_vtime[(lane, t)], lane_queues[t][0][0]))
+            key = (self._lane_vtime[lane], lane_queues[tenant][0][0])
+            if best is None or key < best[0]:
+                best = (key, lane, tenant)
+        return None if best is None else (best[1], best[2])
+
+    def _dispatch(self):
+        while self._running < self.max_concurrent:
+            picked = self._pick()
+            if picked is None:
+                return
+            lane, tenant = picked
+            queue = self._queues[lane][tenant]
+            _, future = queue.popleft()
+            if not queue:
+                del self._queues[lane][tenant]
+            if future.done(): # 대기 중 취소됨
+                continue
+            self._lane_clock[lane] = self._tenant_vtime[(lane, tenant)]
+            self._tenant_vtime[(lane, tenant)] += 1.0 / self.tenant_weights.get(tenant, 1.0)
+            self._clock = self._lane_vtime[lane]
+            self._lane_vtime[lane] += 1.0 / self.lane_weights.get(lane, 1.0)
+            self._running += 1
+            self._running_lane[lane] += 1
+            self._running_tenant[tenant] += 1
+            future.set_result(None)
+
+    # --- 슬롯 ---
+    async def acquire(self, tenant: str, lane: str = "interactive") -> float:
+        """슬롯을 받을 때까지 대기하고 대기 시간(초)을 반환합니다."""
+        started = time.monotonic()
+        future = self._enqueue(tenant, lane)
+        self._dispatch()
+        try:
+            await future
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self.release(tenant, lane) # 슬롯을 받은 직후 취소됨
+            else:
+                future.cancel()
+                self._remove(tenant, lane, future)
+            raise
+        waited = time.monotonic() - started
+        self._record(tenant, lane, waited)
+        return waited
+
+    def release(self, tenant: str, lane: str = "interactive"):
+        self._running -= 1
+        self._running_lane[lane] -= 1
+        self._running_tenant[tenant] -= 1
+        if self._running_tenant[tenant] <= 0:
+            del self._running_tenant[tenant]
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tenant: str, lane: str = "interactive"):
+        waited = await self.acquire(tenant, lane)
+        try:
+            yield waited
+        finally:
+            self.release(tenant, lane)
+
+    # --- 지표 ---
+    def _record(self, tenant: str, lane: str, waited: float):
+        trace_metrics.observe("rag_scheduler_wait_seconds", {"lane": lane}, waited)
+        trace_metrics.inc("rag_scheduler_runs_total", {"lane": lane})
+        entry = self._waits.pop(tenant, None) or {"lane": lane, "count": 0, "waits": deque(maxlen=SCHEDULER_WAIT_WINDOW)}
+        entry["lane"] = lane
+        entry["count"] += 1
+        entry["waits"].append(waited)
+        self._waits[tenant] = entry
+        while len(self._waits) > SCHEDULER_MAX_TENANTS:
+            self._waits.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """레인별 실행/대기 수와 테넌트별 대기 시간 (최근 SCHEDULER_WAIT_WINDOW건)"""
+        lanes = {}
+        for lane in sorted(set(self.lane_weights) | set(self._queues)):
+            lanes[lane] = {
+                "weight": self.lane_weights.get(lane, 1.0),
+                "cap": self.lane_caps.get(lane, self.max_concurrent),
+                "running": self._running_lane[lane],
+                "queued": sum(len(q) for q in self._queues.get(lane, {}).values()),
+            }
+        tenants = {}
+        for tenant, entry in self._waits.items():
+            waits = sorted(entry["waits"])
+            queued = sum(len(lane_queues.get(tenant, ())) for lane_queues in self._queues.values())
+            tenants[tenant] = {
+                "lane": entry["lane"],
+                "count": entry["count"],
+                "running": self._running_tenant.get(tenant, 0),
+                "queued": queued,
+                "mean_wait": round(sum(waits) / len(waits), 4),
+                "p95_wait": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 4),
+                "max_wait": round(waits[-1], 4),
+            }
+        return {
+            "max_concurrent": self.max_concurrent,
+            "tenant_cap": self.tenant_cap,
+            "running": self._running,
+            "lanes": lanes,
+            "tenants": tenants,
+        }
+
+
+run_scheduler = RunScheduler()
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from typing import Dict, Any, Optional
+
+# --- 실행 상태 저장소 설정 ---
+# 'sqlite': 여러 uvicorn 워커가 같은 파일(WAL)을 공유하므로 어느 워커든 /status, /result에 응답 가능
+# 'memory': 단일 프로세스 전용 (기존 방식)
+RUN_STORE_BACKEND = os.getenv("RUN_STORE_BACKEND", "sqlite")
+RUN_STORE_DB_PATH = os.getenv("RUN_STORE_DB_PATH", "runs.sqlite")
+
+
+class AsyncRunStoreMixin:
+    """이벤트 루프에서 쓰는 비동기 버전. SQLite 잠금 대기(timeout=30)가 루프를 막지 않도록 스레드에서 실행"""
+
+    async def acreate(self, run_id: str, **fields):
+        await asyncio.to_thread(self.create, run_id, **fields)
+
+    async def aupdate(self, run_id: str, **fields):
+        await asyncio.to_thread(self.update, run_id, **fields)
+
+    async def aget(self, run_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get, run_id)
+
+
+class MemoryRunStore(AsyncRunStoreMixin):
+    """프로세스 메모리에 run 상태를 저장합니다. 구조: { run_id: { "status": ..., "result": ..., "error": ... } }"""
+
+    def __init__(self):
+        self._runs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock() # aget/aupdate가 스레드에서 호출됨
+
+    def create(self, run_id: str, **fields):
+        with self._lock:
+            self._runs[run_id] = {"status": "pending", **fields}
+
+    def update(self, run_id: str, **fields):
+        with self._lock:
+            self._runs.setdefault(run_id, {}).update(fields)
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            run = self._runs.get(run_id)
+            return dict(run) if run is not None else None
+
+    def __contains__(self, run_id: str) -> bool:
+        return run_id in self._runs
+
+
+class SqliteRunStore(AsyncRunStoreMixin):
+    """
+    SQLite(WAL)에 run 상태를 저장합니다. 워커 프로세스마다 연결을 따로 열고,
+    한 프로세스 안에서는 스레드별 연결을 사용합니다.
+    """
+
+    def __init__(self, path: str = RUN_STORE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, run_id: str, **fields):
+        data = json.dumps({"status": "pending", **fields}, ensure_ascii=False)
+        self._conn().execute(
+            "INSERT OR REPLACE INTO runs (run_id, data, updated_at) VALUES (?, ?, ?)",
+            (run_id, data, time.time()),
+        )
+
+    def update(self, run_id: str, **fields):
+        conn = self._conn()
+        # 읽기-수정-쓰기를 하나의 쓰기 트랜잭션으로 묶어 다른 워커의 갱신과 섞이지 않게 함
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            data = json.loads(row[0]) if row else {}
+            data.update(fields)
+            conn.execute(
+                "INSERT OR REPLACE INTO runs (run_id, data, updated_at) VALUES (?, ?, ?)",
+                (run_id, json.dumps(data, ensure_ascii=False, default=str), time.time()),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT data FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __contains__(self, run_id: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM runs WHERE run_id = ?", (run_id,)).fetchone() is not None
+
+
+def create_run_store():
+    if RUN_STORE_BACKEND == "sqlite":
+        return SqliteRunStore()
+    return MemoryRunStore()
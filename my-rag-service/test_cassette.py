@@ -0,0 +1,79 @@
+from typing import List, Literal, TypedDict
+
+import pytest
+from pydantic import BaseModel, Field
+from langgraph.graph import StateGraph, START, END
+
+import common_path  # noqa: F401 (llm_common)
+from llm_common.cassette import Cassette, CassetteMiss, taped, use_cassette
+from fake_api_server import FakeAPIServer
+from llm_common.rate_limiter import LimitedChatOpenAI
+
+
+class Verdict(BaseModel):
+    label: Literal["PASS", "FAIL"]
+    reasons: List[str] = Field(default_factory=list)
+
+
+CONFIG = {
+    "latency": {"chat": {"dist": "constant", "ms": 20}},
+    "rules": [
+        {"name": "reviewer", "match": "리뷰어", "content": "상태: PASS"},
+        {"name": "verdict", "schema": "Verdict", "json": {"label": "FAIL", "reasons": ["근거 부족"]}},
+    ],
+}
+
+
+class State(TypedDict):
+    text: str
+    verdict: str
+
+
+def build_graph(llm, prompt="당신은 코드 리뷰어입니다."):
+    def review(state):
+        answer = llm.invoke(prompt).content
+        hits = taped("search", "tavily", state["text"], lambda: [{"content": f"{state['text']} 결과"}])
+        return {"text": f"{answer} / {hits[0]['content']}"}
+
+    def judge(state):
+        return {"verdict": llm.with_structured_output(Verdict).invoke(f"평가하세요: {state['text']}").label}
+
+    graph = StateGraph(State)
+    graph.add_node("review", review)
+    graph.add_node("judge", judge)
+    graph.add_edge(START, "review")
+    graph.add_edge("review", "judge")
+    graph.add_edge("judge", END)
+    return graph.compile()
+
+
+def test_cassette_records_and_replays_llm_and_search_calls_offline(tmp_path):
+    """기록한 LLM(텍스트/구조화 출력)과 검색 호출을 서버 없이 그대로 재생하고, 바뀐 프롬프트는 같은 노드 기록으로 대체되는지 테스트."""
+    server = FakeAPIServer(CONFIG).start()
+    llm = LimitedChatOpenAI(model="gpt-4o-mini", base_url=f"{server.url}/v1", api_key="sk-test", max_retries=0)
+    try:
+        recorder = Cassette("record", meta={"query": "질의"})
+        with use_cassette(recorder):
+            recorded = build_graph(llm).invoke({"text": "질의"})
+    finally:
+        server.stop()
+    path = recorder.save(str(tmp_path / "cassette.jsonl.gz"))
+    assert recorded == {"text": "상태: PASS / 질의 결과", "verdict": "FAIL"}
+    assert [(e["kind"], e["node"]) for e in recorder.entries] == [("llm", "review"), ("search", "review"), ("llm", "judge")]
+    assert recorder.entries[0]["usage"]["total_tokens"] > 0
+    assert recorder.entries[0]["seconds"] >= 0.02
+
+    # 서버가 꺼진 상태에서 재생 (네트워크 호출이 있으면 연결 오류)
+    player = Cassette.load(path, latency_scale=0)
+    with use_cassette(player):
+        assert build_graph(llm).invoke({"text": "질의"}) == recorded
+    assert player.stats() == {"mode": "replay", "recorded": {"llm": 2, "search": 1}, "exact": 3, "fallback": 0,
+                              "missed": 0, "unused": {}}
+
+    # 프롬프트가 바뀌면 같은 노드의 기록으로 대체, strict 모드에서는 실패
+    changed = Cassette.load(path, latency_scale=0)
+    with use_cassette(changed):
+        assert build_graph(llm, prompt="새 리뷰어 프롬프트").invoke({"text": "질의"})["verdict"] == "FAIL"
+    assert changed.stats()["fallback"] == 1
+    with use_cassette(Cassette.load(path, latency_scale=0, strict=True)), pytest.raises(CassetteMiss):
+        build_graph(llm, prompt="새 리뷰어 프롬프트").invoke({"text": "질의"})
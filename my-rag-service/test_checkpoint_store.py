@@ -0,0 +1,121 @@
+import os
+import time
+import asyncio
+from typing import Annotated, List, TypedDict
+from unittest.mock import patch
+
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from langgraph.graph import StateGraph, START, END
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph.message import add_messages
+
+import checkpoint_store
+from blob_store import BlobStore
+from checkpoint_store import compact_checkpoints, compact_message_history, live_blob_digests, open_checkpointer, touch_thread
+
+
+class EchoState(TypedDict):
+    messages: Annotated[List[BaseMessage], add_messages]
+
+
+def _echo_graph(checkpointer):
+    workflow = StateGraph(EchoState)
+    workflow.add_node("echo", lambda state: {"messages": [AIMessage(content="ok")]})
+    workflow.add_edge(START, "echo")
+    workflow.add_edge("echo", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def test_sqlite_checkpointer_retention(tmp_path):
+    """SQLite 체크포인터가 재시작 후에도 상태를 유지하고, 보존 정책(최근 N개, TTL)을 적용하는지 테스트."""
+    db_path = str(tmp_path / "checkpoints.sqlite")
+
+    async def scenario():
+        with patch.object(checkpoint_store, "CHECKPOINT_BACKEND", "sqlite"), \
+             patch.object(checkpoint_store, "CHECKPOINT_DB_PATH", db_path):
+            async with open_checkpointer() as saver:
+                graph = _echo_graph(saver)
+                config = {"configurable": {"thread_id": "t1"}}
+                for i in range(4):
+                    await touch_thread(saver, "t1")
+                    await graph.ainvoke({"messages": [HumanMessage(content=f"q{i}")]}, config)
+
+                stats = await compact_checkpoints(saver, keep_last=2, ttl_seconds=3600)
+                assert stats["pruned_checkpoints"] > 0
+                async with saver.conn.execute("SELECT COUNT(*) FROM checkpoints WHERE thread_id = 't1'") as cur:
+                    assert (await cur.fetchone())[0] == 2
+
+            # 재시작 후에도 최신 상태가 남아 있어야 함
+            async with open_checkpointer() as saver:
+                snapshot = await _echo_graph(saver).aget_state({"configurable": {"thread_id": "t1"}})
+                assert len(snapshot.values["messages"]) == 8
+
+                # TTL 만료 -> 스레드 전체 삭제
+                stats = await compact_checkpoints(saver, keep_last=2, ttl_seconds=-1)
+                assert stats["expired_threads"] == 1
+                assert await saver.aget_tuple({"configurable": {"thread_id": "t1"}}) is None
+
+    asyncio.run(scenario())
+
+
+class DocState(TypedDict):
+    query: str
+    doc: str
+
+
+def _doc_graph(checkpointer, blobs):
+    workflow = StateGraph(DocState)
+    workflow.add_node("write", lambda state: {"doc": blobs.put(f"문서 {state['query']}")})
+    workflow.add_edge(START, "write")
+    workflow.add_edge("write", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def test_compaction_deletes_unreferenced_blobs(tmp_path):
+    """보존 정책으로 지워진 체크포인트의 블롭과 TTL이 지난 Chrome trace는 삭제하고, 남은 체크포인트가 참조하는 블롭은 유지하는지 테스트."""
+    blobs = BlobStore(str(tmp_path / "blobs"))
+    db_path = str(tmp_path / "checkpoints.sqlite")
+
+    def age_all_blobs():
+        past = time.time() - 7200
+        for folder, _, names in os.walk(blobs.directory):
+            for name in names:
+                os.utime(os.path.join(folder, name), (past, past))
+
+    async def scenario():
+        with patch.object(checkpoint_store, "CHECKPOINT_BACKEND", "sqlite"), \
+             patch.object(checkpoint_store, "CHECKPOINT_DB_PATH", db_path), \
+             patch.object(checkpoint_store, "blob_store", blobs):
+            async with open_checkpointer() as saver:
+                graph = _doc_graph(saver, blobs)
+                config = {"configurable": {"thread_id": "t1"}}
+                refs = [(await graph.ainvoke({"query": f"q{i}"}, config))["doc"] for i in range(3)]
+                trace_ref = blobs.put('{"traceEvents": []}')
+                age_all_blobs()
+                fresh_ref = blobs.put('{"traceEvents": ["fresh"]}') # 방금 저장된 trace는 TTL 전이므로 유지
+
+                with patch("blob_store.BLOB_TTL_SECONDS", 3600):
+                    stats = await compact_checkpoints(saver, keep_last=1, ttl_seconds=3600)
+                assert stats["deleted_blobs"] == 3 # 앞선 두 문서 + 오래된 trace
+                assert blobs.get(refs[-1]) == "문서 q2"
+                assert blobs.get(fresh_ref) == '{"traceEvents": ["fresh"]}'
+                for ref in refs[:-1] + [trace_ref]:
+                    assert not os.path.exists(blobs._path(ref[len("blob:"):]))
+
+    asyncio.run(scenario())
+
+
+def test_live_blob_digests_memory_saver(tmp_path):
+    """memory 체크포인터에서도 state에 남은 블롭 참조를 찾는지 테스트."""
+    blobs = BlobStore(str(tmp_path))
+    saver = MemorySaver()
+    ref = asyncio.run(_doc_graph(saver, blobs).ainvoke({"query": "q"}, {"configurable": {"thread_id": "t1"}}))["doc"]
+    assert asyncio.run(live_blob_digests(saver)) == {ref[len("blob:"):]}
+
+
+def test_compact_message_history():
+    """새 메시지를 더했을 때 최근 limit개만 남도록 오래된 메시지를 삭제 대상으로 고르는지 테스트."""
+    history = [HumanMessage(content=str(i), id=str(i)) for i in range(5)]
+    removals = compact_message_history(history, limit=3)
+    assert [m.id for m in removals] == ["0", "1", "2"]
+    assert compact_message_history(history[:1], limit=3) == []
@@ -0,0 +1,60 @@
+import asyncio
+
+from langchain_core.runnables import RunnableLambda
+
+import evaluation
+from evaluation import JudgeCache, run_evaluation, summarize_rows, token_cost
+from fake_api_server import FakeAPIServer
+from llm_common.rate_limiter import LimitedChatOpenAI
+
+CONFIG = {
+    "latency": {"chat": {"dist": "constant", "ms": 1}},
+    "rules": [
+        {"name": "judge", "match": "expert evaluator", "content": '{"completeness": 0.7, "relevance": 1.0, '
+         '"hallucination": 0.0, "format": 1.0, "reason": "ok"}'},
+    ],
+}
+
+
+def test_run_evaluation_runs_examples_concurrently_and_caches_verdicts(tmp_path, monkeypatch):
+    """예제를 동시에 평가하고, 같은 출력/기준의 판정은 캐시에서 가져오며, 출력이 바뀌면 다시 채점하는지 테스트."""
+    server = FakeAPIServer(CONFIG).start()
+    judge_llm = LimitedChatOpenAI(model="gpt-4o-mini", base_url=f"{server.url}/v1", api_key="sk-test",
+                                  max_retries=0, priority="batch")
+    monkeypatch.setattr(evaluation, "get_evaluator_llm", lambda: judge_llm)
+    answers = {"q1": "답 1", "q2": "답 2"}
+    running = {"now": 0, "peak": 0}
+
+    async def pipeline(inputs):
+        running["now"] += 1
+        running["peak"] = max(running["peak"], running["now"])
+        await asyncio.sleep(0.05)
+        running["now"] -= 1
+        return {"agent_results": {"final_doc": answers[inputs["messages"][0].content]}}
+
+    graph = RunnableLambda(lambda inputs: None, afunc=pipeline)
+    examples = [{"id": "a", "input": "q1", "expected": {"has_code": True}},
+                {"id": "b", "input": "q2", "expected": {}}]
+    cache = JudgeCache(str(tmp_path / "judge.sqlite"))
+    try:
+        rows = asyncio.run(run_evaluation(examples, concurrency=2, cache=cache, graph=graph))
+        assert running["peak"] == 2 # 두 예제가 동시에 실행됨
+        assert [row["id"] for row in rows] == ["a", "b"]
+        assert rows[0]["completeness"] == 0.7 and not rows[0]["judge_cached"]
+        assert rows[0]["judge_cost_usd"] > 0
+
+        answers["q2"] = "바뀐 답"
+        again = asyncio.run(run_evaluation(examples, concurrency=2, cache=cache, graph=graph))
+        assert [row["judge_cached"] for row in again] == [True, False]
+        assert server.stats()["chat:judge"]["calls"] == 3
+    finally:
+        server.stop()
+
+    summary = summarize_rows(again)
+    assert summary["judge_cache_hits"] == 1 and summary["completeness"] == 0.7
+
+
+def test_token_cost_uses_longest_price_prefix_and_cached_rate():
+    tokens = {"gpt-4o-mini-2024-07-18": {"prompt": 1_000_000, "completion": 1_000_000, "cached": 500_000}}
+    assert token_cost(tokens) == round(0.5 * 0.15 + 0.60 + 0.5 * 0.075, 6)
+    assert token_cost({"unknown-model": {"prompt": 1, "completion": 1, "cached": 0}}) is None
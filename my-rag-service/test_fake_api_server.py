@@ -0,0 +1,54 @@
+from typing import List, Literal
+
+from pydantic import BaseModel, Field
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from fake_api_server import FakeAPIServer, example_from_schema
+
+
+class Verdict(BaseModel):
+    label: Literal["PASS", "FAIL"]
+    reasons: List[str] = Field(default_factory=list)
+
+
+CONFIG = {
+    "latency": {"chat": {"dist": "constant", "ms": 1}},
+    "rules": [
+        {"name": "reviewer", "match": "리뷰어", "content": "상태: PASS"},
+        {"name": "verdict", "schema": "Verdict", "match": "엄격", "json": {"label": "FAIL", "reasons": ["근거 부족"]}},
+    ],
+}
+
+
+def test_example_from_schema_resolves_refs_and_enums():
+    """스크립트 규칙이 없을 때 스키마에서 만든 예시가 모델 검증을 통과하는지 테스트."""
+    example = example_from_schema(Verdict.model_json_schema())
+    assert Verdict.model_validate(example).label == "PASS"
+
+
+def test_fake_server_scripted_chat_structured_output_and_embeddings():
+    """규칙 매칭(텍스트/스키마), 구조화 출력(json_schema, tools), 결정적 임베딩, 통계 집계를 테스트."""
+    server = FakeAPIServer(CONFIG).start()
+    try:
+        llm = ChatOpenAI(model="gpt-4o-mini", base_url=f"{server.url}/v1", api_key="sk-test", max_retries=0)
+        assert llm.invoke("당신은 코드 리뷰어입니다.").content == "상태: PASS"
+        assert llm.invoke("안녕").content == "스텁 응답입니다."  # 매칭되는 규칙이 없으면 기본 응답
+
+        scripted = llm.with_structured_output(Verdict).invoke("엄격하게 평가하세요.")
+        assert scripted == Verdict(label="FAIL", reasons=["근거 부족"])
+        generated = llm.with_structured_output(Verdict, method="function_calling").invoke("평가하세요.")
+        assert generated.label == "PASS"
+
+        embeddings = OpenAIEmbeddings(model="text-embedding-3-small", base_url=f"{server.url}/v1", api_key="sk-test",
+                                      check_embedding_ctx_length=False)
+        first, second = embeddings.embed_documents(["같은 문장", "다른 문장"])
+        assert embeddings.embed_query("같은 문장") == first
+        assert first != second and abs(sum(v * v for v in first) - 1.0) < 1e-3
+
+        stats = server.stats()
+        assert stats["chat:reviewer"]["calls"] == 1
+        assert stats["chat:verdict"]["calls"] == 1
+        assert stats["chat:Verdict"]["calls"] == 1
+        assert stats["embeddings"]["calls"] >= 2
+    finally:
+        server.stop()
@@ -0,0 +1,39 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import common_path  # noqa: F401 (llm_common)
+from llm_common import hedging
+from llm_common.hedging import HedgeStats, hedged, ahedged
+
+
+def test_hedged_call_uses_faster_duplicate():
+    """첫 요청이 지연 기준(p90)을 넘기면 중복 요청을 보내고, 먼저 끝난 응답과 헤지 지표를 기록하는지 테스트."""
+    calls = []
+    def classify(text):
+        calls.append(text)
+        if len(calls) == 1:
+            time.sleep(0.5)  # 첫 요청만 느린 상황
+            return "slow"
+        return "fast"
+
+    stats = HedgeStats()
+    with patch.object(hedging, "LLM_HEDGING", True), patch.object(hedging, "HEDGE_INITIAL_DELAY", 0.05), \
+         patch.object(hedging, "hedge_stats", stats):
+        started = time.perf_counter()
+        assert hedged("router", classify, "q") == "fast"
+        assert time.perf_counter() - started < 0.4
+        assert len(calls) == 2
+
+        async def aclassify(text):
+            calls.append(text)
+            await asyncio.sleep(0.5 if len(calls) == 3 else 0)
+            return "async"
+        assert asyncio.run(ahedged("refiner", aclassify, "q")) == "async"
+
+        time.sleep(0.6)  # 첫 요청 완료 시점까지 기록
+        report = stats.report()
+    assert report["router"]["hedge_rate"] == 1.0
+    assert report["router"]["hedge_wins"] == 1
+    assert report["router"]["p99_improvement"] > 0.3
+    assert report["refiner"]["hedge_wins"] == 1
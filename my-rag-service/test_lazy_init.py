@@ -0,0 +1,32 @@
+import threading
+import time
+
+import common_path  # noqa: F401 (llm_common)
+from llm_common.lazy_init import Lazy
+
+
+def test_lazy_initializes_once_across_threads():
+    """여러 스레드가 동시에 처음 접근해도 factory가 한 번만 실행되고 같은 객체를 공유하는지 테스트."""
+    created = []
+    def factory():
+        time.sleep(0.05)  # 생성 중에 다른 스레드가 들어오는 상황
+        created.append(object())
+        return created[-1]
+
+    lazy = Lazy(factory, "client")
+    assert not lazy.initialized
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(lazy.get())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+
+    assert len(created) == 1
+    assert all(r is created[0] for r in results)
+    assert lazy.initialized
+
+    lazy.reset()
+    assert lazy.get() is not created[0]
+    assert len(created) == 2
@@ -0,0 +1,66 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import common_path  # noqa: F401 (llm_common)
+from llm_common.model_registry import ModelRegistry
+
+
+class Cancelled(Exception):
+    pass
+
+
+def _registry():
+    registry = ModelRegistry(
+        tiers={"fast": "small-model", "standard": "big-model"},
+        node_tiers={"judge": ["fast", "standard"]},
+        no_escalate=(Cancelled,),
+    )
+    fakes = {"fast": MagicMock(name="fast"), "standard": MagicMock(name="standard")}
+    return registry, fakes
+
+
+def test_cascade_escalates_only_when_rejected():
+    """저렴한 티어 출력이 검증을 통과하면 그대로 쓰고, 실패/예외일 때만 상위 티어로 넘어가는지 테스트."""
+    registry, fakes = _registry()
+    outputs = {"fast": iter(["PASS", "음...", "PASS"]), "standard": iter(["FAIL"])}
+    accept = lambda text: text in ("PASS", "FAIL")
+
+    with patch.object(registry, "model", side_effect=lambda tier, **_: fakes[tier]):
+        call = lambda model: next(outputs["fast" if model is fakes["fast"] else "standard"])
+        assert registry.invoke("judge", call, accept) == "PASS"
+        assert registry.invoke("judge", call, accept) == "FAIL"   # 형식 오류 -> standard
+        assert registry.invoke("writer", lambda model: model is fakes["standard"]) is True  # 기본 티어만 사용
+
+        def broken(model):
+            if model is fakes["fast"]:
+                raise ValueError("parse error")
+            return "PASS"
+        assert registry.invoke("judge", broken, accept) == "PASS"
+
+        async def acall(model):
+            return next(outputs["fast"])
+        assert asyncio.run(registry.ainvoke("judge", acall, accept)) == "PASS"
+
+    report = registry.report()
+    assert report["tiers"]["fast"]["calls"] == 4
+    assert report["tiers"]["fast"]["escalation_rate"] == 0.5
+    assert report["tiers"]["standard"]["calls"] == 3
+    assert report["nodes"]["judge"]["escalations"] == 2
+    assert report["nodes"]["writer"]["tiers"] == ["standard"]
+
+
+def test_cancellation_is_not_escalated():
+    """취소 같은 예외는 상위 티어로 재시도하지 않고 바로 전파하는지 테스트."""
+    registry, fakes = _registry()
+    calls = []
+
+    def cancelled(model):
+        calls.append(model)
+        raise Cancelled()
+
+    with patch.object(registry, "model", side_effect=lambda tier, **_: fakes[tier]):
+        try:
+            registry.invoke("judge", cancelled)
+        except Cancelled:
+            pass
+    assert calls == [fakes["fast"]]
@@ -0,0 +1,58 @@
+import json
+import time
+import threading
+import tracemalloc
+
+import common_path  # noqa: F401 (llm_common)
+from llm_common.profiling import RunProfiler
+
+
+def busy_render(seconds):
+    """스레드 풀 노드처럼 다른 스레드에서 CPU를 쓰고 메모리를 할당하는 작업"""
+    blobs = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        blobs.append(json.dumps({"doc": "x" * 200, "n": len(blobs)}))
+    return blobs
+
+
+def test_run_profiler_samples_worker_threads_and_saves_artifacts(tmp_path):
+    """다른 스레드의 CPU 사용과 할당이 프로파일에 잡히고, 산출물 파일이 저장되며, 끝나면 tracemalloc이 꺼지는지 테스트."""
+    assert not tracemalloc.is_tracing()
+    profiler = RunProfiler(interval=0.002).start()
+    kept = []
+    worker = threading.Thread(target=lambda: kept.append(busy_render(0.3)))
+    worker.start()
+    worker.join()
+    summary = profiler.dump(str(tmp_path / "profile"))
+
+    assert not tracemalloc.is_tracing()
+    assert summary["directory"] == str(tmp_path / "profile")
+    assert summary["wall_seconds"] >= 0.3
+
+    report = json.loads((tmp_path / "profile" / "profile.json").read_text(encoding="utf-8"))
+    assert report["samples"] > 0
+    assert report["top_functions"] # 순위는 샘플 위치에 따라 달라지므로 아래 접힌 스택(포함 시간)으로 확인
+    assert any("test_profiling.py" in row["location"] for row in report["top_allocations"])
+
+    collapsed = (tmp_path / "profile" / "stacks.collapsed").read_text(encoding="utf-8").splitlines()
+    assert any("busy_render (test_profiling.py" in line for line in collapsed)
+    assert not any("_sample_loop" in line for line in collapsed) # 샘플링 스레드 자신은 제외
+    assert (tmp_path / "profile" / "allocations.txt").read_text(encoding="utf-8")
+
+
+def test_top_functions_splits_self_and_total_time():
+    """접힌 스택에서 함수별 self(맨 위)/total(포함) CPU 시간과 self 기준 순위를 계산하는지 테스트."""
+    profiler = RunProfiler(top_n=2)
+    profiler.stacks.update({
+        "main;render;dumps": 300_000,   # µs
+        "main;render": 100_000,
+        "main;render;render_row;dumps": 200_000,
+        "main;fetch": 50_000,
+    })
+    rows = {row["function"]: row for row in profiler.top_functions()}
+
+    assert list(rows) == ["dumps", "render"] # self 기준 상위 2개
+    assert rows["dumps"]["self_cpu_seconds"] == 0.5 and rows["dumps"]["total_cpu_seconds"] == 0.5
+    assert rows["render"]["self_cpu_seconds"] == 0.1 and rows["render"]["total_cpu_seconds"] == 0.6
+    assert rows["dumps"]["self_pct"] == round(100 * 0.5 / 0.65, 1)
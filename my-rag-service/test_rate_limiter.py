@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+
+import common_path  # noqa: F401 (llm_common)
+from llm_common.rate_limiter import RateLimiter, priority, coalesce_prompts, _prompt_group
+
+
+def test_rate_limiter_priority_and_token_settlement():
+    """버킷이 비었을 때 대화형 요청이 배치 요청보다 먼저 통과하고, 실제 usage로 토큰이 정산되는지 테스트."""
+    limiter = RateLimiter("test", rpm=600, tpm=6000, burst_seconds=0.2)  # 10 req/s, 100 tok/s, 용량 2 req / 20 tok
+    limiter.acquire(tokens=20)
+    limiter.acquire()  # 요청 버킷도 비움
+
+    order = []
+    def worker(name):
+        with priority(name):
+            limiter.acquire(tokens=5)
+        order.append(name)
+
+    batch = threading.Thread(target=worker, args=("batch",))
+    batch.start()
+    time.sleep(0.02)  # 배치 요청이 먼저 줄을 섬
+    interactive = threading.Thread(target=worker, args=("interactive",))
+    interactive.start()
+    batch.join(timeout=5)
+    interactive.join(timeout=5)
+    assert order == ["interactive", "batch"]
+
+    stats = limiter.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["classes"]["batch"]["count"] == 1
+    assert stats["classes"]["batch"]["max_wait"] > 0
+
+    # 추정(20)보다 실제 사용(5)이 적으면 토큰을 돌려받음
+    before = limiter.tokens.level
+    limiter.settle(estimated=20, actual=5)
+    assert limiter.tokens.level > before
+
+    # 비동기 호출도 같은 줄을 사용
+    waited = asyncio.run(limiter.aacquire(tokens=1, priority_name="interactive"))
+    assert waited >= 0
+
+
+def test_coalesce_prompts_shares_identical_calls():
+    """배치 안에서 같은 프롬프트의 동시 호출은 실제 요청 1번으로 합쳐지고, 다른 프롬프트는 따로 호출되는지 테스트."""
+    sent = []
+    def call(prompt):
+        sent.append(prompt)
+        time.sleep(0.1)
+        return {"answer": prompt}
+
+    results = []
+    with coalesce_prompts() as group:
+        def worker(prompt):
+            results.append(group.run(prompt, lambda: call(prompt)))
+        threads = [threading.Thread(target=worker, args=(p,)) for p in ["a", "a", "a", "b"]]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+
+        async def acall():
+            return {"answer": "a"}
+        assert asyncio.run(group.arun("a", acall)) == {"answer": "a"}  # 완료된 결과도 재사용
+
+    assert sorted(sent) == ["a", "b"]
+    assert sorted(r["answer"] for r in results) == ["a", "a", "a", "b"]
+    assert group.stats() == {"calls": 5, "coalesced": 3, "unique": 2}
+    assert _prompt_group.get() is None
+
+
+def test_stop_check_abandons_wait_without_sending_llm_call():
+    """리미터를 기다리는 동안 run이 마감되면 버려진 호출이 버킷이 다시 찬 뒤에도 요청을 보내지 않는지 테스트."""
+    import pytest
+    from unittest.mock import patch
+    from langchain_core.messages import HumanMessage
+    from fake_api_server import FakeAPIServer
+    from llm_common import rate_limiter
+    from llm_common.rate_limiter import LimitedChatOpenAI
+    from run_control import start_run, finish_run, call_cancellable, RunCancelled
+
+    server = FakeAPIServer({"latency": {"chat": {"dist": "constant", "ms": 1}},
+                            "rules": [{"name": "any", "content": "ok"}]}).start()
+    limiter = RateLimiter("openai", rpm=60, burst_seconds=1)  # 초당 1회, 용량 1
+    limiter.acquire()  # 버킷을 비움
+    llm = LimitedChatOpenAI(model="gpt-4o-mini", base_url=f"{server.url}/v1", api_key="sk-test", max_retries=0)
+    start_run("limited_run", deadline_seconds=0.2)
+    try:
+        with patch.object(rate_limiter, "openai_limiter", limiter):
+            with pytest.raises(RunCancelled):
+                call_cancellable("limited_run", llm.invoke, [HumanMessage(content="hi")])
+            time.sleep(1.5)  # 버킷이 다시 찬 뒤에도
+        assert server.stats().get("chat:any", {}).get("calls", 0) == 0
+        assert limiter.stats()["queue_depth"] == 0
+        assert limiter.requests.level > 0  # 확보하지 않았으므로 한도도 쓰지 않음
+    finally:
+        finish_run("limited_run")
+        server.stop()
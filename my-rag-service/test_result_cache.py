@@ -0,0 +1,118 @@
+from result_cache import ResultCache
+
+
+VECTORS = {
+    "RAG 시스템에서 검색 품질을 높이는 방법은?": [1.0, 0.0, 0.0],
+    "RAG 검색 품질 개선 방법 알려줘": [0.98, 0.2, 0.0],   # 같은 질문의 다른 표현
+    "벡터 DB 비교": [0.0, 1.0, 0.0],
+}
+
+
+def test_result_cache_similarity_ttl_and_invalidation(tmp_path):
+    """유사한 질의는 hit, 다른 질의는 miss, TTL/무효화 후에는 miss가 되는지 테스트."""
+    embedded = []
+    def embed(text):
+        embedded.append(text)
+        return VECTORS[text]
+
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), threshold=0.9, ttl_seconds=60, embed=embed)
+    query = "RAG 시스템에서 검색 품질을 높이는 방법은?"
+    assert cache.lookup(query) is None
+    entry_id = cache.put(query, {"final_doc": "문서"}, run_id="r1")
+    assert embedded == [query]  # lookup에서 만든 임베딩을 put에서 재사용
+
+    exact = cache.lookup("  rag 시스템에서 검색 품질을   높이는 방법은? ")
+    assert exact["exact"] and exact["result"] == {"final_doc": "문서"}
+    similar = cache.lookup("RAG 검색 품질 개선 방법 알려줘")
+    assert similar["entry_id"] == entry_id and 0.9 <= similar["similarity"] < 1.0
+    assert cache.lookup("벡터 DB 비교") is None
+
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+    assert stats["hit_ratio"] == 0.5
+
+    # 유사 질의로 무효화
+    assert cache.invalidate(query="RAG 검색 품질 개선 방법 알려줘") == 1
+    assert cache.lookup(query) is None
+
+    # TTL 만료
+    expired = ResultCache(str(tmp_path / "cache.sqlite"), threshold=0.9, ttl_seconds=0, embed=embed)
+    expired.put("벡터 DB 비교", {"final_doc": "비교"})
+    assert expired.lookup("벡터 DB 비교") is None
+
+
+def test_process_graph_uses_cache_only_for_threads_without_history(tmp_path, monkeypatch):
+    """캐시 hit은 이전 대화가 없는 스레드에서만 쓰이고, hit이어도 질의/답변이 스레드에 남는지 테스트."""
+    import asyncio
+    import main
+    from langgraph.checkpoint.memory import MemorySaver
+    from pipeline import build_app
+    from run_store import MemoryRunStore
+
+    class CountingGraph:
+        """체크포인트는 실제 그래프를 쓰고, ainvoke만 고정 결과를 반환"""
+        checkpointer = None
+
+        def __init__(self):
+            self.app = build_app(MemorySaver())
+            self.invoked = 0
+
+        async def aget_state(self, config):
+            return await self.app.aget_state(config)
+
+        async def aupdate_state(self, *args, **kwargs):
+            return await self.app.aupdate_state(*args, **kwargs)
+
+        async def ainvoke(self, inputs, config=None):
+            self.invoked += 1
+            return {"agent_results": {"final_doc": "새로 작성한 문서 " * 10}}
+
+    query = "RAG 시스템에서 검색 품질을 높이는 방법은?"
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), threshold=0.9, ttl_seconds=60, embed=lambda text: VECTORS[text])
+    cache.put(query, {"final_doc": "캐시된 문서", "metrics": {}}, run_id="r0")
+    graph, store = CountingGraph(), MemoryRunStore()
+    monkeypatch.setattr(main, "result_cache", cache)
+    monkeypatch.setattr(main, "run_store", store)
+    monkeypatch.setattr(main, "get_graph_app", lambda: graph)
+    monkeypatch.setattr(main, "RUN_SCHEDULER", False)
+
+    async def run(run_id, thread_id):
+        store.create(run_id)
+        await main.process_graph(run_id, query, thread_id, chrome_trace=False)
+        return store.get(run_id)
+
+    first = asyncio.run(run("run1", "thread-a"))
+    assert first["status"] == "completed" and first["result"]["metrics"]["cached"]
+    assert graph.invoked == 0
+    messages = asyncio.run(graph.aget_state({"configurable": {"thread_id": "thread-a"}})).values["messages"]
+    assert [(m.type, m.content) for m in messages] == [("human", query), ("ai", "캐시된 문서")]
+
+    # 같은 스레드의 다음 턴은 대화 맥락이 있으므로 캐시를 조회하지도, 결과를 저장하지도 않음
+    second = asyncio.run(run("run2", "thread-a"))
+    assert second["status"] == "completed" and not second["result"]["metrics"]["cached"]
+    assert graph.invoked == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["entries"] == 1
+
+
+def test_submit_run_without_thread_id_uses_fresh_thread(monkeypatch):
+    """thread_id를 생략한 요청은 run마다 새 스레드를 받아 다른 요청의 대화 기록(과 캐시 제외)을 공유하지 않는지 테스트."""
+    import asyncio
+    import main
+    from fastapi import BackgroundTasks
+    from models import RunRequest
+    from run_store import MemoryRunStore
+
+    monkeypatch.setattr(main, "run_store", MemoryRunStore())
+
+    def submit(request):
+        tasks = BackgroundTasks()
+        response = asyncio.run(main.submit_run(request, tasks, profile=False, x_profile=None, x_client_id=None))
+        return response.run_id, tasks.tasks[0].args
+
+    run_a, args_a = submit(RunRequest(query="q"))
+    run_b, args_b = submit(RunRequest(query="q"))
+    assert (args_a[2], args_b[2]) == (run_a, run_b)  # thread_id = run_id
+    assert (args_a[7], args_b[7]) == (run_a, run_b)  # 익명 run끼리 테넌트 상한을 나눠 쓰지 않음
+    _, args_c = submit(RunRequest(query="q", thread_id="conversation-1"))
+    assert args_c[2] == args_c[7] == "conversation-1"
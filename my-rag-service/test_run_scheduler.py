@@ -0,0 +1,126 @@
+import asyncio
+
+from run_scheduler import RunScheduler
+
+
+async def _run_jobs(scheduler, jobs, hold=0.01):
+    """(tenant, lane) 목록을 한꺼번에 제출하고 슬롯을 받은 순서를 반환"""
+    order = []
+
+    async def job(tenant, lane):
+        async with scheduler.slot(tenant, lane):
+            order.append((tenant, lane))
+            await asyncio.sleep(hold)
+
+    tasks = [asyncio.create_task(job(tenant, lane)) for tenant, lane in jobs]
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_tenants_take_turns_instead_of_arrival_order():
+    """한 테넌트가 먼저 많이 제출해도 나중에 온 테넌트가 번갈아 슬롯을 받는지 테스트."""
+    scheduler = RunScheduler(max_concurrent=1, lane_weights={"interactive": 1, "bulk": 1}, lane_caps={}, tenant_cap=1)
+    jobs = [("a", "interactive")] * 4 + [("b", "interactive")] * 2
+    order = asyncio.run(_run_jobs(scheduler, jobs))
+    assert [tenant for tenant, _ in order] == ["a", "b", "a", "b", "a", "a"]
+
+    stats = scheduler.stats()
+    assert stats["running"] == 0 and stats["tenants"]["a"]["count"] == 4
+    assert stats["tenants"]["b"]["max_wait"] <= stats["tenants"]["a"]["max_wait"]
+
+
+def test_interactive_lane_is_not_starved_by_bulk_backlog():
+    """bulk 배치가 밀려 있어도 대화형 run이 bulk 상한 밖의 슬롯으로 바로 시작하는지 테스트."""
+    scheduler = RunScheduler(max_concurrent=3, lane_weights={"interactive": 4, "bulk": 1}, lane_caps={"bulk": 2}, tenant_cap=2)
+    peak = {"bulk": 0, "batch": 0}
+    waits = {}
+
+    async def bulk_job():
+        async with scheduler.slot("batch", "bulk"):
+            peak["bulk"] = max(peak["bulk"], scheduler.stats()["lanes"]["bulk"]["running"])
+            await asyncio.sleep(0.05)
+
+    async def main():
+        bulk = [asyncio.create_task(bulk_job()) for _ in range(6)]
+        await asyncio.sleep(0.01)
+        waits["interactive"] = await scheduler.acquire("user", "interactive")
+        scheduler.release("user", "interactive")
+        await asyncio.gather(*bulk)
+
+    asyncio.run(main())
+    assert peak["bulk"] == 2 # bulk 레인 상한(그리고 테넌트 상한)을 넘지 않음
+    assert waits["interactive"] < 0.01
+
+
+def test_cancelled_waiter_leaves_queue_without_leaking_slots():
+    """대기 중 취소된 요청은 큐에서 빠지고 슬롯 수가 어긋나지 않는지 테스트."""
+    scheduler = RunScheduler(max_concurrent=1, lane_caps={}, tenant_cap=1)
+
+    async def main():
+        await scheduler.acquire("a")
+        waiter = asyncio.create_task(scheduler.acquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert scheduler.stats()["lanes"]["interactive"]["queued"] == 0
+        scheduler.release("a")
+        assert await asyncio.wait_for(scheduler.acquire("c"), 1) < 1
+        scheduler.release("c")
+
+    asyncio.run(main())
+    assert scheduler.stats()["running"] == 0
+
+
+def test_run_cancelled_while_waiting_for_slot_is_marked_cancelled(monkeypatch):
+    """슬롯을 기다리는 run에 취소 요청이 오면 슬롯을 받을 때까지 기다리지 않고 바로 cancelled가 되는지 테스트."""
+    import main
+    from run_store import MemoryRunStore
+
+    scheduler = RunScheduler(max_concurrent=1, lane_caps={}, tenant_cap=1)
+    store = MemoryRunStore()
+    monkeypatch.setattr(main, "run_scheduler", scheduler)
+    monkeypatch.setattr(main, "run_store", store)
+    monkeypatch.setattr(main, "result_cache", None)
+    monkeypatch.setattr(main, "RUN_SCHEDULER", True)
+
+    async def scenario():
+        await scheduler.acquire("other") # 유일한 슬롯을 다른 테넌트가 사용 중
+        store.create("queued_run")
+        task = asyncio.create_task(main.process_graph("queued_run", "q", "thread-q", chrome_trace=False))
+        await asyncio.sleep(0.1)
+        assert scheduler.stats()["lanes"]["interactive"]["queued"] == 1
+        store.update("queued_run", cancel_requested=True)
+        await asyncio.wait_for(task, 2)
+        assert scheduler.stats()["lanes"]["interactive"]["queued"] == 0
+        scheduler.release("other")
+
+    asyncio.run(scenario())
+    assert store.get("queued_run")["status"] == "cancelled"
+    assert scheduler.stats()["running"] == 0
+
+
+def test_run_setup_failure_releases_slot_and_marks_failed(tmp_path, monkeypatch):
+    """실행 준비(카세트 로드 등)가 실패해도 슬롯/감시 태스크/run_control이 정리되고 run이 failed가 되는지 테스트."""
+    import main
+    import run_control
+    from run_store import MemoryRunStore
+
+    scheduler = RunScheduler(max_concurrent=1, lane_caps={}, tenant_cap=1)
+    store = MemoryRunStore()
+    monkeypatch.setattr(main, "run_scheduler", scheduler)
+    monkeypatch.setattr(main, "run_store", store)
+    monkeypatch.setattr(main, "result_cache", None)
+    monkeypatch.setattr(main, "RUN_SCHEDULER", True)
+    monkeypatch.setattr(main, "CASSETTE_REPLAY", str(tmp_path / "missing.jsonl.gz"))
+
+    async def scenario():
+        store.create("broken_run")
+        await asyncio.wait_for(main.process_graph("broken_run", "q", "thread-b", chrome_trace=False), 2)
+        await asyncio.sleep(0)
+        return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    leftover = asyncio.run(scenario())
+    assert store.get("broken_run")["status"] == "failed"
+    assert scheduler.stats()["running"] == 0
+    assert run_control.get_control("broken_run") is None
+    assert leftover == []
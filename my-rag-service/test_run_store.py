@@ -0,0 +1,53 @@
+import asyncio
+import multiprocessing
+
+from run_store import SqliteRunStore
+
+
+def _worker_complete(db_path, run_id):
+    # 다른 워커 프로세스가 작업을 끝내고 결과를 기록하는 상황
+    store = SqliteRunStore(db_path)
+    store.update(run_id, status="running")
+    store.update(run_id, status="completed", result={"final_doc": "문서"})
+
+
+def test_sqlite_run_store_shared_across_processes(tmp_path):
+    """한 워커에서 등록한 run을 다른 워커 프로세스가 갱신하고, 원래 워커에서 결과를 조회할 수 있는지 테스트."""
+    db_path = str(tmp_path / "runs.sqlite")
+    store = SqliteRunStore(db_path)
+    store.create("r1")
+    assert store.get("r1") == {"status": "pending"}
+    assert "r2" not in store and store.get("r2") is None
+
+    proc = multiprocessing.get_context("spawn").Process(target=_worker_complete, args=(db_path, "r1"))
+    proc.start()
+    proc.join(timeout=30)
+    assert proc.exitcode == 0
+
+    state = store.get("r1")
+    assert state["status"] == "completed"
+    assert state["result"]["final_doc"] == "문서"
+
+    # 이벤트 루프용 비동기 버전은 같은 저장소를 스레드에서 읽고 씀
+    asyncio.run(store.aupdate("r1", cancel_requested=True))
+    assert asyncio.run(store.aget("r1"))["cancel_requested"] is True
+
+
+def test_batch_results_stream_ends_for_missing_and_stuck_runs(monkeypatch):
+    """저장소에 없는 항목과 끝나지 않는 항목이 있어도 배치 결과 스트림이 대기 한도 안에 끝나는지 테스트."""
+    import json
+    import main
+    from run_store import MemoryRunStore
+
+    store = MemoryRunStore()
+    store.create("done", status="completed", result={"final_doc": "문서"})
+    store.create("stuck")  # pending에서 멈춘 run
+    monkeypatch.setattr(main, "run_store", store)
+
+    async def collect():
+        return [json.loads(line) async for line in main.iter_batch_results(["done", "gone", "stuck"], True, max_wait=0.2, poll_seconds=0.05)]
+
+    lines = asyncio.run(asyncio.wait_for(collect(), 2))
+    assert [(line["run_id"], line["status"]) for line in lines] == [("done", "completed"), ("gone", "missing"), ("stuck", "pending")]
+    assert lines[0]["final_doc"] == "문서" and lines[0]["error"] is None
+    assert lines[2]["error"] == "timed out waiting for result"
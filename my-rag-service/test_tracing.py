@@ -0,0 +1,93 @@
+from typing import TypedDict
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import StateGraph, START, END
+
+from tracing import MetricsRegistry, RunTracer
+
+
+class State(TypedDict):
+    text: str
+
+
+def build_graph(llm):
+    """main: plan -> worker_subgraph(execute: LLM + search) 구조의 작은 그래프"""
+    def execute(state):
+        answer = llm.invoke(state["text"]).content
+        RunnableLambda(lambda q: [q], name="search:local_corpus").invoke(answer)
+        return {"text": answer}
+
+    sub = StateGraph(State)
+    sub.add_node("execute", execute)
+    sub.add_edge(START, "execute")
+    sub.add_edge("execute", END)
+    subgraph = sub.compile()
+
+    main = StateGraph(State)
+    main.add_node("plan", lambda state: {"text": state["text"] + "!"})
+    main.add_node("worker_subgraph", lambda state: subgraph.invoke(state))
+    main.add_edge(START, "plan")
+    main.add_edge("plan", "worker_subgraph")
+    main.add_edge("worker_subgraph", END)
+    return main.compile()
+
+
+def test_run_tracer_builds_span_tree_and_prometheus_metrics():
+    """서브그래프 노드 경로, LLM 모델/토큰, 검색 span이 트리와 Prometheus 지표에 기록되는지 테스트."""
+    reply = AIMessage(content="답변", usage_metadata={
+        "input_tokens": 12, "output_tokens": 5, "total_tokens": 17, "input_token_details": {"cache_read": 4},
+    })
+    llm = GenericFakeChatModel(messages=iter([reply]))
+    registry = MetricsRegistry()
+    tracer = RunTracer(registry)
+
+    build_graph(llm).invoke({"text": "질문"}, {"callbacks": [tracer]})
+
+    roots = tracer.tree()
+    assert [r["name"] for r in roots] == ["plan", "worker_subgraph"]
+    execute = roots[1]["children"][0]
+    assert execute["name"] == "worker_subgraph/execute" and execute["kind"] == "node"
+    llm_span, search_span = execute["children"]
+    assert llm_span["kind"] == "llm" and (llm_span["prompt_tokens"], llm_span["completion_tokens"], llm_span["cached_tokens"]) == (12, 5, 4)
+    assert search_span == {**search_span, "kind": "search", "name": "local_corpus"}
+
+    summary = tracer.summary()
+    assert summary["totals"] == {"prompt_tokens": 12, "completion_tokens": 5, "cached_tokens": 4, "llm_calls": 1, "search_calls": 1}
+    assert summary["nodes"]["worker_subgraph/execute"]["llm_calls"] == 1
+
+    text = registry.render()
+    assert "# TYPE rag_node_duration_seconds histogram" in text
+    assert 'rag_node_duration_seconds_count{node="execute",subgraph="worker_subgraph"} 1' in text
+    assert 'rag_llm_tokens_total{kind="prompt",model="unknown",node="execute",subgraph="worker_subgraph"} 12' in text
+    assert 'rag_search_calls_total{node="execute",outcome="ok",subgraph="worker_subgraph",tool="local_corpus"} 1' in text
+
+
+def test_chrome_trace_puts_parallel_branches_on_separate_tracks():
+    """병렬로 실행된 노드는 서로 다른 트랙, 노드 안의 호출은 노드와 같은 트랙에 놓이는지 테스트."""
+    import time
+
+    def slow(name):
+        def node(state):
+            RunnableLambda(lambda _: time.sleep(0.05), name=f"io:write {name}").invoke(None)
+            return {}
+        return node
+
+    graph = StateGraph(State)
+    graph.add_node("left", slow("left"))
+    graph.add_node("right", slow("right"))
+    graph.add_edge(START, "left")
+    graph.add_edge(START, "right")
+    graph.add_edge("left", END)
+    graph.add_edge("right", END)
+    tracer = RunTracer(MetricsRegistry())
+    graph.compile().invoke({"text": ""}, {"callbacks": [tracer]})
+
+    trace = tracer.chrome_trace("r1")
+    spans = {e["name"]: e for e in trace["traceEvents"] if e["ph"] == "X"}
+    assert spans["left"]["tid"] != spans["right"]["tid"]
+    assert spans["write left"]["tid"] == spans["left"]["tid"] and spans["write left"]["cat"] == "io"
+    assert spans["write right"]["tid"] == spans["right"]["tid"]
+    tracks = {e["tid"]: e["args"]["name"] for e in trace["traceEvents"] if e["name"] == "thread_name"}
+    assert len(tracks) == 2 and tracks[1] == "main"  # 먼저 시작한 분기는 main 트랙을 이어 씀
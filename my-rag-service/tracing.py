@@ -0,0 +1,401 @@
+import os
+import time
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# --- 추적 설정 ---
+# 모든 그래프 노드(서브그래프 노드 포함)와 LLM/검색 호출을 콜백으로 계측해 Prometheus 지표(/metrics)로 집계하고,
+# run 결과에는 span 트리(result["trace"])를 첨부합니다.
+TRACE_SPANS = os.getenv("TRACE_SPANS", "1") == "1"
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# 이름이 이 접두사로 시작하는 Runnable 실행은 해당 종류의 span으로 기록 (예: search:local_corpus, io:write Code_Done)
+RUN_NAME_KINDS = {"search:": "search", "io:": "io"}
+MAIN_GRAPH = "main"
+
+# 지표 이름 -> (유형, 설명)
+METRIC_DEFINITIONS = {
+    "rag_runs_total": ("counter", "Finished runs by final status"),
+    "rag_run_duration_seconds": ("histogram", "End-to-end run duration"),
+    "rag_node_duration_seconds": ("histogram", "Graph node duration by subgraph and node"),
+    "rag_node_errors_total": ("counter", "Graph node executions that raised"),
+    "rag_node_retries_total": ("counter", "Repeated executions of a subgraph node within one subgraph call (reflection rounds)"),
+    "rag_llm_duration_seconds": ("histogram", "LLM call duration by calling node and model"),
+    "rag_llm_calls_total": ("counter", "LLM calls by calling node, model and outcome"),
+    "rag_llm_tokens_total": ("counter", "LLM tokens by calling node, model and kind (prompt/completion/cached)"),
+    "rag_llm_retries_total": ("counter", "LLM call retries reported by LangChain retry wrappers"),
+    "rag_search_duration_seconds": ("histogram", "Search call duration by calling node and tool"),
+    "rag_search_calls_total": ("counter", "Search calls by calling node, tool and outcome"),
+}
+
+
+class MetricsRegistry:
+    """Prometheus 텍스트 형식(0.0.4)으로 내보내는 최소한의 counter/histogram 모음 (프로세스 단위)"""
+
+    def __init__(self, definitions: Dict[str, Tuple[str, str]] = METRIC_DEFINITIONS,
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._meta: Dict[str, Tuple[str, str]] = dict(definitions)
+        self._counters: Dict[str, Dict[Tuple, float]] = defaultdict(lambda: defaultdict(float))
+        self._histograms: Dict[str, Dict[Tuple, List[float]]] = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name: str, labels: Dict[str, str], value: float = 1.0):
+        with self._lock:
+            self._counters[name][tuple(sorted(labels.items()))] += value
+
+    def observe(self, name: str, labels: Dict[str, str], seconds: float):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            # [버킷별 누적 개수..., 합계, 개수]
+            values = self._histograms[name].setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    values[i] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    @staticmethod
+    def _labels(key: Tuple, extra: Tuple = ()) -> str:
+        items = list(key) + list(extra)
+        if not items:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._meta):
+                kind, help_text = self._meta[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "histogram":
+                    for key, values in sorted(self._histograms.get(name, {}).items()):
+                        for bound, count in zip(self.buckets, values):
+                            lines.append(f"{name}_bucket{self._labels(key, (('le', repr(float(bound))),))} {count:g}")
+                        lines.append(f"{name}_bucket{self._labels(key, (('le', '+Inf'),))} {values[-1]:g}")
+                        lines.append(f"{name}_sum{self._labels(key)} {values[-2]:.6f}")
+                        lines.append(f"{name}_count{self._labels(key)} {values[-1]:g}")
+                else:
+                    for key, value in sorted(self._counters.get(name, {}).items()):
+                        lines.append(f"{name}{self._labels(key)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def split_path(path: Optional[str]) -> Dict[str, str]:
+    """'code_subgraph/reflect' -> {'subgraph': 'code_subgraph', 'node': 'reflect'}, 'supervisor' -> main 그래프 노드"""
+    if not path:
+        return {"subgraph": MAIN_GRAPH, "node": "none"}
+    head, _, rest = path.partition("/")
+    return {"subgraph": head, "node": rest} if rest else {"subgraph": MAIN_GRAPH, "node": head}
+
+
+def _token_usage(response) -> Dict[str, int]:
+    """LLMResult에서 prompt/completion/cached 토큰 (usage_metadata 우선, 없으면 llm_output.token_usage)"""
+    usage = {"prompt": 0, "completion": 0, "cached": 0}
+    found = False
+    for generations in response.generations or []:
+        for generation in generations:
+            meta = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if meta:
+                found = True
+                usage["prompt"] += meta.get("input_tokens", 0)
+                usage["completion"] += meta.get("output_tokens", 0)
+                usage["cached"] += (meta.get("input_token_details") or {}).get("cache_read", 0) or 0
+    if not found:
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        usage["prompt"] = token_usage.get("prompt_tokens", 0) or 0
+        usage["completion"] = token_usage.get("completion_tokens", 0) or 0
+        usage["cached"] = ((token_usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)) or 0
+    return usage
+
+
+class RunTracer(BaseCallbackHandler):
+    """
+    run 하나의 span 트리를 만드는 콜백 핸들러. 그래프 실행 config의 callbacks로 넘기면
+    서브그래프 노드(invoke_subgraph), 스레드풀(call_cancellable/헤징)에서 실행되는 호출까지 컨텍스트로 전파됩니다.
+    - node   : LangGraph 노드 실행 (이름은 '부모노드/노드' 경로)
+    - llm    : 채팅 모델 호출 (모델, 토큰)
+    - search : 검색 도구/검색기 호출 (Tavily 도구, 'search:' 이름의 Runnable)
+    - io     : 파일 쓰기 등 ('io:' 이름의 Runnable)
+    span이 끝날 때마다 전역 metrics에도 기록합니다.
+    """
+
+    raise_error = False
+
+    def __init__(self, registry: Optional[MetricsRegistry] = metrics):
+        self.registry = registry
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._spans: Dict[Any, Dict[str, Any]] = {}
+        self._order: List[Any] = []
+        self._context: Dict[Any, Tuple[Optional[str], Any]] = {}  # LangChain run_id -> (노드 경로, 가장 가까운 span)
+        self._repeats: Dict[Tuple[Any, str], int] = defaultdict(int)
+
+    # --- span 관리 ---
+    def _open(self, run_id, parent_run_id, kind: str, name: str, path: Optional[str], **attrs):
+        with self._lock:
+            _, parent_span = self._context.get(parent_run_id, (None, None))
+            self._spans[run_id] = {
+                "id": str(run_id), "parent": parent_span, "kind": kind, "name": name, "path": path,
+                "start": time.perf_counter(), "end": None, "status": "ok", **attrs,
+            }
+            self._order.append(run_id)
+            self._context[run_id] = (path, run_id)
+            if kind == "node":
+                self._repeats[(parent_span, name)] += 1
+                repeat = self._repeats[(parent_span, name)]
+                self._spans[run_id]["attempt"] = repeat
+        if kind == "node" and repeat > 1 and "/" in path and self.registry:  # 서브그래프 성찰 루프의 재실행만 (main 노드 반복은 정상 흐름)
+            self.registry.inc("rag_node_retries_total", split_path(path))
+
+    def _inherit(self, run_id, parent_run_id):
+        with self._lock:
+            self._context[run_id] = self._context.get(parent_run_id, (None, None))
+
+    def _close(self, run_id, error: Optional[BaseException] = None, **attrs):
+        with self._lock:
+            self._context.pop(run_id, None)
+            span = self._spans.get(run_id)
+            if span is None or span["end"] is not None:
+                return
+            span["end"] = time.perf_counter()
+            span.update(attrs)
+            if error is not None:
+                span["status"] = "error"
+                span["error"] = f"{type(error).__name__}: {error}"[:300]
+        if self.registry:
+            self._record(span)
+
+    def _record(self, span: Dict[str, Any]):
+        seconds = span["end"] - span["start"]
+        labels = split_path(span["path"])
+        outcome = span["status"]
+        if span["kind"] == "node":
+            self.registry.observe("rag_node_duration_seconds", labels, seconds)
+            if outcome == "error":
+                self.registry.inc("rag_node_errors_total", labels)
+        elif span["kind"] == "llm":
+            model_labels = dict(labels, model=span.get("model") or "unknown")
+            self.registry.observe("rag_llm_duration_seconds", model_labels, seconds)
+            self.registry.inc("rag_llm_calls_total", dict(model_labels, outcome=outcome))
+            for kind in ("prompt", "completion", "cached"):
+                if span.get(f"{kind}_tokens"):
+                    self.registry.inc("rag_llm_tokens_total", dict(model_labels, kind=kind), span[f"{kind}_tokens"])
+        elif span["kind"] == "search":
+            tool_labels = dict(labels, tool=span["name"])
+            self.registry.observe("rag_search_duration_seconds", tool_labels, seconds)
+            self.registry.inc("rag_search_calls_total", dict(tool_labels, outcome=outcome))
+
+    # --- LangChain 콜백 ---
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        name = kwargs.get("name") or ""
+        if node and name == node:
+            parent_path = self._context.get(parent_run_id, (None, None))[0]
+            self._open(run_id, parent_run_id, "node", node, f"{parent_path}/{node}" if parent_path else node)
+        elif any(name.startswith(prefix) for prefix in RUN_NAME_KINDS):
+            prefix = next(p for p in RUN_NAME_KINDS if name.startswith(p))
+            path = self._context.get(parent_run_id, (None, None))[0]
+            self._open(run_id, parent_run_id, RUN_NAME_KINDS[prefix], name[len(prefix):], path)
+        else:
+            self._inherit(run_id, parent_run_id)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._close(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._close(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or (metadata or {}).get("ls_model_name")
+        path = self._context.get(parent_run_id, (None, None))[0]
+        self._open(run_id, parent_run_id, "llm", model or "llm", path, model=model)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self.on_chat_model_start(serialized, prompts, run_id=run_id, parent_run_id=parent_run_id, metadata=metadata, **kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = _token_usage(response)
+        self._close(run_id, prompt_tokens=usage["prompt"], completion_tokens=usage["completion"],
+                    cached_tokens=usage["cached"])
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._close(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        path = self._context.get(parent_run_id, (None, None))[0]
+        self._open(run_id, parent_run_id, "search", name, path)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._close(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._close(run_id, error)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "retriever"
+        path = self._context.get(parent_run_id, (None, None))[0]
+        self._open(run_id, parent_run_id, "search", name, path)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._close(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._close(run_id, error)
+
+    def on_retry(self, retry_state, *, run_id, parent_run_id=None, **kwargs):
+        if self.registry:
+            path = self._context.get(run_id, self._context.get(parent_run_id, (None, None)))[0]
+            self.registry.inc("rag_llm_retries_total", split_path(path))
+
+    # --- 결과 ---
+    def _finished(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(self._spans[i]) for i in self._order if self._spans[i]["end"] is not None]
+
+    def node_durations(self) -> Dict[str, List[float]]:
+        """노드 경로별 실행 시간(초) 목록"""
+        durations: Dict[str, List[float]] = defaultdict(list)
+        for span in self._finished():
+            if span["kind"] == "node":
+                durations[span["path"]].append(span["end"] - span["start"])
+        return dict(durations)
+
+    def models_used(self) -> List[str]:
+        return sorted({s["model"] for s in self._finished() if s["kind"] == "llm" and s.get("model")})
+
+    def model_tokens(self) -> Dict[str, Dict[str, int]]:
+        """모델별 prompt/completion/cached 토큰 합계 (비용 계산용)"""
+        tokens: Dict[str, Dict[str, int]] = defaultdict(lambda: {"prompt": 0, "completion": 0, "cached": 0})
+        for span in self._finished():
+            if span["kind"] == "llm":
+                for kind in ("prompt", "completion", "cached"):
+                    tokens[span.get("model") or "unknown"][kind] += span.get(f"{kind}_tokens", 0)
+        return dict(tokens)
+
+    def summary(self) -> Dict[str, Any]:
+        """subgraph/노드별 소요 시간·LLM 호출·토큰 합계 (어느 단계가 지연 시간과 비용을 차지하는지)"""
+        nodes: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        totals: Dict[str, float] = defaultdict(float)
+        for span in self._finished():
+            key = span["path"] or MAIN_GRAPH
+            entry = nodes[key]
+            if span["kind"] == "node":
+                entry["seconds"] += span["end"] - span["start"]
+                entry["executions"] += 1
+            elif span["kind"] == "llm":
+                entry["llm_calls"] += 1
+                entry["llm_seconds"] += span["end"] - span["start"]
+                for kind in ("prompt", "completion", "cached"):
+                    entry[f"{kind}_tokens"] += span.get(f"{kind}_tokens", 0)
+                    totals[f"{kind}_tokens"] += span.get(f"{kind}_tokens", 0)
+                totals["llm_calls"] += 1
+            elif span["kind"] == "search":
+                entry["search_calls"] += 1
+                entry["search_seconds"] += span["end"] - span["start"]
+                totals["search_calls"] += 1
+            if span["status"] == "error":
+                entry["errors"] += 1
+        rounded = {
+            path: {k: round(v, 3) if isinstance(v, float) and not v.is_integer() else int(v) for k, v in entry.items()}
+            for path, entry in sorted(nodes.items())
+        }
+        return {"nodes": rounded, "totals": {k: int(v) for k, v in totals.items()}}
+
+    def tree(self) -> List[Dict[str, Any]]:
+        """시작 시각 순으로 정렬된 span 트리 (시각은 run 시작 기준 ms)"""
+        spans = self._finished()
+        known = {s["id"] for s in spans}
+        nodes = {}
+        for span in spans:
+            entry = {
+                "name": span["path"] if span["kind"] == "node" else span["name"],
+                "kind": span["kind"],
+                "start_ms": round((span["start"] - self._origin) * 1000, 1),
+                "duration_ms": round((span["end"] - span["start"]) * 1000, 1),
+                "status": span["status"],
+                "children": [],
+            }
+            for key in ("model", "prompt_tokens", "completion_tokens", "cached_tokens", "error", "attempt"):
+                if span.get(key):
+                    entry[key] = span[key]
+            nodes[span["id"]] = entry
+        roots = []
+        for span in spans:
+            parent = str(span["parent"]) if span["parent"] is not None else None
+            (nodes[parent]["children"] if parent in known else roots).append(nodes[span["id"]])
+        return roots
+
+    def _tracks(self, spans: List[Dict[str, Any]]) -> Tuple[Dict[str, int], Dict[int, str]]:
+        """
+        span -> 트랙(tid) 배정. 형제 span끼리 시간이 겹치면(병렬 분기) 새 트랙을 쓰고,
+        겹치지 않으면 부모 트랙을 이어 씁니다. 같은 트랙 안에서는 항상 올바르게 중첩되므로 flame 형태로 보입니다.
+        """
+        known = {s["id"] for s in spans}
+        children: Dict[Optional[str], List[Dict[str, Any]]] = defaultdict(list)
+        for span in spans:
+            parent = str(span["parent"]) if span["parent"] is not None else None
+            children[parent if parent in known else None].append(span)
+        track_of: Dict[str, int] = {}
+        names = {1: MAIN_GRAPH}
+
+        def assign(parent_id: Optional[str], parent_track: int):
+            slots: List[List[float]] = []  # [트랙, 마지막 span 종료 시각]
+            for child in sorted(children.get(parent_id, []), key=lambda s: s["start"]):
+                slot = next((slot for slot in slots if slot[1] <= child["start"]), None)
+                if slot is None:
+                    track = parent_track if not slots else len(names) + 1
+                    names.setdefault(track, child["path"] if child["kind"] == "node" else child["name"])
+                    slot = [track, child["end"]]
+                    slots.append(slot)
+                slot[1] = max(slot[1], child["end"])
+                track_of[child["id"]] = int(slot[0])
+                assign(child["id"], int(slot[0]))
+
+        assign(None, 1)
+        return track_of, names
+
+    def chrome_trace(self, run_id: str = "") -> Dict[str, Any]:
+        """
+        Chrome/Perfetto trace-event JSON (chrome://tracing, ui.perfetto.dev에서 열기).
+        supervisor 홉, 서브그래프 노드, LLM/검색 호출, 파일 쓰기가 complete 이벤트('X')로 들어가며 병렬 분기는 별도 트랙입니다.
+        """
+        spans = self._finished()
+        track_of, names = self._tracks(spans)
+        events: List[Dict[str, Any]] = [
+            {"name": "process_name", "ph": "M", "pid": 1, "tid": 0, "args": {"name": f"run {run_id}".strip()}},
+        ]
+        for tid, name in sorted(names.items()):
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}})
+            events.append({"name": "thread_sort_index", "ph": "M", "pid": 1, "tid": tid, "args": {"sort_index": tid}})
+        for span in spans:
+            args = {k: span[k] for k in ("model", "prompt_tokens", "completion_tokens", "cached_tokens", "error", "attempt")
+                    if span.get(k)}
+            events.append({
+                "name": span["path"] if span["kind"] == "node" else span["name"],
+                "cat": span["kind"],
+                "ph": "X",
+                "ts": round((span["start"] - self._origin) * 1e6),
+                "dur": max(1, round((span["end"] - span["start"]) * 1e6)),
+                "pid": 1,
+                "tid": track_of[span["id"]],
+                "args": {"status": span["status"], **args},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"run_id": run_id}}
@@ -0,0 +1,293 @@
+import ast
+import io
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import tokenize
+from typing import List
+
+try:
+    import resource  # POSIX 전용 (Windows에서는 자원 한도 없이 실행)
+except ImportError:
+    resource = None
+
+# --- 검증 설정 ---
+CODE_MIN_COMMENT_RATIO = float(os.getenv("CODE_MIN_COMMENT_RATIO", "0.1"))
+# 생성된 코드를 API 서버에서 직접 실행해 보는 검사. 보안 샌드박스가 아니므로 신뢰할 수 있는 격리 환경(전용 컨테이너 등)에서만 켤 것
+CODE_LOCAL_EXEC = os.getenv("CODE_LOCAL_EXEC", "0") == "1"
+CODE_LOCAL_EXEC_TIMEOUT = float(os.getenv("CODE_LOCAL_EXEC_TIMEOUT", "5"))
+CODE_LOCAL_EXEC_MEMORY_MB = int(os.getenv("CODE_LOCAL_EXEC_MEMORY_MB", "512"))
+
+_FENCE = re.compile(r"```[\w-]*\s*\n(.*?)```", re.DOTALL)
+
+
+def strip_code_fence(text: str) -> str:
+    """마크다운 코드 블록(```python / ```mermaid)이 있으면 안쪽 코드만 꺼냅니다."""
+    match = _FENCE.search(text or "")
+    return (match.group(1) if match else (text or "")).strip()
+
+
+# ==========================================
+# Python 코드 검증
+# ==========================================
+def _comment_ratio(code: str) -> float:
+    """주석 줄(# 주석 + docstring) / 실제 코드 줄 비율 (줄 끝 인라인 주석이 달린 줄도 코드 줄로 셈)"""
+    comment_lines = set()
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(code).readline):
+            if tok.type == tokenize.COMMENT:
+                comment_lines.add(tok.start[0])
+    except (tokenize.TokenError, IndentationError):
+        pass
+
+    doc_lines = set()
+    for node in ast.walk(ast.parse(code)):
+        if isinstance(node, (ast.Module, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            if ast.get_docstring(node) and node.body:
+                doc = node.body[0]
+                doc_lines.update(range(doc.lineno, doc.end_lineno + 1))
+    comment_lines |= doc_lines
+
+    lines = code.splitlines()
+    code_lines = [
+        i for i, line in enumerate(lines, start=1)
+        if line.strip() and not line.strip().startswith("#") and i not in doc_lines
+    ]
+    if not code_lines:
+        return 0.0
+    return len(comment_lines) / len(code_lines)
+
+
+# 실행 전에 소켓 연결/바인드와 이름 조회를 막는 부트스트랩 (asyncio 내부 socketpair는 허용) (네트워크를 쓰는 예제는 검증 불가로 보고 통과)
+_NETWORK_BLOCKED = "네트워크 사용이 차단된 실행입니다"
+_BOOTSTRAP = (
+    "import runpy, socket, sys\n"
+    "def _blocked(*args, **kwargs):\n"
+    f"    raise OSError({_NETWORK_BLOCKED!r})\n"
+    "for name in ('connect', 'connect_ex', 'bind', 'sendto'):\n"
+    "    setattr(socket.socket, name, _blocked)\n"
+    "socket.create_connection = socket.getaddrinfo = _blocked\n"
+    "runpy.run_path(sys.argv[1], run_name='__main__')\n"
+)
+
+
+def _limit_resources(timeout: float, memory_mb: int):
+    """자식 프로세스의 CPU 시간/메모리/파일 크기/코어 덤프 한도 (preexec_fn)"""
+    def apply():
+        cpu = max(1, int(timeout) + 1)
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+        resource.setrlimit(resource.RLIMIT_AS, (memory_mb * 1024 * 1024,) * 2)
+        resource.setrlimit(resource.RLIMIT_FSIZE, (10 * 1024 * 1024,) * 2)
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    return apply
+
+
+def _run_locally(code: str, timeout: float, memory_mb: int = CODE_LOCAL_EXEC_MEMORY_MB) -> List[str]:
+    """
+    생성된 코드를 별도 프로세스에서 실행해 보고 문제 목록을 반환합니다.
+    보안 샌드박스가 아닙니다: 자원 한도(rlimit), 임시 작업 디렉터리, 빈 환경 변수, 소켓 차단은 실수를 막을 뿐
+    의도적으로 우회하는 코드(ctypes, 절대 경로 파일 접근 등)는 막지 못합니다.
+    외부 패키지 미설치/네트워크 사용은 실패로 보지 않고, 시간 초과와 자원 한도 초과는 실패로 봅니다.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "snippet.py")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(code)
+        try:
+            proc = subprocess.run(
+                [sys.executable, "-I", "-c", _BOOTSTRAP, path],
+                cwd=workdir,
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+                env={"PATH": os.environ.get("PATH", ""), "HOME": workdir, "TMPDIR": workdir},
+                preexec_fn=_limit_resources(timeout, memory_mb) if resource is not None else None,
+            )
+        except subprocess.TimeoutExpired:
+            return [f"실행 시간 초과 ({timeout:g}초): 무한 루프나 입력/서버 대기 없이 끝나는 예제로 작성하세요."]
+
+    if proc.returncode == 0:
+        return []
+    if proc.returncode < 0:
+        return [f"실행 중 강제 종료 (신호 {-proc.returncode}, CPU/메모리 한도 초과 가능)"]
+    last_line = (proc.stderr.strip().splitlines() or ["알 수 없는 오류"])[-1]
+    if last_line.startswith(("ModuleNotFoundError", "ImportError")) or _NETWORK_BLOCKED in last_line:
+        return []
+    if last_line.startswith("MemoryError"):
+        return [f"실행 중 메모리 한도({memory_mb}MB) 초과"]
+    return [f"실행 오류: {last_line}"]
+
+
+def validate_python(code: str, min_comment_ratio: float = None, execute: bool = None) -> List[str]:
+    """
+    생성된 Python 코드를 로컬에서 검증하고 문제 목록을 반환합니다. (빈 리스트 = 통과)
+    1. ast 파싱으로 문법 오류 확인
+    2. 주석 밀도 확인
+    3. (선택, CODE_LOCAL_EXEC=1) 로컬 실행 - 보안 샌드박스가 아님 (_run_locally 참고)
+    """
+    min_comment_ratio = CODE_MIN_COMMENT_RATIO if min_comment_ratio is None else min_comment_ratio
+    execute = CODE_LOCAL_EXEC if execute is None else execute
+    code = strip_code_fence(code)
+
+    if not code:
+        return ["코드가 비어 있습니다."]
+
+    try:
+        ast.parse(code)
+    except SyntaxError as e:
+        return [f"문법 오류(Syntax Error) {e.lineno}행: {e.msg}"]
+
+    issues = []
+    ratio = _comment_ratio(code)
+    if ratio < min_comment_ratio:
+        issues.append(f"주석이 부족합니다 (주석 비율 {ratio:.2f} < {min_comment_ratio:.2f}). 주요 로직마다 설명 주석을 추가하세요.")
+
+    if execute:
+        issues.extend(_run_locally(code, CODE_LOCAL_EXEC_TIMEOUT))
+
+    return issues
+
+
+# ==========================================
+# Mermaid 다이어그램 검증
+# ==========================================
+_FLOWCHART_HEADER = re.compile(r"^(graph|flowchart)(\s+(TB|TD|BT|RL|LR))?\s*;?$")
+_OTHER_HEADERS = (
+    "classDiagram", "stateDiagram", "stateDiagram-v2", "erDiagram", "gantt", "pie", "journey",
+    "mindmap", "timeline", "gitGraph", "quadrantChart", "requirementDiagram", "xychart-beta",
+)
+_BRACKETS = {")": "(", "]": "[", "}": "{"}
+
+# flowchart
+_FLOW_DIRECTIVES = re.compile(r"^(subgraph\b|end$|direction\s+(TB|TD|BT|RL|LR)$|classDef\s|class\s|style\s|linkStyle\s|click\s)")
+_FLOW_EDGE = re.compile(r"\s*<?(?:-{2,}|-\.+-|={2,}|~{3})[>ox]?\s*")
+_FLOW_NODE_GROUP = re.compile(r"^\w+(\s*&\s*\w+)*$")
+_FLOW_ASYMMETRIC_NODE = re.compile(r"(\w)>[^\[\]]*\]")  # 비대칭 노드 A>text]
+# 라벨이 가운데 있는 링크: A -- text --> B, A == text ==> B, A -. text .-> B (화살표 없는 ---/===/.- 포함)
+_FLOW_LABELLED_EDGE = re.compile(r"(?<![-=.<])(--|==|-\.)(?![-=.>])\s*[^-=.>|]+?\s*(?:-{2,}|={2,}|\.-+)([>ox]?)")
+
+# sequenceDiagram
+_SEQ_BLOCK_START = re.compile(r"^(loop|alt|opt|par|critical|break|rect|box)\b")
+_SEQ_BLOCK_MIDDLE = re.compile(r"^(else|and|option)\b")
+_SEQ_STATEMENT = re.compile(
+    r"^(autonumber\b.*|title\b.*|(participant|actor)\s+\S.*|(activate|deactivate)\s+\S+"
+    r"|note\s+(left of|right of|over)\s+[^:]+:.*|(create|destroy)\s+(participant|actor)?\s*\S+)$",
+    re.IGNORECASE,
+)
+_SEQ_MESSAGE = re.compile(r"^[^\s:]+?\s*(-->>|->>|-->|->|--x|-x|--\)|-\))[+-]?\s*[^\s:][^:]*:.*$")
+
+
+def _check_brackets(line: str) -> str:
+    """따옴표 밖의 괄호 짝을 확인합니다. 문제가 있으면 설명 문자열, 없으면 빈 문자열."""
+    stack, in_quote = [], False
+    for ch in line:
+        if ch == '"':
+            in_quote = not in_quote
+        elif in_quote:
+            continue
+        elif ch in "([{":
+            stack.append(ch)
+        elif ch in _BRACKETS:
+            if not stack or stack.pop() != _BRACKETS[ch]:
+                return f"괄호 '{ch}'의 짝이 맞지 않습니다"
+    if in_quote:
+        return "따옴표가 닫히지 않았습니다"
+    if stack:
+        return f"괄호 '{stack[-1]}'가 닫히지 않았습니다"
+    return ""
+
+
+def _flowchart_skeleton(line: str) -> str:
+    """노드 모양/라벨/클래스 표기를 제거해 'ID --> ID' 형태의 뼈대만 남깁니다."""
+    line = re.sub(r'"[^"]*"', "", line)
+    line = re.sub(r":::\w+", "", line)
+    previous = None
+    while previous != line:
+        previous = line
+        line = re.sub(r"[\[\(\{][^\[\]\(\)\{\}]*[\]\)\}]", "", line)
+    line = re.sub(r"\|[^|]*\|", "", line)  # 엣지 라벨 -->|text|
+    line = _FLOW_LABELLED_EDGE.sub(lambda m: f" ---{m.group(2)} ", line)  # 라벨을 뺀 일반 링크로
+    return line.strip().rstrip(";").strip()
+
+
+def _validate_flowchart(lines) -> List[str]:
+    issues, depth = [], 0
+    for lineno, line in lines:
+        if line.startswith("subgraph"):
+            depth += 1
+            continue
+        if line == "end":
+            depth -= 1
+            if depth < 0:
+                issues.append(f"{lineno}행: 짝이 없는 'end'")
+                depth = 0
+            continue
+        if _FLOW_DIRECTIVES.match(line):
+            continue
+
+        normalized = _FLOW_ASYMMETRIC_NODE.sub(r"\1", line)
+        problem = _check_brackets(normalized)
+        if problem:
+            issues.append(f"{lineno}행: {problem} -> {line}")
+            continue
+
+        for statement in filter(None, (s.strip() for s in _flowchart_skeleton(normalized).split(";"))):
+            groups = _FLOW_EDGE.split(statement)
+            if not all(_FLOW_NODE_GROUP.match(g.strip()) for g in groups):
+                issues.append(f"{lineno}행: 노드/화살표 문법 오류 -> {line}")
+                break
+
+    if depth > 0:
+        issues.append(f"'subgraph' {depth}개가 'end'로 닫히지 않았습니다")
+    return issues
+
+
+def _validate_sequence(lines) -> List[str]:
+    issues, depth = [], 0
+    for lineno, line in lines:
+        if _SEQ_BLOCK_START.match(line):
+            depth += 1
+        elif line == "end":
+            depth -= 1
+            if depth < 0:
+                issues.append(f"{lineno}행: 짝이 없는 'end'")
+                depth = 0
+        elif _SEQ_BLOCK_MIDDLE.match(line):
+            if depth == 0:
+                issues.append(f"{lineno}행: 블록 밖에서 사용된 '{line.split()[0]}'")
+        elif not (_SEQ_STATEMENT.match(line) or _SEQ_MESSAGE.match(line)):
+            issues.append(f"{lineno}행: 알 수 없는 시퀀스 문법 (메시지는 'A->>B: 내용' 형식) -> {line}")
+
+    if depth > 0:
+        issues.append(f"블록(loop/alt/opt 등) {depth}개가 'end'로 닫히지 않았습니다")
+    return issues
+
+
+def validate_mermaid(text: str) -> List[str]:
+    """
+    Mermaid 코드를 로컬에서 파싱하여 문법 문제 목록을 반환합니다. (빈 리스트 = 통과)
+    flowchart/graph와 sequenceDiagram은 줄 단위 문법까지, 그 외 유형은 헤더와 괄호 짝만 확인합니다.
+    """
+    code = strip_code_fence(text)
+    lines = [
+        (i, line.strip()) for i, line in enumerate(code.splitlines(), start=1)
+        if line.strip() and not line.strip().startswith("%%")
+    ]
+    if not lines:
+        return ["다이어그램 코드가 비어 있습니다."]
+
+    (header_no, header), body = lines[0], lines[1:]
+
+    if _FLOWCHART_HEADER.match(header):
+        return _validate_flowchart(body)
+    if header == "sequenceDiagram":
+        return _validate_sequence(body)
+    if header.split()[0] in _OTHER_HEADERS:
+        # 클래스/상태 블록은 여러 줄에 걸치므로 본문 전체 기준으로 괄호 짝만 확인
+        problem = _check_brackets("\n".join(line for _, line in body))
+        return [problem] if problem else []
+
+    return [f"{header_no}행: 알 수 없는 다이어그램 유형 '{header}' (graph TD / sequenceDiagram 등으로 시작해야 합니다)"]
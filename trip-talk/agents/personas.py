@@ -1,4 +1,4 @@
-from langchain_openai import ChatOpenAI
+from model_registry import models
 from langchain_core.prompts import ChatPromptTemplate
 from state import TripTalkerState
 
@@ -39,7 +39,7 @@ def clerk_node(state: TripTalkerState):
     {context_str}
     """
     
-    llm = ChatOpenAI(model="gpt-5-mini", temperature=0.7)
+    llm = models.for_node("clerk", temperature=0.7)
     prompt = ChatPromptTemplate.from_messages([
         ("system", system_prompt),
         ("placeholder", "{messages}")
@@ -62,7 +62,7 @@ def tutor_node(state: TripTalkerState):
     Use the context if relevant (e.g., explaining items on the menu).
     """
     
-    llm = ChatOpenAI(model="gpt-5-mini", temperature=0.5)
+    llm = models.for_node("tutor", temperature=0.5)
     prompt = ChatPromptTemplate.from_messages([
         ("system", system_prompt),
         ("placeholder", "{messages}")
@@ -1,9 +1,11 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
 from typing import Literal
 
 from state import TripTalkerState
+import common_path  # noqa: F401 (llm_common)
+from llm_common.hedging import hedged
+from model_registry import models
 
 class RouteQuery(BaseModel):
     """사용자 질문을 가장 관련성 높은 노드로 라우팅합니다."""
@@ -19,10 +21,7 @@ def router_node(state: TripTalkerState):
     messages = state["messages"]
     last_message = messages[-1]
     
-    # 구조화된 출력을 사용하는 LLM을 이용한 단순 라우터
-    llm = ChatOpenAI(model="gpt-5-mini", temperature=0)
-    structured_llm = llm.with_structured_output(RouteQuery)
-    
+    # 구조화된 출력을 사용하는 LLM을 이용한 단순 라우터 (저렴한 티어부터, 파싱 실패 시 상위 티어)
     system = """You are a router agent for a language learning app.
     Your job is to determine if the user's message is:
     1. A 'role-play' line (e.g., "I would like a coffee", "How much is this?"). They are talking TO the character in the scenario. -> Route to 'clerk'
@@ -38,12 +37,17 @@ def router_node(state: TripTalkerState):
         ("human", "{question}")
     ])
     
-    chain = prompt | structured_llm
-    
-    result = chain.invoke({
+    inputs = {
         "question": last_message.content, 
         "location": state.get("location", "General"),
         "situation": state.get("situation", "General")
-    })
+    }
+    
+    # 짧은 분류 호출: 응답이 늦으면 헤징 (LLM_HEDGING=1)
+    result = models.invoke(
+        "router",
+        lambda llm: hedged("router", (prompt | llm.with_structured_output(RouteQuery)).invoke, inputs),
+        lambda r: isinstance(r, RouteQuery),
+    )
     
     return {"user_intent": result.target, "current_persona": result.target}
@@ -1,16 +1,33 @@
 import gradio as gr
 import os
+import time
 from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage, AIMessage
 
 from chains.guide_chain import generate_guide
 from graph import build_graph
+import common_path  # noqa: F401 (llm_common)
+from llm_common.hedging import hedge_report
+from llm_common.lazy_init import Lazy
+from llm_common.profiling import RunProfiler
+from model_registry import models
 
 # 환경 변수 로드
 load_dotenv()
 
-# 전역 그래프 인스턴스 (상태 비저장 로직, 상태는 세션별로 전달됨)
-app_graph = build_graph()
+# 1이면 가이드 생성/대화 응답마다 샘플링 CPU 프로파일 + tracemalloc 할당 스냅샷을 PROFILE_DIR 아래에 저장
+PROFILE_RUNS = os.getenv("PROFILE_RUNS", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# 전역 그래프 인스턴스 (상태 비저장 로직, 상태는 세션별로 전달됨) - 첫 메시지 때 컴파일
+app_graph = Lazy(build_graph, "app_graph")
+
+def save_profile(profiler, label):
+    """프로파일을 PROFILE_DIR/<시각>_<label>에 저장하고 요약을 출력합니다."""
+    if profiler is None:
+        return
+    summary = profiler.dump(os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}_{label}"))
+    print(f"🔬 Profile: {summary['directory']} (cpu {summary['cpu_seconds']}s / wall {summary['wall_seconds']}s)")
 
 async def generate_context(loc, sit):
     """가이드를 생성하고 세션 상태 컨텍스트를 초기화합니다."""
@@ -19,6 +36,7 @@ async def generate_context(loc, sit):
         return err, {}, {}, {}, {}
     
     print(f"Generating guide for {loc} - {sit}...")
+    profiler = RunProfiler().start() if PROFILE_RUNS else None
     try:
         # 비동기 함수 호출
         context_data = await generate_guide(loc, sit)
@@ -26,6 +44,8 @@ async def generate_context(loc, sit):
         print(f"Error in generate_guide: {e}")
         err = {"error": f"Error generating guide: {str(e)}"}
         return err, {}, {}, {}, {}
+    finally:
+        save_profile(profiler, "guide")
     
     guide_data = context_data.get("guide", {})
     
@@ -91,9 +111,13 @@ async def chat_response(message, history, context, loc, sit):
     history.append({"role": "user", "content": message})
     yield history, ""
     
+    profiler = RunProfiler().start() if PROFILE_RUNS else None
     try:
         # 비동기 그래프 호출
-        result = await app_graph.ainvoke(inputs)
+        try:
+            result = await app_graph.get().ainvoke(inputs)
+        finally:
+            save_profile(profiler, "chat")
         full_response = result["messages"][-1].content
         
         # 스트리밍 시뮬레이션 (한 글자씩 출력)
@@ -107,9 +131,12 @@ async def chat_response(message, history, context, loc, sit):
         history.append({"role": "assistant", "content": error_msg})
         yield history, ""
 
-# Google Places 도구 초기화
-from tools.google_places import GooglePlacesTool
-place_tool = GooglePlacesTool()
+# Google Places 도구 초기화 (첫 검색 때 생성)
+def _create_place_tool():
+    from tools.google_places import GooglePlacesTool
+    return GooglePlacesTool()
+
+place_tool = Lazy(_create_place_tool, "place_tool")
 
 def update_suggestions(query):
     """검색어 변경 시 장소 추천 목록 업데이트"""
@@ -117,7 +144,7 @@ def update_suggestions(query):
         return gr.update(choices=[], visible=False)
     
     try:
-        results = place_tool.search_places(query)
+        results = place_tool.get().search_places(query)
         # Dropdown choices: ["Main Text (Full Text)", ...]
         choices = [f"{item['main_text']} ({item['description']})" for item in results]
         return gr.update(choices=choices, visible=True)
@@ -189,6 +216,13 @@ with gr.Blocks(title="TripTalker", theme=gr.themes.Soft()) as demo:
             msg_input = gr.Textbox(label="메시지 입력", placeholder="여기에 입력하세요... (엔터로 전송)")
             clear = gr.Button("대화 지우기")
 
+            # 서버 지표 (버튼을 누를 때만 조회, Gradio API로도 호출 가능: api_name)
+            with gr.Accordion("📊 서버 지표", open=False):
+                metrics_output = gr.JSON(label="지표")
+                with gr.Row():
+                    btn_hedging = gr.Button("헤징")
+                    btn_models = gr.Button("모델 티어")
+
     # 이벤트 연결
     btn_start.click(
         generate_context,
@@ -202,5 +236,10 @@ with gr.Blocks(title="TripTalker", theme=gr.themes.Soft()) as demo:
         outputs=[chatbot, msg_input]
     )
 
+    # 헤지 발동 비율 / p99 개선폭
+    btn_hedging.click(hedge_report, outputs=metrics_output, api_name="hedging")
+    # 티어별 호출 수 / 지연 시간 / 토큰 / 에스컬레이션 비율
+    btn_models.click(models.report, outputs=metrics_output, api_name="models")
+
 if __name__ == "__main__":
     demo.launch()
@@ -1,10 +1,13 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from pydantic import BaseModel, Field
 from typing import List
 
 from tools.tavily_search import TripSearchTool
+import common_path  # noqa: F401 (llm_common)
+from llm_common.hedging import ahedged
+from llm_common.lazy_init import Lazy
+from model_registry import models
 
 class GuideOutput(BaseModel):
     speaking_expressions: List[str] = Field(description="여행자가 말할 5가지 핵심 표현 (타겟 언어 - 발음 - 한국어 의미)")
@@ -12,12 +15,14 @@ class GuideOutput(BaseModel):
     focused_vocabulary: List[str] = Field(description="해당 장소/상황의 주요 단어 및 추천 항목 (메뉴 포함) 5~7개")
     conversation_flow: List[str] = Field(description="표준 대화 흐름 (단계별)")
 
-from database.supabase_client import GuideCache
+def _create_guide_cache():
+    # supabase / langchain_community import와 클라이언트 생성은 첫 가이드 요청 때 한 번만
+    from database.supabase_client import GuideCache
+    return GuideCache()
 
-# 전역 캐시 인스턴스
-guide_cache = GuideCache()
+# 전역 캐시 인스턴스 (첫 사용 시 생성)
+guide_cache = Lazy(_create_guide_cache, "guide_cache")
 
-from langchain_community.document_loaders import YoutubeLoader
 import re
 import asyncio
 
@@ -48,6 +53,7 @@ async def fetch_youtube_context(query: str) -> str:
         
         for vid in video_ids:
             try:
+                from langchain_community.document_loaders import YoutubeLoader
                 # YoutubeLoader 초기화 (한국어 -> 영어 순)
                 loader = YoutubeLoader.from_youtube_url(
                     f"https://www.youtube.com/watch?v={vid}",
@@ -78,7 +84,7 @@ class SearchQuery(BaseModel):
 
 async def generate_guide(location: str, situation: str):
     # 0. 캐시 확인 (0.5초 컷)
-    cached_guide = await guide_cache.search_guide(location, situation)
+    cached_guide = await guide_cache.get().search_guide(location, situation)
     if cached_guide:
         return {
             "guide": cached_guide,
@@ -92,7 +98,6 @@ async def generate_guide(location: str, situation: str):
     # -> Specific: "tokyo disneyland entrance convenience store snack price"
     # -> General: "Japanese convenience store buying snacks vlog" (브랜드/업종 추출)
     
-    refiner_llm = ChatOpenAI(model="gpt-5-mini", temperature=0)
     refiner_parser = JsonOutputParser(pydantic_object=SearchQuery)
     
     refiner_prompt = ChatPromptTemplate.from_messages([
@@ -112,15 +117,20 @@ async def generate_guide(location: str, situation: str):
         """)
     ])
     
-    refiner_chain = refiner_prompt | refiner_llm | refiner_parser
+    refiner_inputs = {
+        "location": location,
+        "situation": situation,
+        "format_instructions": refiner_parser.get_format_instructions()
+    }
     
     try:
-        # 검색어 생성 (빠른 응답을 위해 gpt-5-mini 사용)
-        query_result = await refiner_chain.ainvoke({
-            "location": location,
-            "situation": situation,
-            "format_instructions": refiner_parser.get_format_instructions()
-        })
+        # 검색어 생성 (빠른 응답을 위해 저렴한 티어부터, 두 검색어가 모두 나오지 않으면 상위 티어)
+        query_result = await models.ainvoke(
+            "guide_refiner",
+            lambda llm: ahedged("guide_refiner", (refiner_prompt | llm | refiner_parser).ainvoke, refiner_inputs),
+            lambda r: isinstance(r, dict) and bool(r.get("specific_query")) and bool(r.get("general_query")),
+            temperature=0,
+        )
         specific_query = query_result.get("specific_query", f"{location} {situation} menu price")
         general_query = query_result.get("general_query", f"{location} ordering vlog")
         
@@ -151,7 +161,7 @@ async def generate_guide(location: str, situation: str):
     """
     
     # 3. 가이드 생성
-    llm = ChatOpenAI(model="gpt-5-mini", temperature=0)
+    llm = models.for_node("guide_generator", temperature=0)
     parser = JsonOutputParser(pydantic_object=GuideOutput)
     
     prompt = ChatPromptTemplate.from_messages([
@@ -193,7 +203,7 @@ async def generate_guide(location: str, situation: str):
         
         # 4. 캐시 저장 (비동기로 수행하여 사용자 응답 속도 저하 최소화)
         # await save_guide(...) waits here. Ideally use create_task but to ensure save use await.
-        await guide_cache.save_guide(location, situation, guide)
+        await guide_cache.get().save_guide(location, situation, guide)
         
     except Exception as e:
         # 검색 실패 또는 키 누락 시 대체
@@ -0,0 +1,10 @@
+"""
+저장소 루트의 공용 패키지(llm_common)를 import할 수 있도록 sys.path에 추가합니다.
+llm_common을 쓰는 모듈은 이 모듈을 먼저 import합니다. (my-rag-service와 같은 코드를 설치 없이 공유)
+"""
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
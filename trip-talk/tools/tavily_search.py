@@ -2,6 +2,9 @@ from langchain_community.utilities.tavily_search import TavilySearchAPIWrapper
 from langchain_community.tools.tavily_search import TavilySearchResults
 import os
 
+import common_path  # noqa: F401 (llm_common)
+from llm_common.rate_limiter import search_limiter
+
 class TripSearchTool:
     def __init__(self, k=5):
         # 1. API 래퍼는 기본 설정만
@@ -21,6 +24,7 @@ class TripSearchTool:
 
     def search_place(self, query: str):
         try:
+            search_limiter.acquire() # 공용 검색 리미터 (RPM)
             results = self.tool.invoke({"query": query})
             
             # 결과 아이템에 포함된 이미지 URL들을 수집합니다.
@@ -41,6 +45,7 @@ class TripSearchTool:
     async def search_place_async(self, query: str):
         try:
             # 비동기 실행을 위해 ainvoke 사용
+            await search_limiter.aacquire()
             results = await self.tool.ainvoke({"query": query})
             
             all_images = []